@@ -1,7 +1,7 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from src.routers.langgraph_chat import router as langgraph_chat_router
-from src.routers import health
+from src.routers import health, metrics
 from src.routers.reader_cccd import router as reader_router
 from src.routers.ct01 import router as ct01_router
 from src.routers.voice_router import router as voice_router
@@ -19,6 +19,7 @@ app.add_middleware(
 
 app.include_router(langgraph_chat_router)
 app.include_router(health.router)
+app.include_router(metrics.router)
 app.include_router(reader_router)
 app.include_router(ct01_router)
 app.include_router(voice_router)
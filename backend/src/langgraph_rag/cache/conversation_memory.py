@@ -0,0 +1,117 @@
+import asyncio
+import threading
+from typing import Any, Dict, List, Optional, Set
+
+from ..utils.config_utils import BaseConfig
+from ..utils.logger_utils import get_logger
+from .session_store import SUMMARY_PREFIX, SessionStore, split_summary
+
+logger = get_logger(__name__)
+
+
+class ConversationMemory:
+    """
+    Bộ nhớ hội thoại theo session ở chế độ "summary":
+    khi số message nguyên văn vượt `keep_turns + every_turns` lượt, các lượt cũ được gộp vào
+    một bản tóm tắt (message role "system" đứng đầu lịch sử), chỉ giữ `keep_turns` lượt cuối nguyên văn.
+    Việc tóm tắt chạy nền sau khi câu trả lời đã được trả về; request sau đọc lịch sử đã nén từ SessionStore.
+    Chế độ "window" giữ nguyên hành vi cũ (tối đa MAX_HISTORY message).
+    """
+
+    def __init__(self, global_config: BaseConfig, session_store: SessionStore, summarizer: Any = None) -> None:
+        self.mode = (global_config.session_memory_mode or "window").lower()
+        self.keep_messages = 2 * max(1, int(global_config.session_summary_keep_turns))
+        self.every_messages = 2 * max(1, int(global_config.session_summary_every_turns))
+        self.session_store = session_store
+        self.summarizer = summarizer
+
+        self._pending: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self._lock = threading.Lock()
+        self.stats_counters = {"summaries": 0, "failures": 0, "skipped": 0, "summary_tokens": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode == "summary" and self.summarizer is not None and self.session_store.enabled
+
+    def needs_summary(self, history: List[Dict[str, Any]]) -> bool:
+        _, messages = split_summary(history)
+        return len(messages) >= self.keep_messages + self.every_messages
+
+    def maybe_summarize(self, session_id: Optional[str], history: List[Dict[str, Any]]) -> None:
+        """Lên lịch tóm tắt nền cho session (mỗi session tối đa một lần tóm tắt đang chạy)."""
+        if not self.enabled or not session_id or not self.needs_summary(history):
+            return
+        with self._lock:
+            if session_id in self._pending:
+                return
+            self._pending.add(session_id)
+        snapshot = list(history)
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if loop is not None:
+            task = loop.create_task(self._asummarize(session_id, snapshot))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        else:
+            threading.Thread(target=self._summarize, args=(session_id, snapshot), name="conversation-summary", daemon=True).start()
+
+    def _split(self, snapshot: List[Dict[str, Any]]):
+        summary, messages = split_summary(snapshot)
+        old = messages[:len(messages) - self.keep_messages]
+        return summary, old
+
+    async def _asummarize(self, session_id: str, snapshot: List[Dict[str, Any]]) -> None:
+        try:
+            summary, old = self._split(snapshot)
+            text, tokens = await self.summarizer.asummarize(summary, old)
+            self._apply(session_id, snapshot, text, tokens)
+        except Exception as e:
+            self._failed(session_id, e)
+        finally:
+            with self._lock:
+                self._pending.discard(session_id)
+
+    def _summarize(self, session_id: str, snapshot: List[Dict[str, Any]]) -> None:
+        try:
+            summary, old = self._split(snapshot)
+            text, tokens = self.summarizer.summarize(summary, old)
+            self._apply(session_id, snapshot, text, tokens)
+        except Exception as e:
+            self._failed(session_id, e)
+        finally:
+            with self._lock:
+                self._pending.discard(session_id)
+
+    def _failed(self, session_id: str, error: Exception) -> None:
+        with self._lock:
+            self.stats_counters["failures"] += 1
+        logger.warning(f"[ConversationMemory] Summary for session {session_id} failed, keeping raw history: {error}")
+
+    def _apply(self, session_id: str, snapshot: List[Dict[str, Any]], text: str, tokens: int) -> None:
+        if not text:
+            raise ValueError("empty summary")
+        folded = len(snapshot) - self.keep_messages
+        current = self.session_store.get(session_id)
+        # session đã bị xoá / bị ghi đè bởi lịch sử khác trong lúc tóm tắt -> bỏ qua
+        if current[:folded] != snapshot[:folded]:
+            with self._lock:
+                self.stats_counters["skipped"] += 1
+            return
+        compressed = [{"role": "system", "content": SUMMARY_PREFIX + text}] + current[folded:]
+        self.session_store.save(session_id, compressed)
+        with self._lock:
+            self.stats_counters["summaries"] += 1
+            self.stats_counters["summary_tokens"] += tokens
+        logger.info(f"[ConversationMemory] Session {session_id}: folded {folded} messages into summary")
+
+    async def wait_idle(self) -> None:
+        """Chờ mọi tác vụ tóm tắt nền đang chạy (dùng cho benchmark / shutdown)."""
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"mode": self.mode, "pending": len(self._pending), **self.stats_counters}
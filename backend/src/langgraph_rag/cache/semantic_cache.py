@@ -0,0 +1,224 @@
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from ..utils.config_utils import BaseConfig
+from ..utils.logger_utils import get_logger
+
+logger = get_logger(__name__)
+
+
+class SemanticCache:
+    """
+    Cache câu trả lời theo ngữ nghĩa: embedding câu hỏi -> câu trả lời đã qua guardrail đầu ra.
+    - Chỉ mục vector nằm trong process (ma trận numpy đã chuẩn hoá, cosine = dot product).
+    - TTL cho từng entry, giới hạn số entry (đẩy ra theo LRU), đếm hit / miss.
+    - Backend lưu trữ tuỳ chọn: "redis" hoặc "qdrant", đều write-through + nạp lại khi khởi động.
+      Tra cứu chỉ đọc chỉ mục local (không round-trip mạng trên đường miss).
+    - Qdrant không tự hết hạn điểm: xoá các điểm có expires_at <= now lúc khởi động
+      và định kỳ (`qdrant_purge_interval_seconds`) sau khi ghi.
+    """
+
+    def __init__(self, global_config: BaseConfig, database: Any = None) -> None:
+        self.global_config = global_config
+        self.enabled = global_config.semantic_cache_enabled
+        self.threshold = float(global_config.semantic_cache_threshold)
+        self.ttl_seconds = int(global_config.semantic_cache_ttl_seconds)
+        self.max_entries = max(1, int(global_config.semantic_cache_max_entries))
+        self.backend = (global_config.semantic_cache_backend or "none").lower()
+        self.collection_name = global_config.semantic_cache_collection
+        self.purge_interval_s = max(0, int(global_config.semantic_cache_qdrant_purge_interval_seconds))
+
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._ids: List[str] = []
+        self._matrix: Optional[np.ndarray] = None
+        self._dirty = True
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+        self._redis = None
+        self._database = None
+        self._collection_ready = False
+        self._last_remote_purge = 0.0
+        self._purging = threading.Lock()
+        if self.enabled:
+            self._init_backend(database)
+
+    def _init_backend(self, database: Any) -> None:
+        if self.backend == "redis":
+            try:
+                from .cache_redis import CacheRedis
+                redis_cache = CacheRedis(global_config=self.global_config)
+                if redis_cache.available:
+                    self._redis = redis_cache
+                    self._load_from_redis()
+            except Exception as e:
+                logger.warning(f"[SemanticCache] Redis backend unavailable, using in-process only: {e}")
+        elif self.backend == "qdrant":
+            self._database = database
+            if self._database is None:
+                logger.warning("[SemanticCache] Qdrant backend requested without a database, using in-process only")
+                return
+            try:
+                if not self._database.client.collection_exists(self.collection_name):
+                    return
+                self._purge_qdrant()
+                self._load_from_qdrant()
+            except Exception as e:
+                logger.warning(f"[SemanticCache] Could not warm from Qdrant collection '{self.collection_name}': {e}")
+
+    # --- helpers ---
+
+    @staticmethod
+    def _normalize(vector: Any) -> np.ndarray:
+        v = np.asarray(vector, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(v)
+        return v / norm if norm > 0 else v
+
+    def _redis_key(self, entry_id: str) -> str:
+        return f"{self._redis.prefix}:semantic_cache:{entry_id}"
+
+    def _purge_expired(self, now: float) -> None:
+        expired = [k for k, e in self._entries.items() if e["expires_at"] <= now]
+        for k in expired:
+            del self._entries[k]
+        if expired:
+            self._dirty = True
+
+    def _rebuild(self) -> None:
+        if not self._dirty:
+            return
+        self._ids = list(self._entries.keys())
+        self._matrix = np.stack([self._entries[k]["vector"] for k in self._ids]) if self._ids else None
+        self._dirty = False
+
+    def _insert(self, entry_id: str, entry: Dict[str, Any]) -> None:
+        self._entries[entry_id] = entry
+        self._entries.move_to_end(entry_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        self._dirty = True
+
+    # --- backend ---
+
+    def _load_from_redis(self) -> None:
+        now = time.time()
+        loaded = 0
+        for key in self._redis.client.scan_iter(match=self._redis_key("*"), count=500):
+            raw = self._redis.client.get(key)
+            if not raw:
+                continue
+            item = json.loads(raw)
+            if item["expires_at"] <= now:
+                continue
+            entry_id = key.decode("utf-8").rsplit(":", 1)[-1] if isinstance(key, bytes) else key.rsplit(":", 1)[-1]
+            item["vector"] = self._normalize(item["vector"])
+            self._insert(entry_id, item)
+            loaded += 1
+        logger.info(f"[SemanticCache] Loaded {loaded} entries from Redis")
+
+    @staticmethod
+    def _expires_filter(now: float, expired: bool):
+        from qdrant_client.models import FieldCondition, Filter, Range
+
+        condition = Range(lte=now) if expired else Range(gt=now)
+        return Filter(must=[FieldCondition(key="expires_at", range=condition)])
+
+    def _load_from_qdrant(self) -> None:
+        now = time.time()
+        points = self._database.scroll(self.collection_name, filters=self._expires_filter(now, expired=False), with_vectors=True)
+        # giữ max_entries entry mới nhất, chèn cũ -> mới để thứ tự LRU khớp thời điểm tạo
+        points.sort(key=lambda p: (p["payload"] or {}).get("created_at", 0))
+        with self._lock:
+            for point in points[-self.max_entries:]:
+                self._insert(str(point["id"]), dict(point["payload"] or {}, vector=self._normalize(point["vector"])))
+        self._collection_ready = True
+        logger.info(f"[SemanticCache] Loaded {min(len(points), self.max_entries)} entries from Qdrant")
+
+    def _purge_qdrant(self) -> None:
+        """Xoá điểm hết hạn trên Qdrant; mỗi lúc chỉ một lần xoá chạy."""
+        if not self._purging.acquire(blocking=False):
+            return
+        try:
+            self._last_remote_purge = time.time()
+            self._database.delete_by_filter(self.collection_name, self._expires_filter(self._last_remote_purge, expired=True))
+        finally:
+            self._purging.release()
+
+    def _maybe_purge_qdrant(self) -> None:
+        if self.purge_interval_s and time.time() - self._last_remote_purge >= self.purge_interval_s:
+            threading.Thread(target=self._purge_qdrant, name="semantic-cache-purge", daemon=True).start()
+
+    def _write_backend(self, entry_id: str, entry: Dict[str, Any]) -> None:
+        item = dict(entry)
+        item["vector"] = entry["vector"].tolist()
+        try:
+            if self._redis is not None:
+                self._redis.client.set(self._redis_key(entry_id), json.dumps(item, ensure_ascii=False), ex=self.ttl_seconds)
+            elif self._database is not None:
+                if not self._collection_ready:
+                    self._collection_ready = self._database.create_collection(self.collection_name, vector_size=len(item["vector"]))
+                vector = item.pop("vector")
+                self._database.upsert(self.collection_name, [{"id": entry_id, "vector": vector, "payload": item}])
+                self._maybe_purge_qdrant()
+        except Exception as e:
+            logger.warning(f"[SemanticCache] Failed to persist entry: {e}")
+
+    # --- API ---
+
+    def lookup(self, vector: Any) -> Optional[Dict[str, Any]]:
+        """Trả về entry {question, answer, similarity, ...} nếu cosine >= threshold, ngược lại None."""
+        if not self.enabled:
+            return None
+        v = self._normalize(vector)
+        now = time.time()
+        found = None
+        with self._lock:
+            self._purge_expired(now)
+            self._rebuild()
+            if self._matrix is not None:
+                sims = self._matrix @ v
+                best = int(np.argmax(sims))
+                if sims[best] >= self.threshold:
+                    entry_id = self._ids[best]
+                    self._entries.move_to_end(entry_id)
+                    found = dict(self._entries[entry_id], similarity=float(sims[best]))
+            if found is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return found
+
+    def add(self, vector: Any, question: str, answer: str) -> None:
+        """Lưu cặp Q&A đã được guardrail đầu ra chấp nhận."""
+        if not self.enabled or not answer:
+            return
+        now = time.time()
+        entry_id = str(uuid.uuid4())
+        entry = {
+            "question": question,
+            "answer": answer,
+            "created_at": now,
+            "expires_at": now + self.ttl_seconds,
+            "vector": self._normalize(vector),
+        }
+        with self._lock:
+            self._purge_expired(now)
+            self._insert(entry_id, entry)
+        self._write_backend(entry_id, entry)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._entries),
+                "backend": self.backend,
+            }
@@ -0,0 +1,128 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from ..utils.config_utils import BaseConfig
+from ..utils.logger_utils import get_logger
+
+logger = get_logger(__name__)
+
+# message tóm tắt (chế độ memory "summary") luôn đứng đầu lịch sử với role "system"
+SUMMARY_PREFIX = "Tóm tắt các lượt hội thoại trước:\n"
+
+
+def split_summary(history: List[Dict[str, Any]]) -> Tuple[Optional[str], List[Dict[str, Any]]]:
+    """(nội dung tóm tắt hoặc None, các message nguyên văn)."""
+    if history and history[0].get("role") == "system":
+        return str(history[0].get("content") or "").replace(SUMMARY_PREFIX, "", 1), list(history[1:])
+    return None, list(history)
+
+
+def trim_history(history: List[Dict[str, Any]], max_messages: int) -> List[Dict[str, Any]]:
+    """Giữ `max_messages` message cuối; message tóm tắt đầu lịch sử (nếu có) luôn được giữ."""
+    if len(history) <= max_messages:
+        return list(history)
+    if history and history[0].get("role") == "system":
+        return [history[0]] + list(history[1:][-(max_messages - 1):]) if max_messages > 1 else [history[0]]
+    return list(history[-max_messages:])
+
+
+class SessionStore:
+    """
+    Lưu lịch sử hội thoại (đã giới hạn số message) theo session_id phía server.
+    - In-process: OrderedDict theo LRU, tối đa `max_sessions` session, hết hạn sau `idle_ttl_seconds` không dùng.
+    - Backend "redis" (tuỳ chọn, qua CacheRedis): dùng chung giữa các worker, TTL được gia hạn mỗi lần ghi.
+    """
+
+    def __init__(self, global_config: BaseConfig, max_messages: int = 20) -> None:
+        self.global_config = global_config
+        self.enabled = global_config.session_enabled
+        self.idle_ttl_seconds = int(global_config.session_idle_ttl_seconds)
+        self.max_sessions = max(1, int(global_config.session_max_sessions))
+        self.max_messages = max_messages
+
+        self._sessions: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._redis = None
+
+        if self.enabled and (global_config.session_backend or "memory").lower() == "redis":
+            try:
+                from .cache_redis import CacheRedis
+                redis_cache = CacheRedis(global_config=global_config)
+                if redis_cache.available:
+                    self._redis = redis_cache
+            except Exception as e:
+                logger.warning(f"[SessionStore] Redis backend unavailable, using in-process only: {e}")
+
+    def _redis_key(self, session_id: str) -> str:
+        return f"{self._redis.prefix}:session:{session_id}"
+
+    def _evict(self, now: float) -> None:
+        # OrderedDict theo thứ tự truy cập: session cũ nhất nằm đầu
+        while self._sessions:
+            session_id, item = next(iter(self._sessions.items()))
+            if len(self._sessions) <= self.max_sessions and now - item["last_access"] < self.idle_ttl_seconds:
+                break
+            self._sessions.popitem(last=False)
+
+    def get(self, session_id: Optional[str]) -> List[Dict[str, Any]]:
+        """Trả về bản sao lịch sử của session (rỗng nếu chưa có / đã hết hạn)."""
+        if not self.enabled or not session_id:
+            return []
+        now = time.time()
+        with self._lock:
+            self._evict(now)
+            item = self._sessions.get(session_id)
+            if item is not None:
+                item["last_access"] = now
+                self._sessions.move_to_end(session_id)
+                return list(item["history"])
+
+        if self._redis is not None:
+            try:
+                raw = self._redis.client.get(self._redis_key(session_id))
+                if raw:
+                    history = trim_history(json.loads(raw), self.max_messages)
+                    with self._lock:
+                        self._sessions[session_id] = {"history": history, "last_access": now}
+                        self._evict(now)
+                    return list(history)
+            except Exception as e:
+                logger.warning(f"[SessionStore] Redis read failed: {e}")
+        return []
+
+    def save(self, session_id: Optional[str], history: List[Dict[str, Any]]) -> None:
+        """Ghi lịch sử (chỉ giữ `max_messages` message cuối) cho session."""
+        if not self.enabled or not session_id:
+            return
+        now = time.time()
+        history = trim_history(history, self.max_messages)
+        with self._lock:
+            self._sessions[session_id] = {"history": history, "last_access": now}
+            self._sessions.move_to_end(session_id)
+            self._evict(now)
+
+        if self._redis is not None:
+            try:
+                self._redis.client.set(
+                    self._redis_key(session_id),
+                    json.dumps(history, ensure_ascii=False, default=str),
+                    ex=self.idle_ttl_seconds,
+                )
+            except Exception as e:
+                logger.warning(f"[SessionStore] Redis write failed: {e}")
+
+    def clear(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+        if self._redis is not None:
+            try:
+                self._redis.client.delete(self._redis_key(session_id))
+            except Exception as e:
+                logger.warning(f"[SessionStore] Redis delete failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"sessions": len(self._sessions), "backend": "redis" if self._redis is not None else "memory"}
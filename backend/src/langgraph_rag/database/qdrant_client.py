@@ -1,6 +1,8 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Dict, List, Optional, Union
-from qdrant_client import QdrantClient
-from qdrant_client.models import Filter, Distance, VectorParams, PointStruct, PointIdsList, PayloadSchemaType
+from qdrant_client import AsyncQdrantClient, QdrantClient
+from qdrant_client.models import Filter, FilterSelector, Distance, VectorParams, PointStruct, PointIdsList, PayloadSchemaType, QueryRequest
 
 from .base import DatabaseConfig, BaseDatabaseConfig
 from ..utils.config_utils import BaseConfig
@@ -30,6 +32,7 @@ class QdrantDatabase(BaseDatabaseConfig):
     
     def _connect(self) -> None:
         self.client = QdrantClient(**self.database_config.database_params)
+        self._async_client: Optional[AsyncQdrantClient] = None
         try:
             collections = self.client.get_collections()
             logger.info(f"✅ Kết nối Qdrant thành công. ")
@@ -126,6 +129,43 @@ class QdrantDatabase(BaseDatabaseConfig):
             logger.error(f"❌ Lỗi khi xoá điểm khỏi collection '{collection_name}': {e}")
             return 0
     
+    def delete_by_filter(self, collection_name: str, filters: Filter, **kwargs: Any) -> bool:
+        """Xoá mọi điểm khớp filter (vd: entry đã hết hạn). Trả về True nếu thành công."""
+        try:
+            self.client.delete(collection_name=collection_name, points_selector=FilterSelector(filter=filters), **kwargs)
+            return True
+        except Exception as e:
+            logger.error(f"❌ Lỗi khi xoá điểm theo filter khỏi collection '{collection_name}': {e}")
+            return False
+
+    def scroll(
+        self,
+        collection_name: str,
+        filters: Optional[Filter] = None,
+        batch_size: int = 256,
+        with_vectors: bool = False,
+        with_payload: bool = True,
+    ) -> List[Dict[str, Any]]:
+        """Đọc toàn bộ điểm khớp filter (phân trang theo batch_size). Lỗi (vd: collection chưa tồn tại) được ném cho nơi gọi."""
+        rs: List[Dict[str, Any]] = []
+        offset = None
+        while True:
+            points, offset = self.client.scroll(
+                collection_name=collection_name,
+                scroll_filter=filters,
+                limit=batch_size,
+                offset=offset,
+                with_payload=with_payload,
+                with_vectors=with_vectors,
+            )
+            for p in points:
+                item = {"id": p.id, "payload": p.payload}
+                if with_vectors:
+                    item["vector"] = p.vector
+                rs.append(item)
+            if offset is None:
+                return rs
+
     def search(
         self,
         query_vector: List[float],
@@ -194,6 +234,124 @@ class QdrantDatabase(BaseDatabaseConfig):
             logger.error(f"Lỗi tìm kiếm: {e}")
             return []
         
+    @staticmethod
+    def _points_to_dicts(points: List[Any], with_vectors: bool = False) -> List[Dict[str, Any]]:
+        rs = []
+        for p in points:
+            item = {"id": p.id, "score": p.score, "payload": p.payload}
+            if with_vectors:
+                item["vector"] = p.vector
+            rs.append(item)
+        return rs
+
+    @property
+    def async_client(self) -> AsyncQdrantClient:
+        """AsyncQdrantClient dùng chung, tạo lười ở lần gọi async đầu tiên."""
+        if self._async_client is None:
+            self._async_client = AsyncQdrantClient(**self.database_config.database_params)
+        return self._async_client
+
+    def search_collections(
+        self,
+        query_vector: List[float],
+        collection_names: List[str],
+        limit: int = 10,
+        filters: Optional[Filter] = None,
+        with_vectors: bool = False,
+        with_payload: bool = True,
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Tìm cùng một query_vector trên nhiều collection, các request gửi đồng thời.
+        (query_batch_points của Qdrant chỉ gộp được trong một collection.)
+        Trả về {collection_name: [kết quả]}; collection lỗi -> [].
+        """
+        if not collection_names:
+            return {}
+
+        def _query(collection_name: str) -> List[Dict[str, Any]]:
+            try:
+                results = self.client.query_points(
+                    collection_name=collection_name,
+                    query=query_vector,
+                    query_filter=filters,
+                    limit=limit,
+                    with_payload=with_payload,
+                    with_vectors=with_vectors
+                )
+                return self._points_to_dicts(results.points, with_vectors)
+            except Exception as e:
+                logger.error(f"Lỗi tìm kiếm collection '{collection_name}': {e}")
+                return []
+
+        if len(collection_names) == 1:
+            return {collection_names[0]: _query(collection_names[0])}
+
+        with ThreadPoolExecutor(max_workers=len(collection_names)) as pool:
+            results = list(pool.map(_query, collection_names))
+        return dict(zip(collection_names, results))
+
+    async def asearch_collections(
+        self,
+        query_vector: List[float],
+        collection_names: List[str],
+        limit: int = 10,
+        filters: Optional[Filter] = None,
+        with_vectors: bool = False,
+        with_payload: bool = True,
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """Bản async của search_collections: các query_points chạy đồng thời trên AsyncQdrantClient."""
+        if not collection_names:
+            return {}
+
+        async def _query(collection_name: str) -> List[Dict[str, Any]]:
+            try:
+                results = await self.async_client.query_points(
+                    collection_name=collection_name,
+                    query=query_vector,
+                    query_filter=filters,
+                    limit=limit,
+                    with_payload=with_payload,
+                    with_vectors=with_vectors
+                )
+                return self._points_to_dicts(results.points, with_vectors)
+            except Exception as e:
+                logger.error(f"Lỗi tìm kiếm collection '{collection_name}': {e}")
+                return []
+
+        results = await asyncio.gather(*(_query(name) for name in collection_names))
+        return dict(zip(collection_names, results))
+
+    def search_batch(
+        self,
+        query_vectors: List[List[float]],
+        collection_name: str,
+        limit: int = 10,
+        filters: Optional[Filter] = None,
+        with_vectors: bool = False,
+        with_payload: bool = True,
+    ) -> List[List[Dict[str, Any]]]:
+        """Nhiều query_vector trên cùng một collection trong một lần gọi query_batch_points."""
+        if not query_vectors:
+            return []
+        try:
+            responses = self.client.query_batch_points(
+                collection_name=collection_name,
+                requests=[
+                    QueryRequest(
+                        query=[float(x) for x in vector],
+                        filter=filters,
+                        limit=limit,
+                        with_payload=with_payload,
+                        with_vector=with_vectors,
+                    )
+                    for vector in query_vectors
+                ],
+            )
+            return [self._points_to_dicts(r.points, with_vectors) for r in responses]
+        except Exception as e:
+            logger.error(f"Lỗi tìm kiếm batch collection '{collection_name}': {e}")
+            return [[] for _ in query_vectors]
+
     def query_by_id(
         self, collection_name: str, id: str, **kwargs: Any
     ) -> Optional[Dict[str, Any]]:
@@ -0,0 +1,120 @@
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, List, Tuple
+
+import numpy as np
+
+from ..utils.logger_utils import get_logger
+from ..utils.metrics_utils import EMBEDDING_BATCH_SIZE
+
+logger = get_logger(__name__)
+
+_STOP = object()
+
+
+class EmbeddingBatcher:
+    """
+    Gom các lời gọi encode đồng thời (nhiều request, nhiều thread) thành một forward pass:
+    một thread nền lấy item đầu tiên rồi chờ thêm tối đa `max_wait_ms` hoặc tới khi đủ `max_batch_size` text,
+    gọi `encode_fn` một lần cho cả batch (SentenceTransformer tự pad theo batch) và trả từng vector về Future của người gọi.
+    Text trùng trong cùng batch chỉ encode một lần.
+    """
+
+    def __init__(self, encode_fn: Callable[[List[str]], np.ndarray], max_batch_size: int = 16, max_wait_ms: float = 5.0):
+        self.encode_fn = encode_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait_s = max(0.0, float(max_wait_ms)) / 1000
+        self._queue: "queue.Queue[object]" = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._stats = {"batches": 0, "items": 0, "encoded": 0, "wait_s": 0.0, "encode_s": 0.0}
+        self._worker = threading.Thread(target=self._loop, name="embedding-batcher", daemon=True)
+        self._worker.start()
+
+    # --- API ---
+
+    def submit(self, texts: List[str]) -> List[Future]:
+        futures = []
+        now = time.perf_counter()
+        for text in texts:
+            future: Future = Future()
+            self._queue.put((text, future, now))
+            futures.append(future)
+        return futures
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """Bản chặn (gọi từ thread): chờ vector của mọi text."""
+        return np.stack([future.result() for future in self.submit(texts)])
+
+    async def aencode(self, texts: List[str]) -> np.ndarray:
+        """Bản async: chờ trên event loop, không giữ thread của model executor trong lúc gom batch."""
+        vectors = await asyncio.gather(*(asyncio.wrap_future(future) for future in self.submit(texts)))
+        return np.stack(vectors)
+
+    def close(self) -> None:
+        self._queue.put(_STOP)
+        self._worker.join(timeout=5)
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        batches = stats["batches"]
+        stats["mean_batch_size"] = round(stats["items"] / batches, 2) if batches else 0.0
+        stats["mean_wait_ms"] = round(1000 * stats.pop("wait_s") / stats["items"], 3) if stats["items"] else 0.0
+        stats["mean_encode_ms"] = round(1000 * stats.pop("encode_s") / batches, 3) if batches else 0.0
+        stats["max_batch_size"] = self.max_batch_size
+        stats["max_wait_ms"] = round(1000 * self.max_wait_s, 3)
+        return stats
+
+    # --- worker ---
+
+    def _collect(self, first: Tuple[str, Future, float]) -> Tuple[List[Tuple[str, Future, float]], bool]:
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait_s
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _loop(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+            batch, stop = self._collect(first)
+            self._run(batch)
+            if stop:
+                return
+
+    def _run(self, batch: List[Tuple[str, Future, float]]) -> None:
+        # người gọi đã huỷ (vd: tác vụ đón đầu bị cancel) -> không encode phần của họ
+        batch = [item for item in batch if item[1].set_running_or_notify_cancel()]
+        if not batch:
+            return
+        texts = list(dict.fromkeys(text for text, _, _ in batch))
+        started = time.perf_counter()
+        try:
+            vectors = dict(zip(texts, self.encode_fn(texts)))
+        except BaseException as e:
+            logger.warning(f"[EmbeddingBatcher] Batch of {len(texts)} failed: {e}")
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+        finished = time.perf_counter()
+        for text, future, _ in batch:
+            future.set_result(vectors[text])
+        EMBEDDING_BATCH_SIZE.observe(len(batch))
+        with self._stats_lock:
+            self._stats["batches"] += 1
+            self._stats["items"] += len(batch)
+            self._stats["encoded"] += len(texts)
+            self._stats["wait_s"] += sum(started - enqueued for _, _, enqueued in batch)
+            self._stats["encode_s"] += finished - started
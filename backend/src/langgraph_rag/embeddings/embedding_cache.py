@@ -0,0 +1,241 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+from filelock import FileLock
+
+from ..utils.logger_utils import get_logger
+from ..utils.metrics_utils import CACHE_EVENTS_TOTAL
+
+logger = get_logger(__name__)
+
+_SPACES = re.compile(r"\s+")
+_KEY_BYTES = 16
+
+
+def normalize_embedding_text(text: str) -> str:
+    """NFC + lower + gộp khoảng trắng: cùng câu hỏi gõ khác nhau -> cùng khoá và cùng input cho model."""
+    return _SPACES.sub(" ", unicodedata.normalize("NFC", text or "").lower()).strip()
+
+
+class EmbeddingCache:
+    """
+    Cache embedding câu hỏi 2 tầng:
+    - Tầng nhớ: LRU trong process (`memory_entries` vector).
+    - Tầng đĩa: `vectors.f32` (float32, mỗi dòng một vector, đọc qua np.memmap) + `keys.bin`
+      (digest 16 byte của khoá, dòng i <-> vector i), chỉ ghi nối đuôi; chỉ mục hash digest -> dòng nằm trong process.
+    Khoá = blake2b(model, prompt_name, tham số encode, text đã chuẩn hoá). Mỗi model có thư mục riêng.
+    Nhiều process dùng chung thư mục: ghi dưới FileLock, process khác đọc phần keys.bin mới khi tra cứu miss.
+    warm_start: nạp `memory_entries` vector mới nhất của tầng đĩa vào LRU lúc khởi tạo.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str,
+        model_name: str,
+        dim: int,
+        key_params: Optional[Dict[str, object]] = None,
+        memory_entries: int = 4096,
+        disk_enabled: bool = True,
+        disk_max_entries: int = 1000000,
+        warm_start: bool = False,
+    ):
+        self.model_name = model_name
+        self.dim = int(dim)
+        self.memory_entries = int(memory_entries)
+        self.disk_enabled = disk_enabled
+        self.disk_max_entries = int(disk_max_entries)
+        self._key_prefix = json.dumps({"model": model_name, **(key_params or {})}, sort_keys=True, default=str)
+
+        self._memory: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._memory_lock = threading.Lock()
+        self._index: Dict[bytes, int] = {}
+        self._index_bytes = 0
+        self._mmap: Optional[np.memmap] = None
+        self._disk_lock = threading.Lock()
+        self._disk_full_logged = False
+
+        self._stats_lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0, "warm_loaded": 0}
+
+        if self.disk_enabled:
+            safe_name = re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name)
+            self.cache_dir = os.path.join(cache_dir, safe_name)
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self.vectors_path = os.path.join(self.cache_dir, "vectors.f32")
+            self.keys_path = os.path.join(self.cache_dir, "keys.bin")
+            self._file_lock = FileLock(os.path.join(self.cache_dir, "write.lock"))
+            self._check_meta()
+            self._refresh_index()
+            if warm_start:
+                self._warm_start()
+
+    # --- khoá ---
+
+    def key(self, text: str) -> bytes:
+        material = f"{self._key_prefix}\x00{normalize_embedding_text(text)}".encode("utf-8")
+        return hashlib.blake2b(material, digest_size=_KEY_BYTES).digest()
+
+    # --- tầng đĩa ---
+
+    def _check_meta(self) -> None:
+        meta_path = os.path.join(self.cache_dir, "meta.json")
+        meta = {"model": self.model_name, "dim": self.dim}
+        with self._file_lock:
+            if os.path.exists(meta_path):
+                with open(meta_path, encoding="utf-8") as f:
+                    stored = json.load(f)
+                if stored.get("dim") == self.dim:
+                    return
+                # cùng tên model nhưng khác số chiều (vd: đổi output dimension) -> bỏ dữ liệu cũ
+                logger.warning(f"[EmbeddingCache] {self.cache_dir} holds dim={stored.get('dim')}, expected {self.dim}; resetting")
+                for path in (self.vectors_path, self.keys_path):
+                    if os.path.exists(path):
+                        os.remove(path)
+            with open(meta_path, "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+
+    def _refresh_index(self) -> None:
+        """Đọc phần keys.bin chưa có trong chỉ mục (do process này hoặc process khác ghi thêm)."""
+        size = os.path.getsize(self.keys_path) if os.path.exists(self.keys_path) else 0
+        # chỉ nhận các dòng đã ghi trọn vẹn cả vector
+        vectors_rows = (os.path.getsize(self.vectors_path) // (4 * self.dim)) if os.path.exists(self.vectors_path) else 0
+        size = min(size - size % _KEY_BYTES, vectors_rows * _KEY_BYTES)
+        if size <= self._index_bytes:
+            return
+        with open(self.keys_path, "rb") as f:
+            f.seek(self._index_bytes)
+            data = f.read(size - self._index_bytes)
+        row = self._index_bytes // _KEY_BYTES
+        for offset in range(0, len(data), _KEY_BYTES):
+            self._index[data[offset:offset + _KEY_BYTES]] = row
+            row += 1
+        self._index_bytes = size
+        self._mmap = None
+
+    def _rows(self) -> np.memmap:
+        if self._mmap is None:
+            self._mmap = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(self._index_bytes // _KEY_BYTES, self.dim))
+        return self._mmap
+
+    def _disk_get(self, key: bytes) -> Optional[np.ndarray]:
+        with self._disk_lock:
+            row = self._index.get(key)
+            if row is None:
+                self._refresh_index()
+                row = self._index.get(key)
+            if row is None:
+                return None
+            return np.array(self._rows()[row])
+
+    def _disk_put(self, items: List[tuple]) -> int:
+        with self._disk_lock, self._file_lock:
+            self._refresh_index()
+            items = [(key, vector) for key, vector in items if key not in self._index]
+            room = self.disk_max_entries - len(self._index)
+            if room < len(items):
+                if not self._disk_full_logged:
+                    logger.warning(f"[EmbeddingCache] Disk tier full ({self.disk_max_entries} entries), memory tier only from now on")
+                    self._disk_full_logged = True
+                items = items[:max(0, room)]
+            if not items:
+                return 0
+            # bỏ phần ghi dở của lần ghi bị ngắt (vector không có khoá / khoá thiếu byte) để dòng i vẫn khớp khoá i
+            rows = self._index_bytes // _KEY_BYTES
+            for path, size in ((self.vectors_path, rows * 4 * self.dim), (self.keys_path, rows * _KEY_BYTES)):
+                if os.path.exists(path) and os.path.getsize(path) != size:
+                    os.truncate(path, size)
+            # vector trước, khoá sau: khoá chỉ xuất hiện khi vector đã nằm trên đĩa
+            with open(self.vectors_path, "ab") as f:
+                f.write(np.stack([vector for _, vector in items]).astype(np.float32).tobytes())
+            with open(self.keys_path, "ab") as f:
+                f.write(b"".join(key for key, _ in items))
+            self._refresh_index()
+            return len(items)
+
+    def _warm_start(self) -> None:
+        count = min(self.memory_entries, len(self._index))
+        if count <= 0:
+            return
+        started = time.perf_counter()
+        rows = np.array(self._rows()[-count:])
+        keys = sorted(self._index.items(), key=lambda item: item[1])[-count:]
+        with self._memory_lock:
+            for (key, _), vector in zip(keys, rows):
+                self._memory[key] = vector
+        with self._stats_lock:
+            self._stats["warm_loaded"] = count
+        logger.info(f"[EmbeddingCache] Warm start: {count} vectors loaded in {time.perf_counter() - started:.2f}s")
+
+    # --- tầng nhớ ---
+
+    def _memory_get(self, key: bytes) -> Optional[np.ndarray]:
+        with self._memory_lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+            return vector
+
+    def _memory_put(self, key: bytes, vector: np.ndarray) -> None:
+        if self.memory_entries <= 0:
+            return
+        with self._memory_lock:
+            self._memory[key] = vector
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def _count(self, field: str) -> None:
+        with self._stats_lock:
+            self._stats[field] += 1
+        CACHE_EVENTS_TOTAL.inc(cache="embedding", result="miss" if field == "misses" else "hit")
+
+    # --- API ---
+
+    def get_many(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        out: List[Optional[np.ndarray]] = []
+        for text in texts:
+            key = self.key(text)
+            vector = self._memory_get(key)
+            if vector is not None:
+                self._count("memory_hits")
+            elif self.disk_enabled and (vector := self._disk_get(key)) is not None:
+                self._memory_put(key, vector)
+                self._count("disk_hits")
+            else:
+                self._count("misses")
+            out.append(vector)
+        return out
+
+    def put_many(self, texts: List[str], vectors) -> None:
+        items = []
+        for text, vector in zip(texts, vectors):
+            key = self.key(text)
+            vector = np.asarray(vector, dtype=np.float32)
+            self._memory_put(key, vector)
+            items.append((key, vector))
+        written = 0
+        if self.disk_enabled and items:
+            try:
+                written = self._disk_put(items)
+            except OSError as e:
+                logger.warning(f"[EmbeddingCache] Disk write failed: {e}")
+        with self._stats_lock:
+            self._stats["writes"] += written
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        reads = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["memory_hits"] + stats["disk_hits"]) / reads, 4) if reads else 0.0
+        with self._memory_lock:
+            stats["memory_size"] = len(self._memory)
+        stats["disk_entries"] = len(self._index)
+        return stats
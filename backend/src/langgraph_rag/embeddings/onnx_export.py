@@ -0,0 +1,158 @@
+"""
+Backend ONNX Runtime (CPU) cho model embedding, chọn qua `embedding_backend` (torch | onnx | onnx-int8).
+
+- torch: SentenceTransformer PyTorch gốc (fp32).
+- onnx: graph fp32 export từ model gốc, chạy bằng ONNX Runtime (SentenceTransformer backend="onnx").
+- onnx-int8: quantize động int8 (trọng số int8, activation quantize lúc chạy) theo tập lệnh CPU `embedding_onnx_quantization`.
+
+Model ONNX phải được export trước, cần `pip install "optimum[onnxruntime]"` (từ thư mục backend/):
+    python -m src.langgraph_rag.embeddings.onnx_export export
+    python -m src.langgraph_rag.embeddings.onnx_export export --quantization avx2
+Kiểm tra cosine so với torch trước khi đổi backend:
+    python -m src.langgraph_rag.embeddings.onnx_export parity --backend onnx-int8 --data questions.txt --min-cosine 0.99
+"""
+import argparse
+import copy
+import os
+import re
+import sys
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from ..utils.config_utils import BaseConfig
+from ..utils.logger_utils import get_logger
+
+logger = get_logger(__name__)
+
+EMBEDDING_BACKENDS = ("torch", "onnx", "onnx-int8")
+ONNX_QUANTIZATIONS = ("arm64", "avx2", "avx512", "avx512_vnni")
+
+PARITY_QUESTIONS = [
+    "Hồ sơ gia hạn tạm trú gồm những giấy tờ gì ?",
+    "Thủ tục đăng ký thường trú cần những gì?",
+    "Chỗ nào không được phép đăng ký tạm trú mới?",
+    "Thời hạn giải quyết đăng ký tạm trú là bao lâu?",
+    "Luật cư trú quy định quyền của công dân như thế nào?",
+    "Không đăng ký tạm trú thì bị phạt thế nào?",
+    "Điều kiện đăng ký thường trú tại chỗ ở thuê là gì?",
+    "xin chào",
+]
+
+
+def onnx_model_dir(global_config: BaseConfig, model_name: Optional[str] = None) -> str:
+    safe_name = re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name or global_config.embedding_model_name)
+    return global_config.embedding_onnx_dir or os.path.join(global_config.save_dir, "onnx", safe_name)
+
+
+def onnx_file_name(backend: str, quantization: str) -> str:
+    return "model.onnx" if backend == "onnx" else f"model_qint8_{quantization}.onnx"
+
+
+def _find_onnx_file(model_dir: str, file_name: str) -> Optional[str]:
+    # SentenceTransformer lưu graph trong thư mục con onnx/, optimum lưu ở gốc
+    for relative in (os.path.join("onnx", file_name), file_name):
+        if os.path.exists(os.path.join(model_dir, relative)):
+            return relative
+    return None
+
+
+def backend_init_params(global_config: BaseConfig, model_name: Optional[str] = None, backend: Optional[str] = None) -> Dict[str, Any]:
+    """Tham số SentenceTransformer(...) theo backend; backend ONNX đọc model đã export trong onnx_model_dir."""
+    model_name = model_name or global_config.embedding_model_name
+    backend = backend or global_config.embedding_backend
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding_backend {backend!r}, expected one of {EMBEDDING_BACKENDS}")
+    if backend == "torch":
+        return {"model_name_or_path": model_name}
+
+    model_dir = onnx_model_dir(global_config, model_name)
+    file_name = onnx_file_name(backend, global_config.embedding_onnx_quantization)
+    relative = _find_onnx_file(model_dir, file_name)
+    if relative is None:
+        raise FileNotFoundError(
+            f"{file_name} not found in {model_dir}; run `python -m src.langgraph_rag.embeddings.onnx_export export` first"
+        )
+    return {
+        "model_name_or_path": model_dir,
+        "backend": "onnx",
+        "model_kwargs": {"file_name": relative, "provider": "CPUExecutionProvider"},
+    }
+
+
+def export(global_config: BaseConfig, quantize: bool = True, quantization: Optional[str] = None) -> str:
+    """Export graph fp32 (+ bản int8) vào onnx_model_dir, kèm tokenizer / pooling / prompts của SentenceTransformer."""
+    from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+
+    model_dir = onnx_model_dir(global_config)
+    quantization = quantization or global_config.embedding_onnx_quantization
+    # model trên hub chưa có file .onnx -> optimum export lúc nạp
+    model = SentenceTransformer(
+        global_config.embedding_model_name, backend="onnx", model_kwargs={"provider": "CPUExecutionProvider"}
+    )
+    model.save_pretrained(model_dir)
+    logger.info(f"[onnx_export] Saved fp32 ONNX model to {model_dir}")
+    if quantize:
+        export_dynamic_quantized_onnx_model(model, quantization_config=quantization, model_name_or_path=model_dir)
+        logger.info(f"[onnx_export] Saved int8 ({quantization}) ONNX model to {model_dir}")
+    return model_dir
+
+
+def cosine_parity(reference: np.ndarray, candidate: np.ndarray) -> Dict[str, float]:
+    """Cosine giữa vector của cùng một câu ở hai backend (min / p05 / mean)."""
+    a = np.asarray(reference, dtype=np.float32)
+    b = np.asarray(candidate, dtype=np.float32)
+    a = a / np.maximum(np.linalg.norm(a, axis=1, keepdims=True), 1e-12)
+    b = b / np.maximum(np.linalg.norm(b, axis=1, keepdims=True), 1e-12)
+    cosines = (a * b).sum(axis=1)
+    return {
+        "texts": int(len(cosines)),
+        "min": round(float(cosines.min()), 5),
+        "p05": round(float(np.percentile(cosines, 5)), 5),
+        "mean": round(float(cosines.mean()), 5),
+    }
+
+
+def _encoder(global_config: BaseConfig, backend: str):
+    from .qwen_embedding_model import QwenEmbeddingModel
+
+    config = copy.copy(global_config)
+    config.embedding_backend = backend
+    config.embedding_cache_enabled = False
+    config.embedding_batcher_enabled = False
+    return QwenEmbeddingModel(global_config=config)
+
+
+def parity(global_config: BaseConfig, backend: str, questions: List[str]) -> Dict[str, float]:
+    reference = _encoder(global_config, "torch").batch_encode(questions)
+    candidate = _encoder(global_config, backend).batch_encode(questions)
+    return cosine_parity(reference, candidate)
+
+
+def _read_questions(path: Optional[str]) -> List[str]:
+    if not path:
+        return PARITY_QUESTIONS
+    from ..prompts.intent_classifier import _read_examples
+
+    return [question for question, _ in _read_examples(path)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export / quantize model embedding sang ONNX và kiểm tra cosine so với torch")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export", help="export fp32 + int8 vào embedding_onnx_dir")
+    export_parser.add_argument("--quantization", choices=ONNX_QUANTIZATIONS, default=None, help="mặc định embedding_onnx_quantization")
+    export_parser.add_argument("--no-quantize", action="store_true", help="chỉ export fp32")
+    parity_parser = commands.add_parser("parity", help="cosine giữa vector torch và vector backend ONNX")
+    parity_parser.add_argument("--backend", choices=EMBEDDING_BACKENDS[1:], default="onnx-int8")
+    parity_parser.add_argument("--data", default=None, help=".txt mỗi dòng một câu hỏi hoặc .jsonl có trường question")
+    parity_parser.add_argument("--min-cosine", type=float, default=0.99, help="cosine nhỏ nhất chấp nhận được (exit code 1 nếu thấp hơn)")
+    args = parser.parse_args()
+
+    config = BaseConfig()
+    if args.command == "export":
+        print(export(config, quantize=not args.no_quantize, quantization=args.quantization))
+    else:
+        report = parity(config, args.backend, [q.lower() for q in _read_questions(args.data)])
+        print(f"backend={args.backend} texts={report['texts']} cosine min={report['min']:.5f} p05={report['p05']:.5f} mean={report['mean']:.5f}")
+        sys.exit(0 if report["min"] >= args.min_cosine else 1)
@@ -1,8 +1,14 @@
+import os
 from typing import List, Optional, Union
 from copy import deepcopy
+import numpy as np
 from sentence_transformers import SentenceTransformer
 import tqdm
 from .base import BaseEmbeddingModelConfig, EmbeddingModelConfig
+from .embedding_batcher import EmbeddingBatcher
+from .embedding_cache import EmbeddingCache, normalize_embedding_text
+from .onnx_export import backend_init_params
+from ..utils.async_utils import run_in_model_executor
 from ..utils.config_utils import BaseConfig
 from ..utils.logger_utils import get_logger
 
@@ -25,15 +31,48 @@ class QwenEmbeddingModel(BaseEmbeddingModelConfig):
 
         self.embedding_model = SentenceTransformer(**self.embedding_config.model_init_params)
         self.embedding_dim = self.embedding_model.get_sentence_embedding_dimension()
+        logger.info(f"[{self.__class__.__name__}] Loaded {self.embedding_model_name} with backend={self.embedding_config.backend}")
+        self.cache = self._init_cache()
+        self.batcher = EmbeddingBatcher(
+            self._encode,
+            max_batch_size=global_config.embedding_batcher_max_batch_size or self.embedding_config.encode_params["batch_size"],
+            max_wait_ms=global_config.embedding_batcher_max_wait_ms,
+        ) if self.global_config.embedding_batcher_enabled else None
+
+    def _init_cache(self) -> Optional[EmbeddingCache]:
+        if not self.global_config.embedding_cache_enabled:
+            return None
+        params = self.embedding_config.encode_params
+        return EmbeddingCache(
+            cache_dir=self.global_config.embedding_cache_dir or os.path.join(self.global_config.save_dir, "embedding_cache"),
+            model_name=self.embedding_model_name,
+            dim=self.embedding_dim,
+            # tham số làm thay đổi vector
+            key_params={
+                "prompt_name": params.get("prompt_name"),
+                "instruction": params.get("instruction"),
+                "max_length": params.get("max_length"),
+                "normalize": self.embedding_config.norm,
+                # vector int8 / ONNX lệch nhẹ so với torch -> không dùng chung cache
+                "backend": self.embedding_config.backend,
+                "quantization": self.global_config.embedding_onnx_quantization if self.embedding_config.backend == "onnx-int8" else None,
+            },
+            memory_entries=self.global_config.embedding_cache_memory_entries,
+            disk_enabled=self.global_config.embedding_cache_disk_enabled,
+            disk_max_entries=self.global_config.embedding_cache_disk_max_entries,
+            warm_start=self.global_config.embedding_cache_warm_start,
+        )
 
 
     def _init_embedding_config(self) -> None:
         config_dict = {
             "embedding_model_name": self.embedding_model_name,
             "norm": self.global_config.embedding_return_as_normalized,
+            "backend": self.global_config.embedding_backend,
 
             "model_init_params": {
-                "model_name_or_path": self.embedding_model_name,
+                # torch: model_name_or_path; onnx / onnx-int8: thư mục model đã export + backend + model_kwargs
+                **backend_init_params(self.global_config, model_name=self.embedding_model_name),
                 # "trust_remote_code": True,
                 # "device": self.global_config.embedding_device,
                 # 'device_map': "auto",  # added this line to use multiple GPUs
@@ -56,20 +95,63 @@ class QwenEmbeddingModel(BaseEmbeddingModelConfig):
         """
         Encode 1 hoặc nhiều câu bằng SentenceTransformer (Qwen3-Embedding).
         Tự lấy tham số từ self.embedding_config.encode_params.
+        Có cache (services.embedding_cache): chỉ encode các câu chưa có vector, câu trùng trong batch encode một lần.
+        Có batcher (services.embedding_batcher): các câu thiếu được gom với lời gọi đồng thời của request khác.
         """
-        params = deepcopy(self.embedding_config.encode_params)
-        params["normalize_embeddings"] = self.embedding_config.norm
-        params["show_progress_bar"] = isinstance(texts, list) and len(texts) > params.get("batch_size", 32)
-
-        # Chuẩn bị input
-        single_input = isinstance(texts, str)
-        input_texts = [texts.lower()] if single_input else [t.lower() for t in texts]
-
-        # Gọi encode
-        emb = self.embedding_model.encode(input_texts, **params)
+        single_input, input_texts = self._prepare(texts)
+        cached, missing = self._lookup(input_texts)
+        encoded = self._encode_batched(missing) if missing else []
+        emb = self._assemble(input_texts, cached, missing, encoded)
 
         # Trả về đúng định dạng
         return emb[0] if single_input else emb
+
+    async def abatch_encode(self, texts: Union[str, List[str]]) -> Union[List[float], List[List[float]]]:
+        """Bản async của batch_encode: chờ batcher trên event loop (tắt batcher -> model executor)."""
+        single_input, input_texts = self._prepare(texts)
+        cached, missing = self._lookup(input_texts)
+        encoded = []
+        if missing:
+            if self._use_batcher(missing):
+                encoded = await self.batcher.aencode(missing)
+            else:
+                encoded = await run_in_model_executor(self._encode, missing)
+        emb = self._assemble(input_texts, cached, missing, encoded)
+        return emb[0] if single_input else emb
+
+    @staticmethod
+    def _prepare(texts: Union[str, List[str]]):
+        # chuẩn hoá giống khoá cache: cache hit trả đúng vector model sẽ sinh
+        single_input = isinstance(texts, str)
+        input_texts = [normalize_embedding_text(texts)] if single_input else [normalize_embedding_text(t) for t in texts]
+        return single_input, input_texts
+
+    def _lookup(self, input_texts: List[str]):
+        """(vector đã cache hoặc None theo từng câu, các câu cần encode - không trùng)."""
+        cached = self.cache.get_many(input_texts) if self.cache is not None else [None] * len(input_texts)
+        missing = list(dict.fromkeys(t for t, v in zip(input_texts, cached) if v is None))
+        return cached, missing
+
+    def _assemble(self, input_texts: List[str], cached, missing: List[str], encoded) -> np.ndarray:
+        if not missing:
+            return np.stack(cached)
+        if self.cache is not None:
+            self.cache.put_many(missing, encoded)
+        by_text = dict(zip(missing, encoded))
+        return np.stack([v if v is not None else by_text[t] for t, v in zip(input_texts, cached)])
+
+    def _use_batcher(self, missing: List[str]) -> bool:
+        # lô lớn (huấn luyện classifier, benchmark) đã đủ batch -> encode thẳng
+        return self.batcher is not None and len(missing) < self.batcher.max_batch_size
+
+    def _encode_batched(self, missing: List[str]) -> np.ndarray:
+        return self.batcher.encode(missing) if self._use_batcher(missing) else self._encode(missing)
+
+    def _encode(self, input_texts: List[str]) -> np.ndarray:
+        params = deepcopy(self.embedding_config.encode_params)
+        params["normalize_embeddings"] = self.embedding_config.norm
+        params["show_progress_bar"] = len(input_texts) > params.get("batch_size", 32)
+        return self.embedding_model.encode(input_texts, **params)
     
 
 # # run: python -m backend.src.langgraph_rag.embeddings.qwen_embedding_model
@@ -0,0 +1,90 @@
+"""
+Benchmark throughput của workflow khi chạy bất đồng bộ (ainvoke) với các mức concurrency khác nhau.
+
+run (từ thư mục backend/):
+    python -m src.langgraph_rag.evaluation.bench_concurrency --requests 16 --concurrency 1 2 4 8
+
+Mức concurrency = 1 tương đương xử lý tuần tự từng request như trước đây.
+Thêm --offline để thay Bedrock LLM / guardrail bằng stand-in cục bộ (services.offline), chạy được trên laptop không cần AWS.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from typing import List
+
+from ..nodes import RAGWorkflowNodes, create_default_rag_state
+from ..utils.config_utils import BaseConfig
+from ..workflows import create_rag_workflow
+
+
+DEFAULT_QUESTIONS = [
+    "Hồ sơ gia hạn tạm trú gồm những giấy tờ gì ?",
+    "Thủ tục đăng ký thường trú cần những gì?",
+    "Chỗ nào không được phép đăng ký tạm trú mới?",
+    "xin chào",
+    "Thời hạn giải quyết đăng ký tạm trú là bao lâu?",
+    "Luật cư trú quy định quyền của công dân như thế nào?",
+]
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+    return ordered[idx]
+
+
+async def _run_level(app, questions: List[str], n_requests: int, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+
+    async def one(i: int) -> None:
+        async with semaphore:
+            state = create_default_rag_state(question=questions[i % len(questions)], conversation_history=[])
+            t0 = time.perf_counter()
+            await app.ainvoke(state)
+            latencies.append(time.perf_counter() - t0)
+
+    t_start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(n_requests)))
+    wall = time.perf_counter() - t_start
+
+    return {
+        "concurrency": concurrency,
+        "requests": n_requests,
+        "wall_s": wall,
+        "throughput_rps": n_requests / wall if wall > 0 else 0.0,
+        "p50_s": statistics.median(latencies),
+        "p95_s": _percentile(latencies, 0.95),
+    }
+
+
+async def main(n_requests: int, levels: List[int], offline: bool = False) -> None:
+    global_config = BaseConfig()
+    if offline:
+        global_config.offline_enabled = True
+    nodes = RAGWorkflowNodes(global_config=global_config)
+    app = create_rag_workflow(nodes)
+
+    # warm-up: nạp model, mở kết nối
+    await app.ainvoke(create_default_rag_state(question=DEFAULT_QUESTIONS[0], conversation_history=[]))
+
+    print(f"{'concurrency':>11} | {'req':>4} | {'wall(s)':>8} | {'req/s':>7} | {'p50(s)':>7} | {'p95(s)':>7}")
+    baseline = None
+    for level in levels:
+        r = await _run_level(app, DEFAULT_QUESTIONS, n_requests, level)
+        baseline = baseline or r["throughput_rps"]
+        speedup = r["throughput_rps"] / baseline if baseline else 0.0
+        print(
+            f"{r['concurrency']:>11} | {r['requests']:>4} | {r['wall_s']:>8.2f} | "
+            f"{r['throughput_rps']:>7.2f} | {r['p50_s']:>7.2f} | {r['p95_s']:>7.2f}  (x{speedup:.2f})"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark throughput workflow RAG theo mức concurrency")
+    parser.add_argument("--requests", type=int, default=16)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--offline", action="store_true", help="dùng stand-in cục bộ thay cho Bedrock")
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.concurrency, args.offline))
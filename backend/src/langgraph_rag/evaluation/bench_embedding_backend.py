@@ -0,0 +1,143 @@
+"""
+So sánh các backend embedding (torch / onnx / onnx-int8) trên CPU: thời gian nạp, RSS, latency encode và cosine so với torch.
+
+run (từ thư mục backend/):
+    python -m src.langgraph_rag.evaluation.bench_embedding_backend
+    python -m src.langgraph_rag.evaluation.bench_embedding_backend --backends torch onnx-int8 --runs 100 --threads 4
+
+Backend ONNX cần export trước (python -m src.langgraph_rag.embeddings.onnx_export export).
+Mỗi backend chạy trong một process riêng (ẩn GPU qua CUDA_VISIBLE_DEVICES) để RSS không lẫn model của backend khác.
+Embedding cache và batcher tắt: "single" = encode từng câu một (như một request), "batch" = throughput encode theo lô batch_size.
+"""
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from ..embeddings.onnx_export import EMBEDDING_BACKENDS, PARITY_QUESTIONS, cosine_parity
+
+
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/status", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return _peak_rss_mb()
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss: KB trên Linux, byte trên macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+    return ordered[idx]
+
+
+def _worker(backend: str, runs: int, threads: Optional[int], out_path: str) -> None:
+    """Chạy trong process con: đo một backend, ghi vector của PARITY_QUESTIONS ra .npy, in kết quả JSON ở dòng cuối."""
+    rss_start = _rss_mb()
+    if threads:
+        import torch
+
+        torch.set_num_threads(threads)
+    from ..embeddings.qwen_embedding_model import QwenEmbeddingModel
+    from ..utils.config_utils import BaseConfig
+
+    config = BaseConfig()
+    config.embedding_backend = backend
+    config.embedding_cache_enabled = False
+    config.embedding_batcher_enabled = False
+    started = time.perf_counter()
+    model = QwenEmbeddingModel(global_config=config)
+    load_s = time.perf_counter() - started
+    rss_loaded = _rss_mb()
+
+    questions = [q.lower() for q in PARITY_QUESTIONS]
+    vectors = model._encode(questions)  # warm-up + vector cho parity
+    np.save(out_path, np.asarray(vectors, dtype=np.float32))
+
+    single: List[float] = []
+    for i in range(runs):
+        t0 = time.perf_counter()
+        model._encode([questions[i % len(questions)]])
+        single.append(time.perf_counter() - t0)
+
+    batch_texts = [f"{questions[i % len(questions)]} ({i})" for i in range(max(runs, model.embedding_config.encode_params["batch_size"]))]
+    t0 = time.perf_counter()
+    model._encode(batch_texts)
+    batch_s = time.perf_counter() - t0
+
+    print(json.dumps({
+        "backend": backend,
+        "load_s": load_s,
+        "rss_model_mb": rss_loaded - rss_start,
+        "rss_mb": _rss_mb(),
+        "peak_rss_mb": _peak_rss_mb(),
+        "p50_ms": 1000 * statistics.median(single),
+        "p95_ms": 1000 * _percentile(single, 0.95),
+        "batch_tps": len(batch_texts) / batch_s if batch_s > 0 else 0.0,
+    }))
+
+
+def _run_backend(backend: str, runs: int, threads: Optional[int], out_path: str) -> Optional[Dict]:
+    env = {**os.environ, "CUDA_VISIBLE_DEVICES": ""}
+    if threads:
+        env["OMP_NUM_THREADS"] = str(threads)
+    command = [sys.executable, "-m", __spec__.name, "--worker", backend, "--runs", str(runs), "--out", out_path]
+    if threads:
+        command += ["--threads", str(threads)]
+    proc = subprocess.run(command, env=env, capture_output=True, text=True)
+    lines = proc.stdout.strip().splitlines()
+    if proc.returncode != 0 or not lines:
+        print(f"[{backend}] failed (exit {proc.returncode}):\n{proc.stderr.strip()[-2000:]}", file=sys.stderr)
+        return None
+    return json.loads(lines[-1])
+
+
+def main(backends: List[str], runs: int, threads: Optional[int]) -> None:
+    rows, vectors = [], {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for backend in backends:
+            out_path = os.path.join(tmp, f"{backend}.npy")
+            result = _run_backend(backend, runs, threads, out_path)
+            if result is not None:
+                rows.append(result)
+                vectors[backend] = np.load(out_path)
+
+    print(f"{'backend':>9} | {'load(s)':>7} | {'load MB':>8} | {'rss MB':>7} | {'peak MB':>7} | {'p50(ms)':>7} | {'p95(ms)':>7} | {'batch/s':>7} | cos min/mean vs torch")
+    for r in rows:
+        parity = cosine_parity(vectors["torch"], vectors[r["backend"]]) if "torch" in vectors else None
+        cos = f"{parity['min']:.4f}/{parity['mean']:.4f}" if parity else "-"
+        print(
+            f"{r['backend']:>9} | {r['load_s']:>7.1f} | {r['rss_model_mb']:>8.0f} | {r['rss_mb']:>7.0f} | {r['peak_rss_mb']:>7.0f} | "
+            f"{r['p50_ms']:>7.1f} | {r['p95_ms']:>7.1f} | {r['batch_tps']:>7.1f} | {cos}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Latency / RSS / cosine của các backend embedding trên CPU")
+    parser.add_argument("--backends", nargs="+", choices=EMBEDDING_BACKENDS, default=list(EMBEDDING_BACKENDS))
+    parser.add_argument("--runs", type=int, default=50, help="số lần encode một câu để đo p50 / p95")
+    parser.add_argument("--threads", type=int, default=None, help="số thread CPU (torch + OMP_NUM_THREADS), mặc định để thư viện tự chọn")
+    parser.add_argument("--worker", choices=EMBEDDING_BACKENDS, default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--out", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        _worker(args.worker, args.runs, args.threads, args.out)
+    else:
+        main(args.backends, args.runs, args.threads)
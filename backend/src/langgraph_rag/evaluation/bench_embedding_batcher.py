@@ -0,0 +1,105 @@
+"""
+Benchmark EmbeddingBatcher: throughput và latency thêm vào mỗi lời gọi encode khi nhiều request gọi đồng thời.
+
+run (từ thư mục backend/):
+    python -m src.langgraph_rag.evaluation.bench_embedding_batcher --requests 256 --concurrency 1 4 16 --wait-ms 0 2 5 10
+
+Mặc định chạy trên CPU (ẩn GPU qua CUDA_VISIBLE_DEVICES), --device auto để model tự chọn thiết bị.
+Embedding cache tắt và mỗi lời gọi là một câu khác nhau, nên mọi câu đều thật sự đi qua model.
+Dòng "off" là đường cũ: mỗi lời gọi encode một câu trong model executor; các dòng còn lại gom qua batcher với max_wait_ms tương ứng.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from typing import List, Optional
+
+DEFAULT_QUESTIONS = [
+    "Hồ sơ gia hạn tạm trú gồm những giấy tờ gì ?",
+    "Thủ tục đăng ký thường trú cần những gì?",
+    "Chỗ nào không được phép đăng ký tạm trú mới?",
+    "Thời hạn giải quyết đăng ký tạm trú là bao lâu?",
+    "Luật cư trú quy định quyền của công dân như thế nào?",
+    "Người chưa thành niên đăng ký thường trú ở đâu?",
+]
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+    return ordered[idx]
+
+
+async def _run_level(encode, n_requests: int, concurrency: int, offset: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+
+    async def one(i: int) -> None:
+        # số thứ tự làm mỗi câu khác nhau: không có câu trùng để batcher gộp
+        text = f"{DEFAULT_QUESTIONS[i % len(DEFAULT_QUESTIONS)]} ({offset + i})"
+        async with semaphore:
+            t0 = time.perf_counter()
+            await encode([text])
+            latencies.append(time.perf_counter() - t0)
+
+    t_start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(n_requests)))
+    wall = time.perf_counter() - t_start
+    return {
+        "wall_s": wall,
+        "throughput": n_requests / wall if wall > 0 else 0.0,
+        "p50_ms": 1000 * statistics.median(latencies),
+        "p95_ms": 1000 * _percentile(latencies, 0.95),
+    }
+
+
+async def main(n_requests: int, levels: List[int], waits: List[float], max_batch_size: Optional[int]) -> None:
+    from ..embeddings.embedding_batcher import EmbeddingBatcher
+    from ..embeddings.qwen_embedding_model import QwenEmbeddingModel
+    from ..utils.async_utils import init_model_executor, run_in_model_executor
+    from ..utils.config_utils import BaseConfig
+
+    config = BaseConfig()
+    config.embedding_cache_enabled = False
+    config.embedding_batcher_enabled = False
+    init_model_executor(config.model_executor_workers)
+    model = QwenEmbeddingModel(global_config=config)
+    batch_size = max_batch_size or model.embedding_config.encode_params["batch_size"]
+    model._encode(DEFAULT_QUESTIONS)  # warm-up
+
+    async def unbatched(texts: List[str]):
+        return await run_in_model_executor(model._encode, texts)
+
+    print(f"max_batch_size={batch_size} requests={n_requests}")
+    print(f"{'batcher':>9} | {'conc':>4} | {'texts/s':>8} | {'p50(ms)':>8} | {'p95(ms)':>8} | {'batch':>5} | {'wait(ms)':>8} | speedup")
+    offset = 0
+    for level in levels:
+        baseline = None
+        for wait in [None] + waits:
+            batcher = None if wait is None else EmbeddingBatcher(model._encode, max_batch_size=batch_size, max_wait_ms=wait)
+            r = await _run_level(batcher.aencode if batcher else unbatched, n_requests, level, offset)
+            offset += n_requests
+            stats = batcher.stats() if batcher else {"mean_batch_size": 1.0, "mean_wait_ms": 0.0}
+            if batcher:
+                batcher.close()
+            baseline = baseline or r["throughput"]
+            label = "off" if wait is None else f"{wait:g}ms"
+            print(
+                f"{label:>9} | {level:>4} | {r['throughput']:>8.1f} | {r['p50_ms']:>8.1f} | {r['p95_ms']:>8.1f} | "
+                f"{stats['mean_batch_size']:>5.1f} | {stats['mean_wait_ms']:>8.2f} | x{r['throughput'] / baseline:.2f}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Throughput / latency của embedding micro-batcher")
+    parser.add_argument("--requests", type=int, default=256)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--wait-ms", type=float, nargs="+", default=[0, 2, 5, 10], help="các giá trị max_wait_ms cần so sánh")
+    parser.add_argument("--max-batch-size", type=int, default=None, help="mặc định embedding batch_size trong configs.yaml")
+    parser.add_argument("--device", choices=["cpu", "auto"], default="cpu")
+    args = parser.parse_args()
+    if args.device == "cpu":
+        # phải đặt trước khi import torch / sentence_transformers
+        os.environ["CUDA_VISIBLE_DEVICES"] = ""
+    asyncio.run(main(args.requests, args.concurrency, args.wait_ms, args.max_batch_size))
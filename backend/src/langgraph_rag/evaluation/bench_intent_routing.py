@@ -0,0 +1,76 @@
+"""
+Đo classifier intent cục bộ so với LLM định tuyến (QueryRoute) trên một tập câu hỏi có nhãn.
+
+run (từ thư mục backend/):
+    python -m src.langgraph_rag.evaluation.bench_intent_routing --data questions.jsonl
+    python -m src.langgraph_rag.evaluation.bench_intent_routing --data questions.jsonl --margins 0.02 0.05 0.1
+
+Cần model đã huấn luyện (python -m src.langgraph_rag.prompts.intent_classifier ...), dữ liệu cùng định dạng JSONL có nhãn.
+Mỗi câu hỏi được định tuyến bằng LLM (LLM cache tắt) để lấy latency thật; với từng ngưỡng margin báo:
+tỉ lệ định tuyến cục bộ, tỉ lệ chắc chắn nhưng vẫn gọi LLM để lấy bộ lọc (route_filters), độ chính xác trên phần cục bộ,
+và latency tiết kiệm = latency LLM của các câu định tuyến cục bộ
+trừ thời gian classifier.
+"""
+import argparse
+import statistics
+import time
+from typing import List
+
+import numpy as np
+
+from ..embeddings.qwen_embedding_model import QwenEmbeddingModel
+from ..prompts.intent_classifier import IntentClassifier, _read_examples, label_of
+from ..prompts.query_route import QueryRoute
+from ..utils.config_utils import BaseConfig
+
+
+def run(data: str, margins: List[float]) -> None:
+    config = BaseConfig()
+    config.llm_cache_policies = {name: {"enabled": False} for name in ("default", "routing", "general", "context")}
+    classifier = IntentClassifier(config)
+    if not classifier.ready:
+        raise SystemExit(f"No trained intent classifier at {classifier.model_path}")
+
+    examples = [(question, label) for question, label in _read_examples(data) if label is not None]
+    questions = [question for question, _ in examples]
+    labels = [label for _, label in examples]
+    vectors = np.asarray(QwenEmbeddingModel(global_config=config).batch_encode([q.lower() for q in questions]))
+
+    router = QueryRoute(config)
+    llm_seconds, llm_labels = [], []
+    for question in questions:
+        started = time.perf_counter()
+        intents, _ = router.query_route(question)
+        llm_seconds.append(time.perf_counter() - started)
+        llm_labels.append(label_of(intents if isinstance(intents, dict) else {}))
+
+    local_seconds = []
+    for vector in vectors:
+        started = time.perf_counter()
+        classifier.predict(vector)
+        local_seconds.append(time.perf_counter() - started)
+
+    print(f"questions={len(questions)} llm p50={statistics.median(llm_seconds) * 1000:.0f}ms local p50={statistics.median(local_seconds) * 1000:.2f}ms")
+    print(f"llm accuracy={100 * sum(a == b for a, b in zip(llm_labels, labels)) / max(1, len(labels)):.1f}%")
+    print(f"{'margin':>6} | {'local%':>6} | {'filter%':>7} | {'local acc%':>10} | {'overall acc%':>12} | {'saved total(s)':>14} | {'saved/question(ms)':>18}")
+    for margin in margins:
+        classifier.min_margin = margin
+        predictions = classifier.predict_many(vectors)
+        local = [i for i, p in enumerate(predictions) if p.local]
+        filtered = sum(p.confident and p.needs_filters for p in predictions)
+        routed = [predictions[i].label if i in local else llm_labels[i] for i in range(len(labels))]
+        saved = sum(llm_seconds[i] - local_seconds[i] for i in local)
+        print(
+            f"{margin:>6.3f} | {100 * len(local) / max(1, len(labels)):>5.1f}% | {100 * filtered / max(1, len(labels)):>6.1f}% | "
+            f"{100 * sum(predictions[i].label == labels[i] for i in local) / max(1, len(local)):>9.1f}% | "
+            f"{100 * sum(a == b for a, b in zip(routed, labels)) / max(1, len(labels)):>11.1f}% | "
+            f"{saved:>14.2f} | {1000 * saved / max(1, len(labels)):>18.0f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tỉ lệ định tuyến cục bộ, độ chính xác và latency tiết kiệm của classifier intent")
+    parser.add_argument("--data", required=True, help=".jsonl có nhãn (question + intents | label)")
+    parser.add_argument("--margins", type=float, nargs="+", default=None, help="các ngưỡng min_margin cần so sánh")
+    args = parser.parse_args()
+    run(args.data, args.margins or [BaseConfig().intent_classifier_min_margin])
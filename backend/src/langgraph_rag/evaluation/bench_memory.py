@@ -0,0 +1,104 @@
+"""
+So sánh prompt tokens và latency giữa hai chế độ bộ nhớ hội thoại (window / summary) trên một session nhiều lượt.
+
+run (từ thư mục backend/):
+    python -m src.langgraph_rag.evaluation.bench_memory --turns 30
+
+Semantic cache và LLM cache được tắt để mọi lượt đều gọi LLM thật.
+Ở chế độ summary, benchmark chờ tác vụ tóm tắt nền xong trước lượt kế tiếp (tương đương thời gian người dùng gõ câu mới).
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+from typing import Any, Dict, List
+
+from ..nodes import RAGWorkflowNodes, create_default_rag_state
+from ..utils.config_utils import BaseConfig
+from ..workflows import arun_workflow, create_rag_workflow
+
+
+SESSION_QUESTIONS = [
+    "Tôi tên là Văn, sinh năm 1999, đang thuê trọ ở Hà Nội.",
+    "Tôi muốn đăng ký tạm trú thì cần những giấy tờ gì?",
+    "Nộp hồ sơ ở đâu?",
+    "Thời hạn giải quyết là bao lâu?",
+    "Nếu chủ nhà không đồng ý thì sao?",
+    "Tạm trú có thời hạn tối đa bao lâu?",
+    "Khi hết hạn tạm trú tôi phải làm gì?",
+    "Hồ sơ gia hạn tạm trú gồm những gì?",
+    "Chỗ nào không được phép đăng ký tạm trú mới?",
+    "Tôi có thể đăng ký thường trú ở chỗ thuê không?",
+    "Điều kiện đăng ký thường trú tại chỗ ở thuê là gì?",
+    "Diện tích nhà thuê tối thiểu là bao nhiêu?",
+    "Luật cư trú quy định quyền của công dân như thế nào?",
+    "Không đăng ký tạm trú thì bị phạt thế nào?",
+    "cảm ơn bạn",
+]
+
+
+def _bench_config(mode: str) -> BaseConfig:
+    config = BaseConfig()
+    config.session_memory_mode = mode
+    config.semantic_cache_enabled = False
+    config.llm_cache_policies = {name: {"enabled": False} for name in ("default", "routing", "general", "context")}
+    return config
+
+
+async def _run_session(mode: str, turns: int) -> List[Dict[str, Any]]:
+    nodes = RAGWorkflowNodes(global_config=_bench_config(mode))
+    app = create_rag_workflow(nodes)
+    session_id = f"bench-{mode}-{uuid.uuid4().hex[:8]}"
+
+    rows = []
+    for turn in range(turns):
+        question = SESSION_QUESTIONS[turn % len(SESSION_QUESTIONS)]
+        history = nodes.session_store.get(session_id)
+        state = create_default_rag_state(question=question, conversation_history=history, session_id=session_id)
+        result = await arun_workflow(app, state)
+        metadata = result.get("execution_metadata", {})
+        rows.append({
+            "turn": turn + 1,
+            "history_messages": len(history),
+            "prompt_tokens": (metadata.get("llm_usage") or {}).get("prompt_tokens") or 0,
+            "budget_tokens": (metadata.get("prompt_budget") or {}).get("tokens_after") or 0,
+            "latency_s": metadata.get("latency_s") or 0.0,
+        })
+
+        t0 = time.perf_counter()
+        await nodes.conversation_memory.wait_idle()
+        rows[-1]["summary_wait_s"] = time.perf_counter() - t0
+
+    rows.append({"memory": nodes.conversation_memory.stats()})
+    return rows
+
+
+def _print_mode(mode: str, rows: List[Dict[str, Any]]) -> None:
+    memory = rows[-1]["memory"]
+    rows = rows[:-1]
+    print(f"\n=== memory_mode={mode} ===")
+    print(f"{'turn':>4} | {'history':>7} | {'prompt_tok':>10} | {'budget_tok':>10} | {'latency(s)':>10}")
+    for r in rows:
+        if r["turn"] == 1 or r["turn"] % 5 == 0:
+            print(f"{r['turn']:>4} | {r['history_messages']:>7} | {r['prompt_tokens']:>10} | {r['budget_tokens']:>10} | {r['latency_s']:>10.2f}")
+    tokens = [r["prompt_tokens"] for r in rows]
+    latencies = [r["latency_s"] for r in rows]
+    print(
+        f"mean prompt tokens={statistics.mean(tokens):.0f}  last={tokens[-1]}  "
+        f"mean latency={statistics.mean(latencies):.2f}s  p50={statistics.median(latencies):.2f}s  "
+        f"summaries={memory.get('summaries', 0)} (summary tokens={memory.get('summary_tokens', 0)})"
+    )
+
+
+async def main(turns: int, modes: List[str]) -> None:
+    for mode in modes:
+        _print_mode(mode, await _run_session(mode, turns))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="So sánh prompt tokens / latency giữa memory_mode window và summary")
+    parser.add_argument("--turns", type=int, default=30)
+    parser.add_argument("--modes", nargs="+", default=["window", "summary"])
+    args = parser.parse_args()
+    asyncio.run(main(args.turns, args.modes))
@@ -0,0 +1,158 @@
+"""
+Đo phần tiền tố prompt dùng lại được (provider-side prompt caching) giữa bố cục cũ và bố cục tiền tố ổn định.
+
+- Bố cục cũ: lịch sử + [system: chỉ dẫn + tài liệu] + [user: câu hỏi] -> tiền tố đổi ngay khi lịch sử hoặc tài liệu đổi.
+- Bố cục mới: [system tĩnh] + lịch sử + [user: tài liệu + câu hỏi] -> system chung mọi request, lịch sử chung giữa các lượt.
+
+run (từ thư mục backend/):
+    python -m src.langgraph_rag.evaluation.bench_prompt_prefix --sessions 3 --turns 8
+    python -m src.langgraph_rag.evaluation.bench_prompt_prefix --live   # gọi model thật, LLM cache tắt
+
+Chế độ phân tích chỉ đếm token bằng tokenizer cục bộ: "reusable" = số token đầu prompt trùng với một request trước đó
+(cùng session hoặc session khác) — phần provider có thể tính giá cache read thay cho giá input.
+Chế độ --live đo latency và cache_read_tokens / cache_write_tokens do provider trả về, có và không có marker prompt cache.
+"""
+import argparse
+import statistics
+import time
+from typing import Any, Dict, List, Optional
+
+from ..prompts.prompt_builder import PromptBuilder
+from ..prompts.system_prompt import GenerateAnswer, INTENT_TEMPLATE
+from ..utils.config_utils import BaseConfig
+from ..utils.llm_utils import TextChatMessage, message_text
+from ..utils.token_utils import get_token_counter
+
+
+SESSION_QUESTIONS = [
+    "Tôi muốn đăng ký tạm trú thì cần những giấy tờ gì?",
+    "Nộp hồ sơ ở đâu?",
+    "Thời hạn giải quyết là bao lâu?",
+    "Tạm trú có thời hạn tối đa bao lâu?",
+    "Hồ sơ gia hạn tạm trú gồm những gì?",
+    "Tôi có thể đăng ký thường trú ở chỗ thuê không?",
+    "Điều kiện đăng ký thường trú tại chỗ ở thuê là gì?",
+    "Không đăng ký tạm trú thì bị phạt thế nào?",
+]
+
+SAMPLE_DOCUMENTS = [
+    {"procedure_name": "Đăng ký tạm trú", "content": "Hồ sơ gồm tờ khai thay đổi thông tin cư trú (mẫu CT01) và giấy tờ, tài liệu chứng minh chỗ ở hợp pháp."},
+    {"procedure_name": "Đăng ký tạm trú", "content": "Nộp hồ sơ tại cơ quan đăng ký cư trú nơi dự kiến tạm trú; thời hạn giải quyết 03 ngày làm việc."},
+    {"procedure_name": "Gia hạn tạm trú", "content": "Trong thời hạn 15 ngày trước ngày kết thúc thời hạn tạm trú, công dân phải làm thủ tục gia hạn tạm trú."},
+    {"procedure_name": "Đăng ký thường trú", "content": "Công dân được đăng ký thường trú tại chỗ ở thuê khi được chủ sở hữu đồng ý và bảo đảm diện tích tối thiểu."},
+    {"procedure_name": "Xử phạt hành chính về cư trú", "content": "Không thực hiện đăng ký tạm trú bị phạt cảnh cáo hoặc phạt tiền từ 500.000 đồng đến 1.000.000 đồng."},
+]
+
+
+def _documents(turn: int, count: int = 3) -> List[Dict[str, Any]]:
+    """Tài liệu thay đổi theo lượt như kết quả retrieval thật."""
+    picked = [(turn + i) % len(SAMPLE_DOCUMENTS) for i in range(count)]
+    return [
+        {"id": f"doc-{i}", "rerank_score": 1.0 - rank * 0.1, "payload": dict(SAMPLE_DOCUMENTS[i])}
+        for rank, i in enumerate(picked)
+    ]
+
+
+def _legacy_layout(system: str, history: List[TextChatMessage], context: str, user: str) -> List[TextChatMessage]:
+    """Bố cục trước thay đổi: ngữ cảnh nằm trong system message, đứng sau lịch sử hội thoại."""
+    return list(history) + [
+        {"role": "system", "content": f"{system}\n\nTài liệu trích xuất:\n{context}"},
+        {"role": "user", "content": user},
+    ]
+
+
+def _serialize(messages: List[TextChatMessage]) -> str:
+    return "".join(f"<|{m['role']}|>{message_text(m['content'])}\n" for m in messages)
+
+
+def _common_prefix(a: str, b: str) -> int:
+    n = min(len(a), len(b))
+    i = 0
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+
+def _session_prompts(builder: PromptBuilder, session: int, turns: int) -> Dict[str, List[str]]:
+    history: List[TextChatMessage] = []
+    prompts: Dict[str, List[str]] = {"legacy": [], "stable": []}
+    for turn in range(turns):
+        question = SESSION_QUESTIONS[(session + turn) % len(SESSION_QUESTIONS)]
+        built = builder.build(INTENT_TEMPLATE, question, history, documents=_documents(session + turn))
+        prompts["stable"].append(_serialize(built.messages))
+        prompts["legacy"].append(_serialize(_legacy_layout(built.system, built.history, builder.render_documents(built.documents), built.user)))
+        history = history + [{"role": "user", "content": question}, {"role": "assistant", "content": f"Trả lời lượt {turn + 1}: " + SAMPLE_DOCUMENTS[turn % len(SAMPLE_DOCUMENTS)]["content"]}]
+    return prompts
+
+
+def analyse(config: BaseConfig, sessions: int, turns: int) -> None:
+    builder = PromptBuilder(config)
+    counter = get_token_counter(config.prompt_budget_tokenizer)
+    all_prompts = [_session_prompts(builder, s, turns) for s in range(sessions)]
+
+    print(f"{'layout':>7} | {'requests':>8} | {'input_tok':>9} | {'reusable_tok':>12} | {'reusable%':>9} | {'est. billed':>11}")
+    for layout in ("legacy", "stable"):
+        seen: List[str] = []
+        total = reusable = 0
+        for prompts in all_prompts:
+            for prompt in prompts[layout]:
+                tokens = counter.count(prompt)
+                shared = max((_common_prefix(prompt, earlier) for earlier in seen), default=0)
+                reused = counter.count(prompt[:shared]) if shared else 0
+                total += tokens
+                reusable += reused
+                seen.append(prompt)
+        # giá cache read của Bedrock ~10% giá input (bỏ qua phụ phí ghi cache lần đầu)
+        billed = total - reusable + 0.1 * reusable
+        print(f"{layout:>7} | {sessions * turns:>8} | {total:>9} | {reusable:>12} | {100 * reusable / max(1, total):>8.1f}% | {billed:>11.0f}")
+
+
+def _live_run(config: BaseConfig, prompt_cache: bool, sessions: int, turns: int) -> List[Dict[str, Any]]:
+    config.prompt_cache_enabled = prompt_cache
+    answer = GenerateAnswer(config)
+    rows = []
+    for session in range(sessions):
+        history: List[TextChatMessage] = []
+        for turn in range(turns):
+            question = SESSION_QUESTIONS[(session + turn) % len(SESSION_QUESTIONS)]
+            metadata: Dict[str, Any] = {}
+            started = time.perf_counter()
+            first_token_s: Optional[float] = None
+            chunks = []
+            for delta in answer.stream_intent(question, "", history, metadata=metadata, documents=_documents(session + turn)):
+                if first_token_s is None:
+                    first_token_s = time.perf_counter() - started
+                chunks.append(delta)
+            rows.append({
+                "ttft_s": first_token_s or 0.0,
+                "latency_s": time.perf_counter() - started,
+                "prompt_tokens": metadata.get("prompt_tokens") or 0,
+                "cache_read_tokens": metadata.get("cache_read_tokens") or 0,
+                "cache_write_tokens": metadata.get("cache_write_tokens") or 0,
+            })
+            history = history + [{"role": "user", "content": question}, {"role": "assistant", "content": "".join(chunks).strip()}]
+    return rows
+
+
+def live(sessions: int, turns: int) -> None:
+    print(f"\n{'marker':>6} | {'prompt_tok':>10} | {'cache_read':>10} | {'cache_write':>11} | {'p50 ttft(s)':>11} | {'p50 latency(s)':>14}")
+    for prompt_cache in (False, True):
+        config = BaseConfig()
+        config.llm_cache_policies = {name: {"enabled": False} for name in ("default", "routing", "general", "context")}
+        rows = _live_run(config, prompt_cache, sessions, turns)
+        print(
+            f"{str(prompt_cache):>6} | {sum(r['prompt_tokens'] for r in rows):>10} | {sum(r['cache_read_tokens'] for r in rows):>10} | "
+            f"{sum(r['cache_write_tokens'] for r in rows):>11} | {statistics.median(r['ttft_s'] for r in rows):>11.2f} | "
+            f"{statistics.median(r['latency_s'] for r in rows):>14.2f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Đo phần tiền tố prompt cache được: bố cục cũ vs bố cục tiền tố ổn định")
+    parser.add_argument("--sessions", type=int, default=3)
+    parser.add_argument("--turns", type=int, default=8)
+    parser.add_argument("--live", action="store_true", help="gọi model thật (có / không marker prompt cache), LLM cache tắt")
+    args = parser.parse_args()
+    analyse(BaseConfig(), args.sessions, args.turns)
+    if args.live:
+        live(args.sessions, args.turns)
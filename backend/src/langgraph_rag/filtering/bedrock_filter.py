@@ -1,3 +1,5 @@
+from typing import Optional
+
 import boto3
 from instructor import from_bedrock, Mode
 from qdrant_client.models import Filter, Condition
@@ -6,6 +8,7 @@ from pydantic import BaseModel
 from .base import BaseFilterConfig, FilterConfig
 from ..utils.config_utils import BaseConfig
 from ..utils.logger_utils import get_logger
+from ..utils.resilience_utils import CircuitOpenError, get_resilient_caller
 
 logger = get_logger(__name__)
 
@@ -30,6 +33,7 @@ class BedrockFilter(BaseFilterConfig):
 
         self._init_filter_llm_config()
         self.llm_filter_client = self._setup_llm_client()
+        self.resilience = get_resilient_caller(f"filter:{self.llm_config.filter_llm_name}", global_config)
     
     def _init_filter_llm_config(self):
         config_dict = self.global_config.__dict__
@@ -49,15 +53,22 @@ class BedrockFilter(BaseFilterConfig):
             mode=Mode.BEDROCK_JSON,
         )
     
-    def automate_filtering(self, user_query, formatted_indexes, filter_prompt) -> Filter:
-        response = self.llm_filter_client.messages.create(
-        response_model=QdrantFilterWrapper,
-        messages=[
-            {"role": "user", "content": filter_prompt.strip()},
-            {"role": "assistant", "content": "Đã hiểu. Tôi sẽ tuân thủ các quy tắc."},
-            {"role": "user", "content": f"<query>{user_query}</query>\n<indexes>\n{formatted_indexes}\n</indexes>"}
-            ]
-        )
+    def automate_filtering(self, user_query, formatted_indexes, filter_prompt) -> Optional[Filter]:
+        """Mạch của model lọc đang mở -> trả None (truy xuất không lọc) thay vì chờ Bedrock."""
+        try:
+            response = self.resilience.call(
+                "filter",
+                self.llm_filter_client.messages.create,
+                response_model=QdrantFilterWrapper,
+                messages=[
+                    {"role": "user", "content": filter_prompt.strip()},
+                    {"role": "assistant", "content": "Đã hiểu. Tôi sẽ tuân thủ các quy tắc."},
+                    {"role": "user", "content": f"<query>{user_query}</query>\n<indexes>\n{formatted_indexes}\n</indexes>"}
+                ]
+            )
+        except CircuitOpenError as e:
+            logger.warning(f"[BedrockFilter] {e}, searching without filter")
+            return None
 
         return response.to_qdrant_filter()
 
@@ -34,7 +34,7 @@ qf = filterer.build(spec)  # qdrant_client.http.models.Filter OR plain dict
 import json
 from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
 
-from .base_filter import BaseFilterConfig, FilterConfig
+from .base import FilterConfig
 from ..utils.config_utils import BaseConfig
 from ..utils.logger_utils import get_logger
 
@@ -62,7 +62,7 @@ FilterLike = Union[dict, "QFilter"]
 ConditionLike = Union[dict, "QFieldCondition", "QIsEmptyCondition"]
 
 
-class QdrantFilterProcedure(BaseFilterConfig):
+class QdrantFilterProcedure:
     """Builds Qdrant-compatible filters for the *procedure* domain.
 
     Input spec format (permissive):
@@ -76,17 +76,22 @@ class QdrantFilterProcedure(BaseFilterConfig):
     - op omitted => "eq"
     - value is list/tuple => defaults to op "in"
     - A group value can be a single dict instead of a list
+
+    No LLM here (not a BaseFilterConfig): the spec comes from the caller,
+    e.g. QueryRoute's combined routing + filter call.
     """
 
-    def __init__(self, global_config: Optional[Any] = None) -> None:
-        super().__init__(global_config)
+    global_config: BaseConfig
+    filter_config: FilterConfig
+
+    def __init__(self, global_config: Optional[BaseConfig] = None) -> None:
+        self.global_config = global_config if global_config is not None else BaseConfig()
 
         self._init_filter_config()
-        
 
     def _init_filter_config(self) -> None:
-        # You can inject domain defaults using your global_config
-        base: Dict[str, Any] = getattr(self.global_config, "__dict__", {})
+        # You can inject domain defaults using your global_config (copied: do not mutate the shared config)
+        base: Dict[str, Any] = dict(getattr(self.global_config, "__dict__", {}))
 
         # Allowed payload schema (lightweight typing for coercion)
         allowed_fields: Dict[str, str] = {
@@ -126,7 +131,7 @@ class QdrantFilterProcedure(BaseFilterConfig):
         })
 
         self.filter_config = FilterConfig.from_dict(config_dict=base)
-        logger.info("[QdrantFilterProcedure] FilterConfig initialized: %s", self.filter_config)
+        logger.debug("[QdrantFilterProcedure] FilterConfig initialized: %s", self.filter_config)
 
     # ------------------------------ Public API ----------------------------- #
     def build(self, spec: Union[str, Dict[str, Any]], *, prefer_models: bool = True) -> FilterLike:
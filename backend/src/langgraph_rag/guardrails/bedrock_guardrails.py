@@ -2,7 +2,9 @@ from copy import deepcopy
 import boto3
 
 from .base import BaseGuardrailsConfig, GuardrailsConfig
+from .offline_guardrails import OfflineGuardrailsClient
 from ..utils.logger_utils import get_logger
+from ..utils.resilience_utils import CircuitOpenError, get_resilient_caller
 
 logger = get_logger(__name__)
 
@@ -13,13 +15,30 @@ class BedrockGuardrails(BaseGuardrailsConfig):
         super().__init__(global_config)
 
         self._init_guarldrails_config()
-        self.bedrock_runtime = boto3.client("bedrock-runtime", region_name=self.guardrail_config.region_name)
+        self.bedrock_runtime = self._setup_client()
+        self.resilience = get_resilient_caller(f"guardrail:{self.global_config.guardrails_id}", self.global_config)
     
+    def _setup_client(self):
+        if not self.global_config.offline_enabled:
+            return boto3.client("bedrock-runtime", region_name=self.guardrail_config.region_name)
+        if self.global_config.offline_mode == "server":
+            # offline_server phục vụ cùng đường dẫn ApplyGuardrail; credential giả chỉ để boto3 ký request
+            return boto3.client(
+                "bedrock-runtime",
+                region_name=self.guardrail_config.region_name,
+                endpoint_url=self.global_config.offline_base_url,
+                aws_access_key_id="offline",
+                aws_secret_access_key="offline",
+            )
+        return OfflineGuardrailsClient(self.global_config)
+
     def _init_guarldrails_config(self) -> None:
         config_dict = self.global_config.__dict__
+        offline = self.global_config.offline_enabled
         config_dict["guardrails_params"] = {
-            "guardrailIdentifier": self.global_config.guardrails_id,
-            "guardrailVersion": self.global_config.guardrails_version,
+            # stand-in cục bộ không cần guardrail thật được cấu hình trong .env
+            "guardrailIdentifier": self.global_config.guardrails_id or ("offline" if offline else None),
+            "guardrailVersion": self.global_config.guardrails_version or ("DRAFT" if offline else None),
         }
         config_dict["region_name"] = self.global_config.guardrails_region_name
         self.guardrail_config = GuardrailsConfig.from_dict(config_dict=config_dict)
@@ -28,12 +47,14 @@ class BedrockGuardrails(BaseGuardrailsConfig):
 
 
     def apply_guardrail(self, text: str, source_type: str) -> dict:
-        self.guardrail_config.guardrails_params["source"] = source_type
-        self.guardrail_config.guardrails_params["content"] = [{"text": {"text": text}}]
-   
+        """Mạch guardrail đang mở -> trả ngay {"error", "degraded": True}, nơi gọi quyết định chặn hay bỏ qua."""
+        # params riêng cho mỗi lời gọi: input / output guardrail chạy đồng thời từ nhiều request
+        params = deepcopy(self.guardrail_config.guardrails_params)
+        params["source"] = source_type
+        params["content"] = [{"text": {"text": text}}]
 
         try:
-            response = self.bedrock_runtime.apply_guardrail(**self.guardrail_config.guardrails_params)
+            response = self.resilience.call("apply_guardrail", self.bedrock_runtime.apply_guardrail, **params)
             action = response.get("action", "N/A")
             outputs = response.get("outputs", [])
             assessments = response.get("assessments", [])
@@ -43,6 +64,9 @@ class BedrockGuardrails(BaseGuardrailsConfig):
                 "outputs": outputs,
                 "assessments": assessments
             }
+        except CircuitOpenError as e:
+            logger.warning(f"[BedrockGuardrails] {e}")
+            return {"error": str(e), "degraded": True}
         except Exception as e:
             return {"error": str(e)}
 
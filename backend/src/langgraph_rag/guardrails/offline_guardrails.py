@@ -0,0 +1,55 @@
+import random
+import threading
+import time
+from typing import Any, Dict, List
+
+from ..llm.offline_llm import LatencyModel, SimulatedServiceError
+from ..utils.config_utils import BaseConfig
+from ..utils.logger_utils import get_logger
+
+logger = get_logger(__name__)
+
+BLOCKED_MESSAGE = "Xin lỗi, nội dung này vi phạm chính sách sử dụng nên không thể được xử lý."
+
+
+def guardrail_response(text: str, blocked_terms: List[str]) -> Dict[str, Any]:
+    """Response cùng dạng với bedrock-runtime apply_guardrail (action / outputs / assessments / usage)."""
+    lowered = text.lower()
+    hits = [term for term in blocked_terms if term and term.lower() in lowered]
+    characters = len(text)
+    return {
+        "action": "GUARDRAIL_INTERVENED" if hits else "NONE",
+        "outputs": [{"text": BLOCKED_MESSAGE}] if hits else [],
+        "assessments": [{
+            "wordPolicy": {"customWords": [{"match": term, "action": "BLOCKED"} for term in hits]},
+            "invocationMetrics": {
+                "guardrailProcessingLatency": 0,
+                "usage": {"wordPolicyUnits": 1},
+                "guardrailCoverage": {"textCharacters": {"guarded": characters, "total": characters}},
+            },
+        }],
+        "usage": {"wordPolicyUnits": 1},
+    }
+
+
+class OfflineGuardrailsClient:
+    """
+    Thay cho client boto3 "bedrock-runtime" của BedrockGuardrails (services.offline.mode = "inprocess"):
+    chặn khi văn bản chứa một trong `offline_blocked_terms`, latency theo `offline_guardrail_latency`.
+    """
+
+    def __init__(self, global_config: BaseConfig):
+        self.blocked_terms = list(global_config.offline_blocked_terms or [])
+        self.latency = LatencyModel.from_config(global_config.offline_guardrail_latency, seed=global_config.offline_seed)
+        self.error_rate = max(0.0, float(global_config.offline_error_rate))
+        self._rng = random.Random(global_config.offline_seed)
+        self._lock = threading.Lock()
+
+    def apply_guardrail(self, guardrailIdentifier: str = None, guardrailVersion: str = None, source: str = "INPUT", content: List[Dict[str, Any]] = None, **kwargs) -> Dict[str, Any]:
+        text = " ".join(item.get("text", {}).get("text", "") for item in (content or []))
+        time.sleep(self.latency.sample())
+        with self._lock:
+            failed = self._rng.random() < self.error_rate
+        if failed:
+            raise SimulatedServiceError("offline: simulated guardrail error")
+        return guardrail_response(text, self.blocked_terms)
@@ -1,5 +1,14 @@
 import os
-from typing import Iterator, List, Tuple
+import atexit
+import asyncio
+import queue
+import random
+import threading
+import weakref
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
 from copy import deepcopy
 import sqlite3
 import json
@@ -7,62 +16,327 @@ import time
 import hashlib
 
 import litellm
-from filelock import FileLock
 
 from .base import BaseLLMConfig, LLMConfig
-from ..utils.llm_utils import TextChatMessage
+from .offline_llm import OfflineLLM
+from ..utils.llm_utils import TextChatMessage, message_text
 from ..utils.logger_utils import get_logger
+from ..utils.async_utils import run_blocking
+from ..utils.metrics_utils import CACHE_EVENTS_TOTAL
+from ..utils.resilience_utils import CircuitOpenError, ResilientCaller, get_resilient_caller
+from ..utils.token_utils import get_token_counter
 
 logger = get_logger(__name__)
 
+# Semaphore giới hạn số lời gọi Bedrock async đang chạy theo từng model, dùng chung cho mọi instance BedrockLLM.
+# asyncio.Semaphore gắn với event loop nên mỗi loop có một bộ riêng.
+_MODEL_SEMAPHORES: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Semaphore]]" = weakref.WeakKeyDictionary()
+
+
+def _model_semaphore(model: str, limit: int) -> asyncio.Semaphore:
+    per_loop = _MODEL_SEMAPHORES.setdefault(asyncio.get_running_loop(), {})
+    sem = per_loop.get(model)
+    if sem is None:
+        sem = per_loop[model] = asyncio.Semaphore(max(1, int(limit)))
+    return sem
+
+
+def _backoff_delay(attempt: int, base_s: float, max_s: float) -> float:
+    """Exponential backoff với full jitter: ngẫu nhiên trong [0, min(max_s, base_s * 2^(attempt-1))]."""
+    return random.uniform(0, min(max_s, base_s * (2 ** (attempt - 1))))
+
+
+# Model đã từ chối marker prompt cache (cache_control): không gắn marker nữa cho tới khi restart process.
+_PROMPT_CACHE_REJECTED: set = set()
+
+
+def _has_prompt_cache_marker(messages: List[TextChatMessage]) -> bool:
+    return any(
+        isinstance(m.get("content"), list) and any(isinstance(p, dict) and "cache_control" in p for p in m["content"])
+        for m in messages
+    )
+
+
+def _strip_prompt_cache(messages: List[TextChatMessage]) -> List[TextChatMessage]:
+    return [
+        {**m, "content": message_text(m["content"])} if isinstance(m.get("content"), list) else m
+        for m in messages
+    ]
+
+
+def _is_prompt_cache_rejection(error: Exception) -> bool:
+    """Lỗi 400 / ValidationException nhắc tới cache (cache_control, cachePoint, prompt caching)."""
+    bad_request = getattr(error, "status_code", None) == 400 or type(error).__name__ in ("BadRequestError", "ValidationException")
+    return bad_request and "cach" in str(error).lower()
+
+
+
+@dataclass
+class CachePolicy:
+    """Chính sách cache cho một nơi gọi LLM (định tuyến, câu trả lời general, câu trả lời theo ngữ cảnh...)."""
+    name: str
+    enabled: bool = True
+    ttl_seconds: int = 0 # 0 = không hết hạn
+
+
+@dataclass
+class ModelTier:
+    """Model và giới hạn sinh cho một tác vụ (routing, general, procedure, legal, escalation)."""
+    task: str
+    model: str
+    max_tokens: Optional[int] = None
+    timeout_s: Optional[float] = None
+    escalate: bool = False # câu trả lời "không tìm thấy" -> hỏi lại model của tier escalation
+
+    def params(self) -> Dict[str, Any]:
+        params: Dict[str, Any] = {"model": self.model}
+        if self.max_tokens:
+            params["max_tokens"] = int(self.max_tokens)
+        if self.timeout_s:
+            params["timeout"] = float(self.timeout_s)
+        return params
 
 
 class LLM_Cache:
-    def __init__(self, cache_dir: str, cache_filename):
+    """
+    Cache kết quả LLM 2 tầng:
+    - Tầng nhớ: LRU trong process (`memory_entries` entry).
+    - Tầng đĩa: SQLite ở chế độ WAL, mỗi thread giữ một connection riêng (không còn FileLock toàn process).
+    Ghi được gom batch bởi một thread nền (không nằm trên đường đi của request);
+    mỗi entry hết hạn theo TTL của chính sách đã ghi nó và bảng bị cắt về `max_entries` entry mới nhất.
+    Khoá = hash chuẩn hoá của toàn bộ tham số sinh + tên chính sách (+ `key_material` thay cho messages nếu có).
+    """
+
+    DEFAULT_POLICY = "default"
+
+    # tham số chỉ ảnh hưởng cách nhận kết quả, không ảnh hưởng nội dung -> không đưa vào khoá
+    _TRANSPORT_PARAMS = ("stream", "stream_options", "timeout")
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS cache (
+            key TEXT PRIMARY KEY,
+            message TEXT,
+            metadata TEXT
+        )
+    """
+
+    def __init__(
+        self,
+        cache_dir: str,
+        cache_filename,
+        ttl_seconds: int = 0,
+        max_entries: int = 100000,
+        memory_entries: int = 1024,
+        flush_interval_s: float = 0.5,
+        policies: Optional[Dict[str, Dict[str, Any]]] = None,
+    ):
         os.makedirs(cache_dir, exist_ok=True)
         self.cache_filepath =  os.path.join(cache_dir, f"{cache_filename}.sqlite")
-        self.lock_file = self.cache_filepath + ".lock"
+        self.ttl_seconds = int(ttl_seconds or 0)
+        self.max_entries = int(max_entries)
+        self.memory_entries = int(memory_entries)
+        self.flush_interval_s = float(flush_interval_s)
+
+        self.policies: Dict[str, CachePolicy] = {
+            self.DEFAULT_POLICY: CachePolicy(self.DEFAULT_POLICY, True, self.ttl_seconds)
+        }
+        for name, cfg in (policies or {}).items():
+            cfg = cfg or {}
+            self.policies[name] = CachePolicy(
+                name=name,
+                enabled=bool(cfg.get("enabled", True)),
+                ttl_seconds=int(cfg.get("ttl_seconds", self.ttl_seconds) or 0),
+            )
 
-        self.__db_operation("""
-            CREATE TABLE IF NOT EXISTS cache (
-                key TEXT PRIMARY KEY,
-                message TEXT,
-                metadata TEXT
+        self._local = threading.local()
+        self._memory: "OrderedDict[str, Tuple[str, dict, float]]" = OrderedDict()
+        self._memory_lock = threading.Lock()
+        self._pending: "queue.Queue[Optional[Tuple[str, str, str, float, float]]]" = queue.Queue()
+
+        self._stats_lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0, "evicted": 0, "read_time_s": 0.0, "reads": 0}
+        self._policy_stats: Dict[str, Dict[str, int]] = {name: {"hits": 0, "misses": 0} for name in self.policies}
+
+        self._init_db()
+        self._writer = threading.Thread(target=self.__writer_loop, name="llm-cache-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.flush)
+
+    # --- sqlite ---
+
+    def __connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.cache_filepath, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_db(self) -> None:
+        conn = self.__connection()
+        conn.execute(self._SCHEMA)
+        # bảng cũ chỉ có (key, message, metadata) -> thêm created_at, coi các dòng cũ như vừa ghi
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(cache)")}
+        if "created_at" not in columns:
+            conn.execute("ALTER TABLE cache ADD COLUMN created_at REAL NOT NULL DEFAULT 0")
+            conn.execute("UPDATE cache SET created_at = ? WHERE created_at = 0", (time.time(),))
+        # hạn dùng theo từng entry (0 = không hết hạn); dòng cũ nhận TTL mặc định
+        if "expires_at" not in columns:
+            conn.execute("ALTER TABLE cache ADD COLUMN expires_at REAL NOT NULL DEFAULT 0")
+            if self.ttl_seconds > 0:
+                conn.execute("UPDATE cache SET expires_at = created_at + ?", (self.ttl_seconds,))
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_created_at ON cache(created_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_expires_at ON cache(expires_at)")
+        conn.commit()
+
+    def __writer_loop(self) -> None:
+        while True:
+            item = self._pending.get()
+            batch = [item]
+            # gom các lần ghi tới trong khoảng flush_interval_s thành một transaction
+            deadline = time.monotonic() + self.flush_interval_s
+            while True:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._pending.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            rows = [row for row in batch if row is not None]
+            try:
+                if rows:
+                    self.__write_rows(rows)
+            except Exception as e:
+                logger.warning(f"[LLM_Cache] Batch write failed: {e}")
+            finally:
+                for _ in batch:
+                    self._pending.task_done()
+
+    def __write_rows(self, rows) -> None:
+        conn = self.__connection()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO cache (key, message, metadata, created_at, expires_at) VALUES (?, ?, ?, ?, ?)", rows
             )
-        """, commit=True)
-    
-    def __db_operation(self, sql, parameters=(), commit=False, fetchone=False):
-        with FileLock(self.lock_file):
-            conn = sqlite3.connect(self.cache_filepath)
-            c = conn.cursor()
-            c.execute(sql, parameters)
-            if commit:
-                conn.commit()
-            if fetchone:
-                row = c.fetchone()
-            conn.close()
-            if fetchone:
-                return row
-
-    def __params_to_key(self, params):
-        key_str = f"Model: {params['model']}, Temperature: {params['temperature']}, Messages: {params['messages']}"
+            evicted = conn.execute(
+                "DELETE FROM cache WHERE expires_at > 0 AND expires_at < ?", (time.time(),)
+            ).rowcount
+            if self.max_entries > 0:
+                (count,) = conn.execute("SELECT COUNT(*) FROM cache").fetchone()
+                if count > self.max_entries:
+                    evicted += conn.execute(
+                        "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY created_at ASC LIMIT ?)",
+                        (count - self.max_entries,),
+                    ).rowcount
+        with self._stats_lock:
+            self._stats["writes"] += len(rows)
+            self._stats["evicted"] += evicted
+
+    # --- memory tier ---
+
+    def __memory_get(self, key: str) -> Optional[Tuple[str, dict, float]]:
+        with self._memory_lock:
+            item = self._memory.get(key)
+            if item is not None:
+                self._memory.move_to_end(key)
+            return item
+
+    def __memory_put(self, key: str, message: str, metadata: dict, expires_at: float) -> None:
+        if self.memory_entries <= 0:
+            return
+        with self._memory_lock:
+            self._memory[key] = (message, metadata, expires_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    @staticmethod
+    def __expired(expires_at: float) -> bool:
+        return expires_at > 0 and time.time() > expires_at
+
+    def __count(self, field: str, policy: str, started: float) -> None:
+        hit = field != "misses"
+        with self._stats_lock:
+            self._stats[field] += 1
+            self._stats["reads"] += 1
+            self._stats["read_time_s"] += time.perf_counter() - started
+            self._policy_stats[policy]["hits" if hit else "misses"] += 1
+        CACHE_EVENTS_TOTAL.inc(cache=f"llm_cache_{policy}", result="hit" if hit else "miss")
+
+    def policy(self, name: Optional[str]) -> CachePolicy:
+        return self.policies.get(name or self.DEFAULT_POLICY) or self.policies[self.DEFAULT_POLICY]
+
+    def key(self, params, policy: str = DEFAULT_POLICY, key_material: Any = None) -> str:
+        """Hash của JSON chuẩn hoá (sort_keys) mọi tham số sinh; `key_material` (nếu có) thay cho messages."""
+        material = {k: v for k, v in params.items() if k not in self._TRANSPORT_PARAMS}
+        if key_material is not None:
+            material["messages"] = key_material
+        material["cache_policy"] = policy
+        key_str = json.dumps(material, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
         return hashlib.sha256(key_str.encode("utf-8")).hexdigest()
 
-    def read(self, params):
-        key = self.__params_to_key(params)
-        row = self.__db_operation("SELECT message, metadata FROM cache WHERE key = ?", (key,), fetchone=True)
-        if row is None:
+    # --- API ---
+
+    def read(self, params, policy: Optional[str] = None, key_material: Any = None):
+        policy = self.policy(policy)
+        if not policy.enabled:
+            return None
+        started = time.perf_counter()
+        key = self.key(params, policy.name, key_material)
+
+        item = self.__memory_get(key)
+        if item is not None and not self.__expired(item[2]):
+            self.__count("memory_hits", policy.name, started)
+            return item[0], dict(item[1])
+
+        row = self.__connection().execute(
+            "SELECT message, metadata, expires_at FROM cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or self.__expired(row[2]):
+            self.__count("misses", policy.name, started)
             return None
-        message, metadata_str = row
+        message, metadata_str, expires_at = row
         metadata = json.loads(metadata_str)
+        self.__memory_put(key, message, metadata, expires_at)
+        self.__count("disk_hits", policy.name, started)
         return message, metadata
 
-    def write(self, params, message, metadata):
-        key = self.__params_to_key(params)
-        metadata_str = json.dumps(metadata)
-        self.__db_operation("INSERT OR REPLACE INTO cache (key, message, metadata) VALUES (?, ?, ?)", (key, message, metadata_str), commit=True)
+    def write(self, params, message, metadata, policy: Optional[str] = None, key_material: Any = None):
+        policy = self.policy(policy)
+        if not policy.enabled:
+            return
+        key = self.key(params, policy.name, key_material)
+        now = time.time()
+        expires_at = now + policy.ttl_seconds if policy.ttl_seconds > 0 else 0.0
+        self.__memory_put(key, message, metadata, expires_at)
+        self._pending.put((key, message, json.dumps(metadata), now, expires_at))
+
+    def flush(self) -> None:
+        """Chờ thread nền ghi hết các entry đang chờ xuống SQLite."""
+        self._pending.join()
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self._stats)
+            policy_stats = {name: dict(counts) for name, counts in self._policy_stats.items()}
+        reads = stats.pop("reads")
+        read_time_s = stats.pop("read_time_s")
+        hits = stats["memory_hits"] + stats["disk_hits"]
+        stats["hit_rate"] = round(hits / reads, 4) if reads else 0.0
+        stats["mean_read_ms"] = round(1000 * read_time_s / reads, 3) if reads else 0.0
+        stats["pending_writes"] = self._pending.qsize()
+        with self._memory_lock:
+            stats["memory_size"] = len(self._memory)
+        for name, counts in policy_stats.items():
+            total = counts["hits"] + counts["misses"]
+            counts["hit_rate"] = round(counts["hits"] / total, 4) if total else 0.0
+            counts["ttl_seconds"] = self.policies[name].ttl_seconds
+            counts["enabled"] = self.policies[name].enabled
+        stats["policies"] = policy_stats
+        return stats
 
-# cache này quá phế , cần xây dựng lại
 
 class BedrockLLM(BaseLLMConfig):
     """
@@ -74,11 +348,42 @@ class BedrockLLM(BaseLLMConfig):
         super().__init__(global_config)
         self._init_llm_config()
 
+        # stand-in cục bộ (services.offline, mode inprocess) thay cho litellm.completion / acompletion
+        self.offline = OfflineLLM(global_config) if global_config.offline_enabled and global_config.offline_mode == "inprocess" else None
+
         self.cache = LLM_Cache(
             os.path.join(global_config.save_dir, "llm_cache"),
-            self.llm_name.replace('/', '_'))        
+            # câu trả lời giả không được lẫn vào cache của model thật
+            self.llm_name.replace('/', '_') + ("_offline" if global_config.offline_enabled else ""),
+            ttl_seconds=global_config.llm_cache_ttl_seconds,
+            max_entries=global_config.llm_cache_max_entries,
+            memory_entries=global_config.llm_cache_memory_entries,
+            flush_interval_s=global_config.llm_cache_flush_interval_seconds,
+            policies=global_config.llm_cache_policies,
+        )
         
         self.retry = 5
+        self.retry_base_s = float(global_config.llm_retry_base_seconds)
+        self.retry_max_s = float(global_config.llm_retry_max_seconds)
+        self.max_concurrency = int(global_config.llm_max_concurrency)
+
+        # tier theo tác vụ: model / max_tokens / timeout riêng; tác vụ không có tier dùng llm_name
+        self.tiers: Dict[str, ModelTier] = {}
+        if global_config.llm_tiers_enabled:
+            for task, cfg in (global_config.llm_tiers or {}).items():
+                cfg = cfg or {}
+                self.tiers[task] = ModelTier(
+                    task=task,
+                    model=cfg.get("model") or self.llm_name,
+                    max_tokens=cfg.get("max_tokens"),
+                    timeout_s=cfg.get("timeout_seconds"),
+                    escalate=bool(cfg.get("escalate", False)),
+                )
+
+        # prompt caching phía provider: chỉ gắn marker cho model hỗ trợ (model khác từ chối tham số cache_control)
+        self.prompt_cache_models = list(global_config.prompt_cache_models or []) if global_config.prompt_cache_enabled else []
+        self.prompt_cache_min_tokens = int(global_config.prompt_cache_min_tokens)
+        self.token_counter = get_token_counter(global_config.prompt_budget_tokenizer) if self.prompt_cache_models else None
         
         logger.info(f"[BedrockLLM] Model-ID: {self.global_config.llm_name}, Cache: {self.cache.cache_filepath}")
 
@@ -92,33 +397,224 @@ class BedrockLLM(BaseLLMConfig):
                 "temperature": config_dict.get("temperature", 0.0),
                 "aws_region_name": config_dict.get("region_name", "us-east-1")
             }
+        if self.global_config.offline_enabled and self.global_config.offline_mode == "server":
+            # offline_server nói OpenAI chat API: litellm gọi qua provider "openai" với api_base cục bộ
+            config_dict['generate_params'] = {
+                "model": f"openai/{self.global_config.llm_name}",
+                "temperature": config_dict.get("temperature", 0.0),
+                "api_base": f"{self.global_config.offline_base_url.rstrip('/')}/v1",
+                "api_key": "offline",
+            }
 
         self.llm_config = LLMConfig.from_dict(config_dict=config_dict)
         # logger.info(f"[BedrockLLM] Config: {self.llm_config}")
 
+    def tier(self, task: Optional[str]) -> Optional[ModelTier]:
+        return self.tiers.get(task) if task else None
+
+    def model_for(self, task: Optional[str] = None) -> str:
+        """Model id thực sự được gọi cho tác vụ (không có tier -> llm_name)."""
+        tier = self.tier(task)
+        return tier.model if tier else self.llm_name
+
+    def _resilience(self, model: str) -> ResilientCaller:
+        """Hedge + circuit breaker theo model (dùng chung giữa các instance gọi cùng model)."""
+        return get_resilient_caller(f"llm:{model}", self.global_config)
+
+    @staticmethod
+    def _op(params) -> str:
+        # latency mở stream (tới chunk đầu) và latency cả câu trả lời có phân phối khác nhau
+        return "stream" if params.get("stream") else "completion"
+
+    def _without_prompt_cache(self, params, call_params, error: Exception):
+        """
+        Provider từ chối marker prompt cache -> params bỏ marker để thử lại ngay (không tính lượt retry), None nếu không phải lỗi đó.
+        `params` gốc (còn marker) giữ nguyên để khoá LLM cache của lời gọi không đổi.
+        """
+        if call_params is not params or not _has_prompt_cache_marker(params["messages"]) or not _is_prompt_cache_rejection(error):
+            return None
+        if params["model"] not in _PROMPT_CACHE_REJECTED:
+            _PROMPT_CACHE_REJECTED.add(params["model"])
+            logger.warning(f"[BedrockLLM] {params['model']} rejected prompt cache markers, disabling them for this model: {error}")
+        return {**params, "messages": _strip_prompt_cache(params["messages"])}
+
     def __llm_call(self, params):
-        num, wait_s = 0, 0.5
+        resilience = self._resilience(params["model"])
+        call_params = params
+        num = 0
         while True:
             try:
-                return litellm.completion(**params)
+                completion = self.offline.completion if self.offline else litellm.completion
+                return resilience.call(self._op(params), completion, **call_params)
+            except CircuitOpenError:
+                raise
             except Exception as e:
+                fallback = self._without_prompt_cache(params, call_params, e)
+                if fallback is not None:
+                    call_params = fallback
+                    continue
                 num += 1
                 if num > self.retry:
                     raise e
                 
-                logger.warning(f"Bedrock LLM Exception: {e}\nRetry #{num} after {wait_s} seconds")
+                wait_s = _backoff_delay(num, self.retry_base_s, self.retry_max_s)
+                logger.warning(f"Bedrock LLM Exception: {e}\nRetry #{num} after {wait_s:.2f} seconds")
                 time.sleep(wait_s)
-                wait_s *= 2
-    
-    def infer(self, messages: List[TextChatMessage], **kwargs) -> Tuple[List[TextChatMessage], dict]:
+
+    @asynccontextmanager
+    async def __allm_call(self, params) -> AsyncIterator[Any]:
+        """
+        litellm.acompletion trong một slot của semaphore theo model; slot được giữ tới khi thoát context
+        (với stream: tới khi đọc hết). Lỗi -> trả slot, chờ backoff bằng asyncio.sleep rồi thử lại.
+        Bản sao hedge (nếu có) dùng chung slot với lời gọi gốc.
+        """
+        sem = _model_semaphore(params["model"], self.max_concurrency)
+        resilience = self._resilience(params["model"])
+        acompletion = self.offline.acompletion if self.offline else litellm.acompletion
+        call_params = params
+        num = 0
+        while True:
+            await sem.acquire()
+            try:
+                response = await resilience.acall(self._op(params), acompletion, **call_params)
+                break
+            except CircuitOpenError:
+                sem.release()
+                raise
+            except Exception as e:
+                sem.release()
+                fallback = self._without_prompt_cache(params, call_params, e)
+                if fallback is not None:
+                    call_params = fallback
+                    continue
+                num += 1
+                if num > self.retry:
+                    raise e
+
+                wait_s = _backoff_delay(num, self.retry_base_s, self.retry_max_s)
+                logger.warning(f"Bedrock LLM Exception: {e}\nRetry #{num} after {wait_s:.2f} seconds")
+                await asyncio.sleep(wait_s)
+            except BaseException:
+                sem.release()
+                raise
+        try:
+            yield response
+        finally:
+            sem.release()
+
+    def _build_params(self, messages: List[TextChatMessage], kwargs: Dict[str, Any], task: Optional[str] = None) -> Dict[str, Any]:
         params = deepcopy(self.llm_config.generate_params)
+        tier = self.tier(task)
+        if tier is not None:
+            tier_params = tier.params()
+            if self.global_config.offline_enabled and self.global_config.offline_mode == "server":
+                tier_params["model"] = f"openai/{tier.model}"
+            params.update(tier_params)
         if kwargs:
             params.update(kwargs)
-        params["messages"] = messages
-        
-        # cache_lookup = self.cache.read(params)
+        model = self.model_for(task)
+        prompt_cache = model not in _PROMPT_CACHE_REJECTED and any(pattern in model for pattern in self.prompt_cache_models)
+        params["messages"] = self._mark_prompt_cache(messages) if prompt_cache else messages
+        return params
 
-        cache_lookup = None
+    def _mark_prompt_cache(self, messages: List[TextChatMessage]) -> List[TextChatMessage]:
+        """
+        Gắn cache_control {"type": "ephemeral"} (litellm chuyển thành cachePoint của Bedrock) lên:
+        - system message đầu: khối chỉ dẫn tĩnh, giống nhau ở mọi request;
+        - message ngay trước user message cuối: hết lịch sử hội thoại, là tiền tố chung giữa các lượt của session.
+        Marker chỉ được gắn khi tiền tố tính tới đó đủ `prompt_cache_min_tokens` (ngắn hơn provider không cache).
+        """
+        if len(messages) < 2:
+            return messages
+        breakpoints = {len(messages) - 2}
+        if messages[0].get("role") == "system":
+            breakpoints.add(0)
+
+        marked = list(messages)
+        prefix_tokens = 0
+        for i, message in enumerate(messages[:-1]):
+            prefix_tokens += self.token_counter.count_message(message)
+            if i in breakpoints and prefix_tokens >= self.prompt_cache_min_tokens:
+                marked[i] = {
+                    **message,
+                    "content": [{"type": "text", "text": message_text(message["content"]), "cache_control": {"type": "ephemeral"}}],
+                }
+        return marked
+
+    @staticmethod
+    def _cache_usage(usage) -> dict:
+        """Token đọc / ghi prompt cache của provider (Bedrock / Anthropic: cache_*_input_tokens, OpenAI: prompt_tokens_details)."""
+        if usage is None:
+            return {"cache_read_tokens": 0, "cache_write_tokens": 0}
+        read = getattr(usage, "cache_read_input_tokens", None)
+        if read is None:
+            details = getattr(usage, "prompt_tokens_details", None)
+            read = getattr(details, "cached_tokens", None) if details is not None else None
+        return {
+            "cache_read_tokens": int(read or 0),
+            "cache_write_tokens": int(getattr(usage, "cache_creation_input_tokens", None) or 0),
+        }
+
+    @classmethod
+    def _response_metadata(cls, response, params: Dict[str, Any]) -> dict:
+        return {
+            "model": params["model"],
+            "prompt_tokens": response.usage.prompt_tokens, 
+            "completion_tokens": response.usage.completion_tokens,
+            **cls._cache_usage(response.usage),
+            "finish_reason": response.choices[0].finish_reason,
+        }
+
+    @staticmethod
+    def _parse_chunk(part) -> Tuple[str, Optional[str], Any]:
+        """(delta, finish_reason, usage) của một chunk stream."""
+        # litellm chuẩn OpenAI: choices[0].delta.content
+        delta = ""
+        try:
+            delta = getattr(part.choices[0].delta, "content", "") or ""
+        except Exception:
+            # một số provider dùng choices[0].text
+            delta = getattr(part.choices[0], "text", "") or ""
+
+        # có thể có finish_reason ở cuối
+        finish_reason = None
+        try:
+            finish_reason = getattr(part.choices[0], "finish_reason", None)
+        except Exception:
+            pass
+
+        # một số SDK đính kèm usage ở chunk cuối
+        usage = getattr(part, "usage", None)
+        return delta, finish_reason, usage
+
+    @classmethod
+    def _stream_metadata(cls, params: Dict[str, Any], last_usage, finish_reason: Optional[str]) -> dict:
+        return {
+            "model": params["model"],
+            "prompt_tokens": getattr(last_usage, "prompt_tokens", None) if last_usage else None,
+            "completion_tokens": getattr(last_usage, "completion_tokens", None) if last_usage else None,
+            **cls._cache_usage(last_usage),
+            "finish_reason": finish_reason or "stop",
+        }
+    
+    def infer(
+        self,
+        messages: List[TextChatMessage],
+        cache_policy: Optional[str] = None,
+        cache_key: Any = None,
+        task: Optional[str] = None,
+        validate: Optional[Callable[[str], Any]] = None,
+        **kwargs,
+    ) -> Tuple[List[TextChatMessage], dict]:
+        """
+        `cache_policy`: tên chính sách trong services.llm_cache.policies (TTL / bật-tắt theo nơi gọi).
+        `cache_key`: dữ liệu thay cho messages khi tính khoá cache (vd: id tài liệu thay cho toàn văn ngữ cảnh).
+        `task`: tier trong services.llm_tiers (model / max_tokens / timeout); None -> llm_name.
+        `validate`: kiểm tra nội dung trả về (vd: json.loads) trước khi ghi cache; lỗi -> không ghi cache, ném tiếp cho nơi gọi.
+        """
+        params = self._build_params(messages, kwargs, task)
+        
+        cache_lookup = self._valid_cache_read(params, cache_policy, cache_key, validate)
         if cache_lookup is not None:
             cached = True
             message, metadata = cache_lookup
@@ -126,15 +622,51 @@ class BedrockLLM(BaseLLMConfig):
             cached = False
             response = self.__llm_call(params)
             message = response.choices[0].message.content
-            metadata = {
-                "prompt_tokens": response.usage.prompt_tokens, 
-                "completion_tokens": response.usage.completion_tokens,
-                "finish_reason": response.choices[0].finish_reason,
-            }
-            self.cache.write(params, message, metadata)
+            metadata = self._response_metadata(response, params)
+            if validate is not None:
+                validate(message)
+            self.cache.write(params, message, metadata, cache_policy, cache_key)
 
         return message, metadata, cached
 
+    def _valid_cache_read(self, params, cache_policy: Optional[str], cache_key: Any, validate: Optional[Callable[[str], Any]]):
+        """Cache hit không qua được `validate` (entry ghi trước khi có kiểm tra) -> coi như miss, lời gọi mới ghi đè."""
+        cache_lookup = self.cache.read(params, cache_policy, cache_key)
+        if cache_lookup is None or validate is None:
+            return cache_lookup
+        try:
+            validate(cache_lookup[0])
+        except Exception as e:
+            logger.warning(f"Ignoring invalid cached LLM response ({cache_policy}): {e}")
+            return None
+        return cache_lookup
+
+    async def ainfer(
+        self,
+        messages: List[TextChatMessage],
+        cache_policy: Optional[str] = None,
+        cache_key: Any = None,
+        task: Optional[str] = None,
+        validate: Optional[Callable[[str], Any]] = None,
+        **kwargs,
+    ) -> Tuple[List[TextChatMessage], dict]:
+        """Như infer nhưng dùng litellm.acompletion: không chặn event loop, kể cả khi chờ retry."""
+        params = self._build_params(messages, kwargs, task)
+
+        cache_lookup = await run_blocking(self._valid_cache_read, params, cache_policy, cache_key, validate)
+        if cache_lookup is not None:
+            message, metadata = cache_lookup
+            return message, metadata, True
+
+        async with self.__allm_call(params) as response:
+            message = response.choices[0].message.content
+            metadata = self._response_metadata(response, params)
+        if validate is not None:
+            validate(message)
+        self.cache.write(params, message, metadata, cache_policy, cache_key)
+
+        return message, metadata, False
+
     # def infer(self, messages: List[TextChatMessage], **kwargs) -> Tuple[List[TextChatMessage], dict]:
     #     params = deepcopy(self.llm_config.generate_params)
     #     if kwargs:
@@ -218,11 +750,22 @@ class BedrockLLM(BaseLLMConfig):
 
     
     
-    def stream_infer(self, messages: List[TextChatMessage], **kwargs) -> Iterator[str]:
+    def stream_infer(
+        self,
+        messages: List[TextChatMessage],
+        metadata: Optional[dict] = None,
+        cache_policy: Optional[str] = None,
+        cache_key: Any = None,
+        task: Optional[str] = None,
+        **kwargs,
+    ) -> Iterator[str]:
         """
         Streaming sinh đáp án từng phần.
         - Yield: các mảnh văn bản (delta) từ mô hình.
-        - Khi stream kết thúc, kết quả đầy đủ sẽ được ghi vào cache (nếu có nội dung).
+        - Khi stream kết thúc bình thường (model trả finish_reason), kết quả đầy đủ được ghi vào cache (nếu có nội dung);
+          stream bị huỷ (client ngắt, hedge thua, ...) hoặc lỗi giữa chừng không được ghi cache.
+        - Nếu truyền dict `metadata`, dict này được cập nhật prompt_tokens / completion_tokens /
+          finish_reason / cached khi stream kết thúc (generator không trả được giá trị qua vòng for).
 
         Cách dùng:
             gen = bedrock_llm.stream_infer(messages, max_tokens=512)
@@ -230,68 +773,115 @@ class BedrockLLM(BaseLLMConfig):
                 print(delta, end="", flush=True)
         """
         # 1) Chuẩn bị params
-        params = deepcopy(self.llm_config.generate_params)
-        if kwargs:
-            params.update(kwargs)
-        params["messages"] = messages
+        params = self._build_params(messages, kwargs, task)
 
         # 2) Thử lấy từ cache trước (nếu có thì yield luôn 1 lần)
-        cache_lookup = self.cache.read(params)
+        cache_lookup = self.cache.read(params, cache_policy, cache_key)
         if cache_lookup is not None:
             message, _metadata = cache_lookup
+            if metadata is not None:
+                metadata.update(_metadata)
+                metadata["cached"] = True
             if message:
                 yield message
             return
 
-        # 3) Gọi LLM ở chế độ streaming
+        # 3) Gọi LLM ở chế độ streaming (xin usage ở chunk cuối để đếm token)
         params["stream"] = True
+        params.setdefault("stream_options", {"include_usage": True})
         response_iter = self.__llm_call(params)
 
         # 4) Duyệt stream, yield token/delta và ghép lại để lưu cache khi xong
         full_chunks = []
         finish_reason = None
         last_usage = None
+        completed = False
 
         try:
             for part in response_iter:
-                # litellm chuẩn OpenAI: choices[0].delta.content
-                delta = ""
-                try:
-                    delta = getattr(part.choices[0].delta, "content", "") or ""
-                except Exception:
-                    # một số provider dùng choices[0].text
-                    delta = getattr(part.choices[0], "text", "") or ""
-
+                delta, fr, usage = self._parse_chunk(part)
                 if delta:
                     full_chunks.append(delta)
                     yield delta
+                finish_reason = fr or finish_reason
+                last_usage = usage or last_usage
+            # chỉ tới được đây khi vòng lặp hết tự nhiên (không GeneratorExit / lỗi)
+            completed = finish_reason is not None
 
-                # có thể có finish_reason ở cuối
-                try:
-                    fr = getattr(part.choices[0], "finish_reason", None)
-                    if fr:
-                        finish_reason = fr
-                except Exception:
-                    pass
+        finally:
+            # 5) Cập nhật metadata; ghi cache chỉ khi stream hoàn tất
+            self._finish_stream(params, full_chunks, last_usage, finish_reason, metadata, cache_policy, cache_key, completed)
+
+    def _finish_stream(
+        self,
+        params,
+        full_chunks: List[str],
+        last_usage,
+        finish_reason: Optional[str],
+        metadata: Optional[dict],
+        cache_policy: Optional[str],
+        cache_key: Any,
+        completed: bool,
+    ) -> None:
+        final_text = "".join(full_chunks).strip()
+        stream_metadata = self._stream_metadata(params, last_usage, finish_reason if completed or finish_reason else "incomplete")
+        if metadata is not None:
+            metadata.update(stream_metadata)
+            metadata["cached"] = False
+        if not completed:
+            if final_text:
+                logger.info(f"Stream ended before finish_reason ({len(final_text)} chars), not cached")
+            return
+        if final_text:
+            # 'stream' / 'stream_options' không nằm trong khoá: stream và infer dùng chung entry
+            self.cache.write(params, final_text, stream_metadata, cache_policy, cache_key)
+
+    async def astream_infer(
+        self,
+        messages: List[TextChatMessage],
+        metadata: Optional[dict] = None,
+        cache_policy: Optional[str] = None,
+        cache_key: Any = None,
+        task: Optional[str] = None,
+        **kwargs,
+    ) -> AsyncIterator[str]:
+        """
+        Bản async của stream_infer (litellm.acompletion, stream=True).
+        Slot của semaphore theo model được giữ tới khi stream kết thúc hoặc bị huỷ.
+        """
+        params = self._build_params(messages, kwargs, task)
 
-                # một số SDK đính kèm usage ở chunk cuối
-                try:
-                    last_usage = getattr(part, "usage", None) or last_usage
-                except Exception:
-                    pass
+        cache_lookup = await run_blocking(self.cache.read, params, cache_policy, cache_key)
+        if cache_lookup is not None:
+            message, _metadata = cache_lookup
+            if metadata is not None:
+                metadata.update(_metadata)
+                metadata["cached"] = True
+            if message:
+                yield message
+            return
 
+        params["stream"] = True
+        params.setdefault("stream_options", {"include_usage": True})
+
+        full_chunks = []
+        finish_reason = None
+        last_usage = None
+        completed = False
+
+        try:
+            async with self.__allm_call(params) as response_iter:
+                async for part in response_iter:
+                    delta, fr, usage = self._parse_chunk(part)
+                    if delta:
+                        full_chunks.append(delta)
+                        yield delta
+                    finish_reason = fr or finish_reason
+                    last_usage = usage or last_usage
+            # huỷ (CancelledError / aclose) hoặc lỗi giữa chừng không tới được đây -> không ghi cache
+            completed = finish_reason is not None
         finally:
-            # 5) Ghi cache nếu có nội dung
-            final_text = "".join(full_chunks).strip()
-            if final_text:
-                metadata = {
-                    "prompt_tokens": getattr(last_usage, "prompt_tokens", None) if last_usage else None,
-                    "completion_tokens": getattr(last_usage, "completion_tokens", None) if last_usage else None,
-                    "finish_reason": finish_reason or "stop",
-                }
-                # Lưu ý: khoá cache của bạn chỉ dựa vào (model, temperature, messages),
-                # nên việc có/không có 'stream' trong params không ảnh hưởng.
-                self.cache.write(params, final_text, metadata)
+            self._finish_stream(params, full_chunks, last_usage, finish_reason, metadata, cache_policy, cache_key, completed)
 
                 
 # # run: python -m backend.src.langgraph_rag.llm.bedrock_llm
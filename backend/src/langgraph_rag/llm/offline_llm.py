@@ -0,0 +1,217 @@
+import asyncio
+import math
+import random
+import re
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+from ..utils.config_utils import BaseConfig
+from ..utils.llm_utils import TextChatMessage, message_text
+from ..utils.logger_utils import get_logger
+
+logger = get_logger(__name__)
+
+
+# Từ khoá định tuyến tất định (so trên câu hỏi đã viết thường)
+LEGAL_TERMS = ("luật", "điều ", "quyền", "nghĩa vụ", "quy định", "xử phạt", "bị phạt", "nghị định", "pháp lý")
+PROCEDURE_TERMS = (
+    "thủ tục", "hồ sơ", "đăng ký", "giấy tờ", "tạm trú", "thường trú", "tạm vắng", "gia hạn",
+    "nộp", "xác nhận", "khai báo", "lưu trú", "thời hạn giải quyết", "lệ phí", "ct01",
+)
+
+GENERAL_ANSWER = "Xin chào! Tôi là trợ lý tư vấn thủ tục hành chính về cư trú. Bạn cần hỗ trợ thủ tục nào?"
+FILLER_SENTENCE = "Bạn có thể liên hệ cơ quan đăng ký cư trú nơi mình sinh sống để được hướng dẫn chi tiết."
+
+
+class SimulatedServiceError(RuntimeError):
+    """Lỗi giả lập (error_rate) có status_code như lỗi của litellm / Bedrock, để thử circuit breaker."""
+
+    status_code = 503
+
+
+class LatencyModel:
+    """
+    Phân phối latency giả lập:
+    - fixed: luôn bằng `median_seconds`
+    - uniform: đều trong [median * (1 - sigma), median * (1 + sigma)]
+    - lognormal: median = `median_seconds`, `sigma` là độ lệch của log-latency (đuôi dài như p99 thật)
+    """
+
+    def __init__(self, distribution: str = "fixed", median_seconds: float = 0.0, sigma: float = 0.0, seed: Optional[int] = None):
+        self.distribution = (distribution or "fixed").lower()
+        self.median_seconds = max(0.0, float(median_seconds))
+        self.sigma = max(0.0, float(sigma))
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict[str, Any]], seed: Optional[int] = None) -> "LatencyModel":
+        config = config or {}
+        return cls(
+            distribution=config.get("distribution", "fixed"),
+            median_seconds=config.get("median_seconds", 0.0),
+            sigma=config.get("sigma", 0.0),
+            seed=seed,
+        )
+
+    def sample(self) -> float:
+        if self.median_seconds <= 0:
+            return 0.0
+        with self._lock:
+            if self.distribution == "uniform":
+                return self._rng.uniform(self.median_seconds * max(0.0, 1 - self.sigma), self.median_seconds * (1 + self.sigma))
+            if self.distribution == "lognormal":
+                return self._rng.lognormvariate(math.log(self.median_seconds), self.sigma)
+        return self.median_seconds
+
+
+def count_tokens(text: str) -> int:
+    """Xấp xỉ số token bằng số từ (đủ cho benchmark, không cần tokenizer)."""
+    return len(str(text or "").split())
+
+
+class OfflineChatModel:
+    """
+    Sinh câu trả lời tất định từ messages, nhận dạng theo prompt của repo:
+    - prompt định tuyến (QueryRoute) -> JSON {"procedure", "legal", "general"} theo từ khoá của câu hỏi
+    - prompt tóm tắt hội thoại -> gạch đầu dòng từ các lượt hỏi
+    - prompt có <document> -> trích nội dung tài liệu, độ dài tối đa `answer_tokens`
+    - còn lại -> câu chào cố định
+    """
+
+    def __init__(self, answer_tokens: int = 120):
+        self.answer_tokens = max(1, int(answer_tokens))
+
+    @staticmethod
+    def route(question: str) -> Dict[str, bool]:
+        text = f" {question.lower()} "
+        legal = any(term in text for term in LEGAL_TERMS)
+        procedure = any(term in text for term in PROCEDURE_TERMS)
+        return {"procedure": procedure, "legal": legal, "general": not (procedure or legal)}
+
+    @staticmethod
+    def _route_question(messages: List[TextChatMessage]) -> Optional[str]:
+        system = next((message_text(m["content"]) for m in messages if m["role"] == "system"), "")
+        if "định tuyến" not in system:
+            return None
+        user = message_text(messages[-1]["content"])
+        match = re.search(r'"""(.*?)"""', user, re.DOTALL)
+        return (match.group(1) if match else user).strip()
+
+    def _document_answer(self, context: str) -> str:
+        contents = re.findall(r"- Nội dung: (.+)", context)
+        titles = re.findall(r"- (?:Tên thủ tục|Tên luật|Tên giấy tờ): (.+)", context)
+        lines = ["Theo các văn bản được cung cấp:"]
+        if titles:
+            lines.append(f"Thủ tục / văn bản liên quan: {titles[0].strip()}.")
+        lines.extend(f"- {content.strip()}" for content in contents)
+        words = " ".join(lines).split(" ")
+        while len(words) < self.answer_tokens:
+            words.extend(FILLER_SENTENCE.split(" "))
+        return " ".join(words[:self.answer_tokens])
+
+    def respond(self, messages: List[TextChatMessage]) -> str:
+        question = self._route_question(messages)
+        if question is not None:
+            intents = self.route(question)
+            body = ",\n".join(f'"{k}": {str(v).lower()}' for k, v in intents.items())
+            return f"```json\n{{\n{body}\n}}\n```"
+
+        last = message_text(messages[-1]["content"]) if messages else ""
+        if "Bản tóm tắt cập nhật" in last:
+            asked = re.findall(r"^user: (.+)$", last, re.MULTILINE)
+            return "\n".join(f"- Người dùng hỏi: {q.strip()[:120]}" for q in asked) or "- (không có nội dung mới)"
+
+        # ngữ cảnh nằm ở user message cuối (bố cục tiền tố ổn định)
+        if "<document" in last:
+            return self._document_answer(last)
+        return GENERAL_ANSWER
+
+
+def _response(text: str, prompt_tokens: int, completion_tokens: int) -> SimpleNamespace:
+    """Đối tượng có cùng các thuộc tính BedrockLLM đọc từ ModelResponse của litellm."""
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(role="assistant", content=text), finish_reason="stop")],
+        usage=SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, total_tokens=prompt_tokens + completion_tokens),
+    )
+
+
+def _chunk(delta: str, finish_reason: Optional[str] = None, usage: Optional[SimpleNamespace] = None) -> SimpleNamespace:
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=delta), finish_reason=finish_reason)], usage=usage)
+
+
+def split_stream(text: str) -> List[str]:
+    """Tách câu trả lời thành các delta (mỗi từ một delta, giữ nguyên khoảng trắng / xuống dòng)."""
+    return re.findall(r"\S+\s*|\s+", text)
+
+
+class OfflineLLM:
+    """
+    Thay cho litellm.completion / litellm.acompletion khi services.offline.mode = "inprocess".
+    Latency = thời gian tới chunk đầu (`llm_latency`) + `token_seconds` cho mỗi token sinh ra;
+    không stream thì chờ cả hai trước khi trả về.
+    """
+
+    def __init__(self, global_config: BaseConfig):
+        seed = global_config.offline_seed
+        self.model = OfflineChatModel(answer_tokens=global_config.offline_answer_tokens)
+        self.latency = LatencyModel.from_config(global_config.offline_llm_latency, seed=seed)
+        self.token_seconds = max(0.0, float(global_config.offline_token_seconds))
+        self.error_rate = max(0.0, float(global_config.offline_error_rate))
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _prepare(self, params: Dict[str, Any]):
+        with self._lock:
+            failed = self._rng.random() < self.error_rate
+        text = self.model.respond(params["messages"])
+        max_tokens = params.get("max_tokens")
+        if max_tokens:
+            words = text.split(" ")
+            text = " ".join(words[:int(max_tokens)])
+        prompt_tokens = sum(count_tokens(message_text(m["content"])) for m in params["messages"])
+        return failed, text, prompt_tokens, count_tokens(text)
+
+    @staticmethod
+    def _usage(params: Dict[str, Any], prompt_tokens: int, completion_tokens: int) -> Optional[SimpleNamespace]:
+        if not (params.get("stream_options") or {}).get("include_usage"):
+            return None
+        return SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, total_tokens=prompt_tokens + completion_tokens)
+
+    # --- sync ---
+
+    def completion(self, **params: Any):
+        failed, text, prompt_tokens, completion_tokens = self._prepare(params)
+        time.sleep(self.latency.sample())
+        if failed:
+            raise SimulatedServiceError("offline: simulated service error")
+        if params.get("stream"):
+            return self._stream(text, self._usage(params, prompt_tokens, completion_tokens))
+        time.sleep(self.token_seconds * completion_tokens)
+        return _response(text, prompt_tokens, completion_tokens)
+
+    def _stream(self, text: str, usage: Optional[SimpleNamespace]) -> Iterator[SimpleNamespace]:
+        for delta in split_stream(text):
+            time.sleep(self.token_seconds)
+            yield _chunk(delta)
+        yield _chunk("", finish_reason="stop", usage=usage)
+
+    # --- async ---
+
+    async def acompletion(self, **params: Any):
+        failed, text, prompt_tokens, completion_tokens = self._prepare(params)
+        await asyncio.sleep(self.latency.sample())
+        if failed:
+            raise SimulatedServiceError("offline: simulated service error")
+        if params.get("stream"):
+            return self._astream(text, self._usage(params, prompt_tokens, completion_tokens))
+        await asyncio.sleep(self.token_seconds * completion_tokens)
+        return _response(text, prompt_tokens, completion_tokens)
+
+    async def _astream(self, text: str, usage: Optional[SimpleNamespace]) -> AsyncIterator[SimpleNamespace]:
+        for delta in split_stream(text):
+            await asyncio.sleep(self.token_seconds)
+            yield _chunk(delta)
+        yield _chunk("", finish_reason="stop", usage=usage)
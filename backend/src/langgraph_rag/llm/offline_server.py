@@ -0,0 +1,124 @@
+"""
+Stand-in Bedrock cục bộ qua HTTP, để benchmark toàn bộ workflow (kể cả phần gọi mạng của litellm / boto3) không cần AWS:
+- POST /v1/chat/completions: OpenAI chat completions (litellm gọi bằng model "openai/<model id>" + api_base), có stream SSE.
+- POST /guardrail/{id}/version/{version}/apply: cùng đường dẫn và dạng response với ApplyGuardrail của bedrock-runtime.
+
+run (từ thư mục backend/):
+    python -m src.langgraph_rag.llm.offline_server --port 8900
+rồi đặt services.offline: enabled: true, mode: "server", base_url: "http://127.0.0.1:8900".
+Câu trả lời, latency và tỉ lệ lỗi giả lập lấy từ services.offline như chế độ inprocess.
+"""
+import argparse
+import json
+import time
+import uuid
+from typing import Any, AsyncIterator, Dict, List
+
+from fastapi import Body, FastAPI
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from .offline_llm import OfflineLLM, SimulatedServiceError
+from ..guardrails.offline_guardrails import OfflineGuardrailsClient
+from ..utils.async_utils import run_blocking
+from ..utils.config_utils import BaseConfig
+from ..utils.llm_utils import message_text
+from ..utils.logger_utils import get_logger
+
+logger = get_logger(__name__)
+
+
+def _usage_dict(usage) -> Dict[str, int]:
+    return {
+        "prompt_tokens": usage.prompt_tokens,
+        "completion_tokens": usage.completion_tokens,
+        "total_tokens": usage.total_tokens,
+    }
+
+
+def create_offline_app(global_config: BaseConfig) -> FastAPI:
+    app = FastAPI(title="Offline Bedrock stand-in")
+    llm = OfflineLLM(global_config)
+    guardrails = OfflineGuardrailsClient(global_config)
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(body: Dict[str, Any] = Body(...)):
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+        model = body.get("model", "offline")
+        messages: List[Dict[str, str]] = [
+            {"role": m.get("role", "user"), "content": message_text(m.get("content"))} for m in body.get("messages", [])
+        ]
+        stream = bool(body.get("stream"))
+        try:
+            response = await llm.acompletion(
+                messages=messages,
+                max_tokens=body.get("max_tokens"),
+                stream=stream,
+                stream_options=body.get("stream_options"),
+            )
+        except SimulatedServiceError as e:
+            return JSONResponse(status_code=e.status_code, content={"error": {"message": str(e), "type": "server_error"}})
+
+        if not stream:
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": response.choices[0].message.content},
+                    "finish_reason": response.choices[0].finish_reason,
+                }],
+                "usage": _usage_dict(response.usage),
+            }
+
+        async def events() -> AsyncIterator[str]:
+            async for part in response:
+                chunk = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [{
+                        "index": 0,
+                        "delta": {"content": part.choices[0].delta.content},
+                        "finish_reason": part.choices[0].finish_reason,
+                    }],
+                }
+                if part.usage is not None:
+                    chunk["usage"] = _usage_dict(part.usage)
+                yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.post("/guardrail/{guardrail_id}/version/{version}/apply")
+    async def apply_guardrail(guardrail_id: str, version: str, body: Dict[str, Any] = Body(...)):
+        try:
+            return await run_blocking(
+                guardrails.apply_guardrail,
+                guardrailIdentifier=guardrail_id,
+                guardrailVersion=version,
+                source=body.get("source", "INPUT"),
+                content=body.get("content", []),
+            )
+        except SimulatedServiceError as e:
+            # botocore đọc "message" + header x-amzn-ErrorType như lỗi thật của Bedrock
+            return JSONResponse(
+                status_code=e.status_code,
+                content={"message": str(e)},
+                headers={"x-amzn-ErrorType": "ServiceUnavailableException"},
+            )
+
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Stand-in Bedrock cục bộ (OpenAI chat API + ApplyGuardrail) cho benchmark")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    args = parser.parse_args()
+    uvicorn.run(create_offline_app(BaseConfig()), host=args.host, port=args.port)
@@ -1,25 +1,50 @@
-from typing import List, Dict, Any
+import asyncio
+import time
+from typing import AsyncIterator, Callable, List, Dict, Any, Optional, Tuple
+from langgraph.config import get_stream_writer
 from .guardrails.bedrock_guardrails import BedrockGuardrails
 from .utils.logger_utils import get_logger
 from .utils.llm_utils import TextChatMessage, DocumentProcessor
 from .utils.config_utils import BaseConfig
-from .prompts.query_route import QueryRoute
+from .prompts.query_route import QueryRoute, RouteDecision
+from .prompts.intent_classifier import IntentClassifier, IntentPrediction
+from .prompts.small_talk import SmallTalk
 from .prompts.system_prompt import GenerateAnswer
 
 from .embeddings.qwen_embedding_model import QwenEmbeddingModel
 from .database.qdrant_client import QdrantDatabase
+from .filtering.qdrant_filter_procedure import QdrantFilterProcedure
 from .reranker.bge_reranker import BGEReranker
 from .search.vector_search import VectorRetriever
 from .search.hybird_search import HybridRetriever
+from .cache.semantic_cache import SemanticCache
+from .cache.session_store import SessionStore, trim_history
+from .cache.conversation_memory import ConversationMemory
+from .prompts.summary_prompt import SummarizeConversation
 from .state import RagState
+from .utils.async_utils import init_model_executor, run_in_model_executor, run_blocking
+from .utils.metrics_utils import track_stage, track_batch_stage, record_cache, record_intent_routing, record_llm_tier, record_llm_usage, record_prompt_budget
+from .utils.resilience_utils import CircuitOpenError
 # Langfuse tracking removed
 
 logger = get_logger(__name__)
 
+# Các collection được truy xuất "đón đầu" khi chưa có kết quả định tuyến
+SPECULATIVE_COLLECTIONS = ["legal_quantization", "procedure_quantization"]
 
-def create_default_rag_state(question: str, conversation_history: List[TextChatMessage] = None) -> RagState:
+# Đường suy giảm khi mạch Bedrock mở (xem utils/resilience_utils.py)
+DEGRADED_MESSAGE = "Hệ thống đang tạm thời quá tải, vui lòng thử lại sau ít phút."
+DEGRADED_CONTEXT_HEADER = "Hệ thống trả lời tự động đang tạm gián đoạn. Dưới đây là trích đoạn các văn bản liên quan nhất tới câu hỏi của bạn:"
+DEGRADED_MAX_DOCUMENTS = 3
+DEGRADED_EXCERPT_CHARS = 600
+# định tuyến không gọi được LLM -> tra cả hai collection
+DEGRADED_INTENTS = {"procedure": True, "legal": True, "general": False}
+
+
+def create_default_rag_state(question: str, conversation_history: List[TextChatMessage] = None, session_id: Optional[str] = None) -> RagState:
     return {
         "question": question,
+        "session_id": session_id,
         "conversation_history": conversation_history or [],
         "final_response": None,
 
@@ -39,31 +64,101 @@ def _preview_text(x: Any, max_len: int = 200) -> str:
     except Exception:
         return "<unserializable>"
 
+async def _tracked(metadata: Dict[str, Any], stage: str, awaitable):
+    """await có đo thời gian stage (dùng cho các task chạy song song)."""
+    with track_stage(metadata, stage):
+        return await awaitable
+
+def _mark_degraded(metadata: Dict[str, Any], stage: str, reason: Any) -> None:
+    """Ghi nhận stage đã chạy theo đường suy giảm (kết quả không được lưu semantic cache)."""
+    metadata.setdefault("degraded", []).append(stage)
+    logger.warning(f"Degraded {stage}: {reason}")
+
+def _llm_route_source(prediction: Any) -> str:
+    """"llm_filters": classifier đã chắc chắn nhưng vẫn gọi LLM để trích xuất bộ lọc payload."""
+    return "llm_filters" if prediction is not None and prediction.confident and prediction.needs_filters else "llm"
+
+def _degraded_excerpt(document: Dict[str, Any]) -> str:
+    payload = document.get("payload") or {}
+    title = payload.get("procedure_name") or payload.get("law_name") or payload.get("form_name") or payload.get("term")
+    content = str(payload.get("content") or "")
+    if len(content) > DEGRADED_EXCERPT_CHARS:
+        content = content[:DEGRADED_EXCERPT_CHARS].rsplit(" ", 1)[0] + "…"
+    return f"- {title}: {content}" if title else f"- {content}"
+
+def _stream_writer() -> Callable[[Any], None]:
+    """Writer của LangGraph stream_mode="custom"; no-op khi node chạy ngoài graph."""
+    try:
+        return get_stream_writer()
+    except Exception:
+        return lambda _chunk: None
+
 class RAGWorkflowNodes:
     def __init__(self, global_config: BaseConfig):
         self.global_config = global_config
 
+        self.small_talk = SmallTalk(global_config=global_config)
         self.bedrock_guardrails = BedrockGuardrails(global_config= global_config)
         self.query_route = QueryRoute(global_config= global_config)
+        self.intent_classifier = IntentClassifier(global_config=global_config)
 
         self.embedding = QwenEmbeddingModel(global_config=global_config)
         self.database = QdrantDatabase(global_config=global_config)
         self.reranker = BGEReranker(global_config=global_config)
         self.vector_search = VectorRetriever(embedding=self.embedding, database= self.database)
         self.hybird_search = HybridRetriever(vector_retriever=self.vector_search, reranker= self.reranker)
+        self.procedure_filter = QdrantFilterProcedure(global_config) if global_config.route_filters_enabled else None
+        self.semantic_cache = SemanticCache(global_config=global_config, database=self.database)
 
         self.generate_answer = GenerateAnswer(global_config= global_config)
         self.document_processor = DocumentProcessor()
 
 
         self.MAX_HISTORY = 20
+        self.session_store = SessionStore(global_config=global_config, max_messages=self.MAX_HISTORY)
+        self.conversation_memory = ConversationMemory(
+            global_config=global_config,
+            session_store=self.session_store,
+            summarizer=SummarizeConversation(global_config=global_config) if global_config.session_memory_mode == "summary" else None,
+        )
+
+        # executor giới hạn cho embedding / rerank khi chạy workflow bất đồng bộ
+        init_model_executor(max_workers=global_config.model_executor_workers)
 
     def _append_history(self, state: RagState, role: str, content: Any) -> None:
         history = state['conversation_history']
         history.append({"role": role, "content": content})
         if len(history) > self.MAX_HISTORY:
-            history[:] = history[-self.MAX_HISTORY:]
+            history[:] = trim_history(history, self.MAX_HISTORY)
         state["conversation_history"] = history
+        self.session_store.save(state.get("session_id"), history)
+        if role == "assistant":
+            # chế độ summary: nén các lượt cũ ở nền, sau khi câu trả lời đã được trả về
+            self.conversation_memory.maybe_summarize(state.get("session_id"), history)
+
+    # Node 0: small talk (không gọi dịch vụ nào)
+    def small_talk_node(self, state: RagState) -> RagState:
+        """Câu chào hỏi / cảm ơn / tạm biệt rõ ràng -> câu trả lời mẫu, kết thúc workflow trước guardrail và định tuyến."""
+        matched = self.small_talk.answer(state["question"], has_history=bool(state.get("conversation_history")))
+        if self.small_talk.enabled:
+            record_cache(state["execution_metadata"], "small_talk", matched is not None)
+        if matched is None:
+            return state
+        category, answer = matched
+        logger.info(f"Small talk ({category}), answered from template")
+        state["current_status"] = "SMALL_TALK_ANSWER"
+        state["intents"] = {"procedure": False, "legal": False, "general": True}
+        state["generated_answer"] = answer
+        state["final_response"] = answer
+        state["execution_metadata"]["small_talk"] = {"category": category}
+        self._append_history(state, role="user", content=state["question"])
+        self._append_history(state, role="assistant", content=answer)
+        state["processing_steps"] = state.get("processing_steps", []) + ["small_talk_answered"]
+        return state
+
+    async def asmall_talk_node(self, state: RagState) -> RagState:
+        # chỉ so khớp trie trong bộ nhớ, không cần executor
+        return self.small_talk_node(state)
 
     def _extract_guardrail_message(self, guardrail_result: Dict[str, Any]) -> str:
         """Trích xuất thông báo từ kết quả guardrail"""
@@ -77,29 +172,62 @@ class RAGWorkflowNodes:
 
 
 
+    def _apply_input_guardrail(self, state: RagState, result: Dict[str, Any]) -> None:
+        quesion = state["question"]
+        if result.get("degraded"):
+            # mạch guardrail mở: fail-open -> cho qua, ngược lại từ chối ngay
+            _mark_degraded(state["execution_metadata"], "guardrail_input", result.get("error"))
+            state["input_guardrail_status"] = "CIRCUIT_OPEN"
+            if self.global_config.resilience_guardrails_fail_open:
+                state["current_status"] = "INPUT_VALIDATED"
+            else:
+                state["current_status"] = "INPUT_BLOCKED"
+                state["final_response"] = DEGRADED_MESSAGE
+            return
+
+        action = result.get("action", "NONE")
+        state["input_guardrail_status"] = action
+
+        state["total_token"] += result['assessments'][-1]['invocationMetrics']['guardrailCoverage']['textCharacters']['total']
+
+        if action == "GUARDRAIL_INTERVENED":
+            state["current_status"] = "INPUT_BLOCKED"
+            state["final_response"] = self._extract_guardrail_message(result)
+            logger.error(f"Input blocked by guardrail: {state['final_response']}")
+        else:
+            state["current_status"] = "INPUT_VALIDATED"
+            logger.info(f"Input validation passed: '{quesion}'")
+
     def input_validation_node(self, state: RagState) -> RagState:
         logger.info("--- NODE: INPUT VALIDATION & GUARDRAIL ---")
         quesion = state["question"]
         try:
-            result = self.bedrock_guardrails.apply_guardrail(
-                text=quesion,
-                source_type="INPUT"
-            )
+            with track_stage(state["execution_metadata"], "guardrail_input"):
+                result = self.bedrock_guardrails.apply_guardrail(
+                    text=quesion,
+                    source_type="INPUT"
+                )
+            self._apply_input_guardrail(state, result)
 
-                
-            action = result.get("action", "NONE")
-            state["input_guardrail_status"] = action
+        except Exception as e:
+            logger.error(f"Error in input validation: {str(e)}")
+            state["current_status"] = "VALIDATION_ERROR"
+            state["error_count"] = state.get("error_count", 0) + 1
 
-            state["total_token"] += result['assessments'][-1]['invocationMetrics']['guardrailCoverage']['textCharacters']['total']
+        state["processing_steps"] = state.get("processing_steps", []) + ["input_validated"]
+        return state
 
-            
-            if action == "GUARDRAIL_INTERVENED":
-                state["current_status"] = "INPUT_BLOCKED"
-                state["final_response"] = self._extract_guardrail_message(result)
-                logger.error(f"Input blocked by guardrail: {state['final_response']}")
-            else:
-                state["current_status"] = "INPUT_VALIDATED"
-                logger.info(f"Input validation passed: '{quesion}'")
+    async def ainput_validation_node(self, state: RagState) -> RagState:
+        logger.info("--- NODE: INPUT VALIDATION & GUARDRAIL (async) ---")
+        quesion = state["question"]
+        try:
+            with track_stage(state["execution_metadata"], "guardrail_input"):
+                result = await run_blocking(
+                    self.bedrock_guardrails.apply_guardrail,
+                    text=quesion,
+                    source_type="INPUT"
+                )
+            self._apply_input_guardrail(state, result)
 
         except Exception as e:
             logger.error(f"Error in input validation: {str(e)}")
@@ -109,17 +237,67 @@ class RAGWorkflowNodes:
         state["processing_steps"] = state.get("processing_steps", []) + ["input_validated"]
         return state
     
-    def query_analysis_node(self, state: RagState) -> RagState:
-        if state["current_status"] == "INPUT_BLOCKED":
-            logger.info("Input was blocked, skipping intent routing")
+    def _semantic_cache_applicable(self, state: RagState) -> bool:
+        # câu trả lời phụ thuộc ngữ cảnh hội thoại -> chỉ cache câu hỏi độc lập (chưa có lịch sử)
+        return self.semantic_cache.enabled and not state.get("conversation_history")
+
+    def _apply_semantic_cache(self, state: RagState, hit: Optional[Dict[str, Any]]) -> None:
+        record_cache(state["execution_metadata"], "semantic_cache", hit is not None)
+        state["execution_metadata"]["semantic_cache"] = {
+            "hit": hit is not None,
+            "similarity": hit["similarity"] if hit else None,
+            **self.semantic_cache.stats(),
+        }
+        if hit is None:
+            return
+        state["current_status"] = "SEMANTIC_CACHE_HIT"
+        state["generated_answer"] = hit["answer"]
+        state["final_response"] = hit["answer"]
+        self._append_history(state, role="user", content=state["question"])
+        self._append_history(state, role="assistant", content=state["final_response"])
+        logger.info(f"Semantic cache hit (similarity={hit['similarity']:.4f}): '{hit['question']}'")
+
+    def semantic_cache_node(self, state: RagState) -> RagState:
+        """Node 1b: tra semantic cache, hit -> bỏ qua định tuyến / truy xuất / sinh câu trả lời"""
+        if state["current_status"] != "INPUT_VALIDATED" or not self._semantic_cache_applicable(state):
             return state
-        logger.info("--- NODE: INTENT ANALYSIS & QUERY ROUTING ---")
-        
-        quesion = state["question"]
-        
+        logger.info("--- NODE: SEMANTIC CACHE ---")
+
+        try:
+            metadata = state["execution_metadata"]
+            with track_stage(metadata, "embedding"):
+                vector = self.embedding.batch_encode(state["question"].lower())
+            state["query_vector"] = vector
+            with track_stage(metadata, "semantic_cache"):
+                hit = self.semantic_cache.lookup(vector)
+            self._apply_semantic_cache(state, hit)
+        except Exception as e:
+            # cache lỗi không chặn workflow
+            logger.warning(f"Semantic cache lookup failed: {str(e)}")
+
+        state["processing_steps"] = state.get("processing_steps", []) + ["semantic_cache_checked"]
+        return state
+
+    async def asemantic_cache_node(self, state: RagState) -> RagState:
+        if state["current_status"] != "INPUT_VALIDATED" or not self._semantic_cache_applicable(state):
+            return state
+        logger.info("--- NODE: SEMANTIC CACHE (async) ---")
 
-        intents, total_token = self.query_route.query_route(quesion)
+        try:
+            metadata = state["execution_metadata"]
+            with track_stage(metadata, "embedding"):
+                vector = await self.embedding.abatch_encode(state["question"].lower())
+            state["query_vector"] = vector
+            with track_stage(metadata, "semantic_cache"):
+                hit = await run_blocking(self.semantic_cache.lookup, vector)
+            self._apply_semantic_cache(state, hit)
+        except Exception as e:
+            logger.warning(f"Semantic cache lookup failed: {str(e)}")
+
+        state["processing_steps"] = state.get("processing_steps", []) + ["semantic_cache_checked"]
+        return state
 
+    def _apply_intents(self, state: RagState, intents: Dict[str, Any], total_token: int) -> None:
         logger.info(f"Intent routing results:\n {intents} ")
         state['intents'] = intents
         state['total_token'] += total_token
@@ -138,95 +316,373 @@ class RAGWorkflowNodes:
             logger.error(f"Error in intent routing: {str(e)}")
             state["current_status"] = "ROUTING_ERROR"
             state["error_count"] = state.get("error_count", 0) + 1
+
+    def _local_route(self, metadata: Dict[str, Any], vector: Any) -> Tuple[Optional[RouteDecision], Optional[IntentPrediction]]:
+        """Intent từ classifier cục bộ nếu đủ tin cậy và không cần bộ lọc; decision None -> gọi LLM (kèm dự đoán để ghi metadata)."""
+        if vector is None or not self.intent_classifier.ready:
+            return None, None
+        t0 = time.perf_counter()
+        prediction = self.intent_classifier.predict(vector)
+        if not prediction.local:
+            return None, prediction
+        record_intent_routing(metadata, "local", prediction, self.intent_classifier.saved_seconds(time.perf_counter() - t0))
+        return RouteDecision(intents=prediction.intents, filters=None, total_token=0), prediction
+
+    def _llm_route(self, quesion: str, metadata: Dict[str, Any], prediction: Optional[IntentPrediction] = None) -> RouteDecision:
+        t0 = time.perf_counter()
+        decision = self.query_route.route(quesion)
+        if not decision.cached:
+            self.intent_classifier.observe_llm_latency(time.perf_counter() - t0)
+        record_intent_routing(metadata, _llm_route_source(prediction), prediction)
+        return decision
+
+    async def _allm_route(self, quesion: str, metadata: Dict[str, Any], prediction: Optional[IntentPrediction] = None) -> RouteDecision:
+        t0 = time.perf_counter()
+        decision = await self.query_route.aroute(quesion)
+        if not decision.cached:
+            self.intent_classifier.observe_llm_latency(time.perf_counter() - t0)
+        record_intent_routing(metadata, _llm_route_source(prediction), prediction)
+        return decision
+
+    async def _aroute_after_embedding(self, quesion: str, embed_task: asyncio.Task, metadata: Dict[str, Any]) -> RouteDecision:
+        """Chờ embedding (đang chạy song song) để định tuyến cục bộ; không chắc chắn / embedding lỗi -> LLM."""
+        vector = None
+        if self.intent_classifier.ready:
+            try:
+                vector = await asyncio.shield(embed_task)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Embedding failed, routing with the LLM: {str(e)}")
+        decision, prediction = self._local_route(metadata, vector)
+        return decision or await self._allm_route(quesion, metadata, prediction)
+
+    def _apply_route(self, state: RagState, decision: RouteDecision) -> None:
+        if decision.filters:
+            state["query_filter"] = decision.filters
+            state["execution_metadata"]["route_filters"] = decision.filters
+            logger.info(f"Routing filters: {decision.filters}")
+        self._apply_intents(state, decision.intents, decision.total_token)
+
+    def query_analysis_node(self, state: RagState) -> RagState:
+        if state["current_status"] == "INPUT_BLOCKED":
+            logger.info("Input was blocked, skipping intent routing")
+            return state
+        logger.info("--- NODE: INTENT ANALYSIS & QUERY ROUTING ---")
+        
+        quesion = state["question"]
+        metadata = state["execution_metadata"]
+
+        if self.intent_classifier.ready and state.get("query_vector") is None:
+            # vector dùng lại cho retrieval
+            try:
+                with track_stage(metadata, "embedding"):
+                    state["query_vector"] = self.embedding.batch_encode(quesion.lower())
+            except Exception as e:
+                logger.warning(f"Embedding failed, routing with the LLM: {str(e)}")
+
+        try:
+            with track_stage(metadata, "routing"):
+                decision, prediction = self._local_route(metadata, state.get("query_vector"))
+                decision = decision or self._llm_route(quesion, metadata, prediction)
+        except (CircuitOpenError, ValueError) as e:
+            # ValueError: câu trả lời định tuyến không phải JSON (không được ghi cache) -> tìm cả procedure + legal
+            _mark_degraded(metadata, "routing", e)
+            decision = RouteDecision(intents=dict(DEGRADED_INTENTS), filters=None, total_token=0)
+        self._apply_route(state, decision)
         
         state["processing_steps"] = state.get("processing_steps", []) + ["intent_routed"]
 
         return state
+
+    async def aquery_analysis_node(self, state: RagState) -> RagState:
+        if state["current_status"] == "INPUT_BLOCKED":
+            logger.info("Input was blocked, skipping intent routing")
+            return state
+        logger.info("--- NODE: INTENT ANALYSIS & QUERY ROUTING (async) ---")
+
+        quesion = state["question"]
+        metadata = state["execution_metadata"]
+
+        if self.intent_classifier.ready and state.get("query_vector") is None:
+            try:
+                with track_stage(metadata, "embedding"):
+                    state["query_vector"] = await self.embedding.abatch_encode(quesion.lower())
+            except Exception as e:
+                logger.warning(f"Embedding failed, routing with the LLM: {str(e)}")
+
+        try:
+            with track_stage(metadata, "routing"):
+                decision, prediction = self._local_route(metadata, state.get("query_vector"))
+                decision = decision or await self._allm_route(quesion, metadata, prediction)
+        except (CircuitOpenError, ValueError) as e:
+            # ValueError: câu trả lời định tuyến không phải JSON (không được ghi cache) -> tìm cả procedure + legal
+            _mark_degraded(metadata, "routing", e)
+            decision = RouteDecision(intents=dict(DEGRADED_INTENTS), filters=None, total_token=0)
+        self._apply_route(state, decision)
+
+        state["processing_steps"] = state.get("processing_steps", []) + ["intent_routed"]
+
+        return state
     
-    def document_retrieval_node(self, state: RagState) -> RagState:
-        """Node 3: Truy xuất tài liệu từ các collection"""
-        
-        if state["current_status"] in ["INPUT_BLOCKED", "ROUTING_ERROR", "GENERAL_QUERY"]:
+    def input_analysis_node(self, state: RagState) -> RagState:
+        """Bản sync của input_analysis: guardrail, semantic cache rồi định tuyến, tuần tự như chuỗi cũ."""
+        state = self.input_validation_node(state)
+        state = self.semantic_cache_node(state)
+        if state["current_status"] == "SEMANTIC_CACHE_HIT":
             return state
-        logger.info("--- NODE: DOCUMENT RETRIEVAL ---")
+        return self.query_analysis_node(state)
+
+    async def _aspeculate(self, quesion: str, embed_task: asyncio.Task, metadata: Dict[str, Any]) -> Dict[str, List[Dict[str, Any]]]:
+        vector = await embed_task
+        # chỉ search thô (chưa rerank): rerank chạy một batch sau khi biết collection được định tuyến
+        with track_stage(metadata, "qdrant"):
+            return await self.vector_search.aretrieve_many(
+                query=quesion,
+                collection_names=SPECULATIVE_COLLECTIONS,
+                limit=10,
+                filters=None,
+                query_vector=vector,
+            )
+
+    async def ainput_analysis_node(self, state: RagState) -> RagState:
+        """
+        Guardrail đầu vào, định tuyến intent và embedding câu hỏi chạy đồng thời
+        (có classifier intent cục bộ: định tuyến chờ embedding, chỉ gọi LLM khi classifier không chắc chắn).
+        Khi có embedding: tra semantic cache, và truy xuất đón đầu (speculative) các collection chính.
+        Guardrail chặn / cache hit -> huỷ mọi tác vụ đang chạy; câu hỏi general -> huỷ phần truy xuất.
+        """
+        logger.info("--- NODE: INPUT ANALYSIS (guardrail || routing || embedding) ---")
+        quesion = state["question"]
+
+        metadata = state["execution_metadata"]
+
+        guard_task = asyncio.create_task(_tracked(metadata, "guardrail_input", run_blocking(
+            self.bedrock_guardrails.apply_guardrail, text=quesion, source_type="INPUT"
+        )))
+        embed_task = asyncio.create_task(_tracked(metadata, "embedding", self.embedding.abatch_encode(quesion.lower())))
+        route_task = asyncio.create_task(_tracked(metadata, "routing", self._aroute_after_embedding(quesion, embed_task, metadata)))
+        spec_task = None
+        if self.global_config.speculative_retrieval:
+            spec_task = asyncio.create_task(self._aspeculate(quesion, embed_task, metadata))
+        background = [t for t in (embed_task, spec_task) if t is not None]
+
+        async def cancel(*tasks: asyncio.Task) -> None:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
 
         try:
-            all_documents = []
-            # keyworks = []
-            intents = state["intents"]
-            quesion = state["question"]
-
-            # collections = [
-            #     key
-            #     for key, val in intents.items()
-            #     if val
-            # ]
-
-            collections = []
-            for key, val in intents.items():
-                if val:
-                    if key == "legal":
-                        collections.append("legal_quantization")
-                    elif key == "procedure":
-                        collections.append("procedure_quantization")
-                    else:
-                        collections.append(key)
+            result = await guard_task
+            self._apply_input_guardrail(state, result)
+        except Exception as e:
+            logger.error(f"Error in input validation: {str(e)}")
+            state["current_status"] = "VALIDATION_ERROR"
+            state["error_count"] = state.get("error_count", 0) + 1
+        state["processing_steps"] = state.get("processing_steps", []) + ["input_validated"]
 
-            
-            for collection_name in collections:
-                    
-
-                    # # test quantization
-                    # if collection_name == ""
-
-                    # filter_condition = self.retrieval_service.generate_filter_from_query(
-                    #     query=user_query,
-                    #     collection_name=collection_name
-                    #     )
-                    # if filter_condition:
-                    #     filter_condition = filter_condition.to_qdrant_filter()
-                    #     keyworks.extend(extract_filter_keys(filter_obj=filter_condition))
-                    # else:
-                    #     filter_condition = None
-
-                    docs = self.hybird_search.retrieve(
+        if state["current_status"] == "INPUT_BLOCKED":
+            await cancel(route_task, *background)
+            state["execution_metadata"]["speculative_cancelled"] = True
+            logger.info("Input was blocked, cancelled in-flight routing / embedding / retrieval")
+            return state
+
+        if state["current_status"] == "INPUT_VALIDATED" and self._semantic_cache_applicable(state):
+            try:
+                vector = await embed_task
+                state["query_vector"] = vector
+                with track_stage(metadata, "semantic_cache"):
+                    hit = await run_blocking(self.semantic_cache.lookup, vector)
+                self._apply_semantic_cache(state, hit)
+            except Exception as e:
+                logger.warning(f"Semantic cache lookup failed: {str(e)}")
+            state["processing_steps"] = state.get("processing_steps", []) + ["semantic_cache_checked"]
+
+            if state["current_status"] == "SEMANTIC_CACHE_HIT":
+                await cancel(route_task, *background)
+                state["execution_metadata"]["speculative_cancelled"] = True
+                return state
+
+        try:
+            self._apply_route(state, await route_task)
+        except (CircuitOpenError, ValueError) as e:
+            _mark_degraded(metadata, "routing", e)
+            self._apply_intents(state, dict(DEGRADED_INTENTS), 0)
+        except Exception as e:
+            logger.error(f"Error in intent routing: {str(e)}")
+            state["current_status"] = "ROUTING_ERROR"
+            state["error_count"] = state.get("error_count", 0) + 1
+        state["processing_steps"] = state.get("processing_steps", []) + ["intent_routed"]
+
+        if state["current_status"] in ["ROUTING_ERROR", "GENERAL_QUERY"]:
+            await cancel(*background)
+            if embed_task.done() and not embed_task.cancelled() and embed_task.exception() is None:
+                state["query_vector"] = embed_task.result()
+            state["execution_metadata"]["speculative_cancelled"] = True
+            return state
+
+        try:
+            state["query_vector"] = await embed_task
+            if spec_task is not None:
+                state["speculative_documents"] = await spec_task
+        except Exception as e:
+            # document_retrieval sẽ tự encode + search lại
+            logger.warning(f"Speculative embedding/retrieval failed: {str(e)}")
+
+        return state
+
+    def _collections_from_intents(self, intents: Dict[str, Any]) -> List[str]:
+        # collections = [
+        #     key
+        #     for key, val in intents.items()
+        #     if val
+        # ]
+
+        collections = []
+        for key, val in intents.items():
+            if val:
+                if key == "legal":
+                    collections.append("legal_quantization")
+                elif key == "procedure":
+                    collections.append("procedure_quantization")
+                else:
+                    collections.append(key)
+        return collections
+
+    def _split_filtered(self, collections: List[str], query_filter: Optional[Dict[str, Any]]):
+        """(collection có lọc, collection không lọc, Filter Qdrant); bộ lọc chỉ áp cho services.route_filters.collections."""
+        if not query_filter or self.procedure_filter is None:
+            return [], list(collections), None
+        filtered = [name for name in collections if name in self.global_config.route_filters_collections]
+        if not filtered:
+            return [], list(collections), None
+        return filtered, [name for name in collections if name not in filtered], self.procedure_filter.build(query_filter)
+
+    def _retrieve_documents(
+        self,
+        quesion: str,
+        collections: List[str],
+        query_vector: Optional[List[float]] = None,
+        metadata: Optional[Dict[str, Any]] = None,
+        query_filter: Optional[Dict[str, Any]] = None,
+    ) -> List[Dict[str, Any]]:
+        # # test quantization
+        # if collection_name == ""
+
+        # filter_condition = self.retrieval_service.generate_filter_from_query(
+        #     query=user_query,
+        #     collection_name=collection_name
+        #     )
+        # if filter_condition:
+        #     filter_condition = filter_condition.to_qdrant_filter()
+        #     keyworks.extend(extract_filter_keys(filter_obj=filter_condition))
+        # else:
+        #     filter_condition = None
+
+        # embedding một lần, search mọi collection đồng thời, rerank một batch
+        metadata = metadata if metadata is not None else {}
+        if query_vector is None:
+            with track_stage(metadata, "embedding"):
+                query_vector = self.embedding.batch_encode(quesion.lower())
+        filtered, unfiltered, qdrant_filter = self._split_filtered(collections, query_filter)
+        with track_stage(metadata, "qdrant"):
+            results = self.vector_search.retrieve_many(
+                query=quesion,
+                collection_names=unfiltered,
+                limit=10,
+                filters=None,
+                query_vector=query_vector,
+            )
+            if filtered:
+                # collection trả rỗng với bộ lọc sẽ được search lại không lọc (VectorRetriever)
+                results.update(self.vector_search.retrieve_many(
+                    query=quesion,
+                    collection_names=filtered,
+                    limit=10,
+                    filters=qdrant_filter,
+                    query_vector=query_vector,
+                ))
+        with track_stage(metadata, "rerank"):
+            return self.hybird_search.rerank_merged(quesion, collections, results, top_k=5)
+
+    async def _aretrieve_documents(
+        self,
+        quesion: str,
+        collections: List[str],
+        query_vector: Optional[List[float]] = None,
+        prefetched: Optional[Dict[str, List[Dict[str, Any]]]] = None,
+        metadata: Optional[Dict[str, Any]] = None,
+        query_filter: Optional[Dict[str, Any]] = None,
+    ) -> List[Dict[str, Any]]:
+        metadata = metadata if metadata is not None else {}
+        prefetched = prefetched or {}
+        filtered, unfiltered, qdrant_filter = self._split_filtered(collections, query_filter)
+        # kết quả đón đầu (speculative) không có bộ lọc -> chỉ dùng cho collection không lọc
+        results = {name: prefetched[name] for name in unfiltered if name in prefetched}
+        missing = [name for name in unfiltered if name not in results]
+        if missing or filtered:
+            if query_vector is None:
+                with track_stage(metadata, "embedding"):
+                    query_vector = await self.embedding.abatch_encode(quesion.lower())
+            with track_stage(metadata, "qdrant"):
+                searches = [
+                    self.vector_search.aretrieve_many(
                         query=quesion,
-                        collection_name=collection_name, 
-                        filters=None, 
+                        collection_names=names,
                         limit=10,
-                        top_k=5
+                        filters=filters,
+                        query_vector=query_vector,
                     )
-                    
-                    all_documents.extend(docs)
-                    if docs and "question" in docs[0]['payload'].keys() and "answer" in docs[0]['payload'].keys():
-                        break
-
-
-            if all_documents and "question" in all_documents[0]['payload'].keys() and "answer" in all_documents[0]['payload'].keys():
-                state["current_status"] = "QDRANT_CACHE_ANSWER"
-                state["generated_answer"] = all_documents[0]['payload']['answer']
-
-            else: 
-                if all_documents:
-                    filtered_content = ""
-                    for idx, document in enumerate(all_documents):
-                        formatted_doc = self.document_processor.format_document_content(
-                            payload=document['payload'], 
-                            doc_id=idx+1,
-                        )
-                        filtered_content += formatted_doc
-
-                    state["raw_documents"] = all_documents
-                    state["relevant_context"] = filtered_content
-                    state["current_status"] = "DOCUMENTS_RETRIEVED"
-                    
-                    logger.info(f"Retrieved {len(all_documents)} documents")
-                    logger.info(f"relevant_context: \n{filtered_content}")
-                else:
-                    # No documents found, switch to general query mode
-                    logger.warning("No documents found, switching to general query mode")
-                    state["current_status"] = "GENERAL_QUERY"
+                    for names, filters in ((missing, None), (filtered, qdrant_filter)) if names
+                ]
+                for found in await asyncio.gather(*searches):
+                    results.update(found)
+        with track_stage(metadata, "rerank"):
+            return await run_in_model_executor(
+                self.hybird_search.rerank_merged, quesion, collections, results, 5
+            )
 
+    def _apply_retrieved_documents(self, state: RagState, all_documents: List[Dict[str, Any]]) -> None:
+        qa_cache_hit = bool(all_documents) and "question" in all_documents[0]['payload'].keys() and "answer" in all_documents[0]['payload'].keys()
+        record_cache(state["execution_metadata"], "qdrant_cache", qa_cache_hit)
+        if qa_cache_hit:
+            state["current_status"] = "QDRANT_CACHE_ANSWER"
+            state["generated_answer"] = all_documents[0]['payload']['answer']
+
+        else: 
+            if all_documents:
+                filtered_content = ""
+                for idx, document in enumerate(all_documents):
+                    formatted_doc = self.document_processor.format_document_content(
+                        payload=document['payload'], 
+                        doc_id=idx+1,
+                    )
+                    filtered_content += formatted_doc
+
+                state["raw_documents"] = all_documents
+                state["relevant_context"] = filtered_content
+                state["current_status"] = "DOCUMENTS_RETRIEVED"
+                
+                logger.info(f"Retrieved {len(all_documents)} documents")
+                logger.info(f"relevant_context: \n{filtered_content}")
+            else:
+                # No documents found, switch to general query mode
+                logger.warning("No documents found, switching to general query mode")
+                state["current_status"] = "GENERAL_QUERY"
+
+    def document_retrieval_node(self, state: RagState) -> RagState:
+        """Node 3: Truy xuất tài liệu từ các collection"""
+        
+        if state["current_status"] in ["INPUT_BLOCKED", "ROUTING_ERROR", "GENERAL_QUERY"]:
+            return state
+        logger.info("--- NODE: DOCUMENT RETRIEVAL ---")
+
+        try:
+            collections = self._collections_from_intents(state["intents"])
+            all_documents = self._retrieve_documents(
+                state["question"], collections, state.get("query_vector"), state["execution_metadata"], state.get("query_filter")
+            )
+            self._apply_retrieved_documents(state, all_documents)
             
         except Exception as e:
             logger.error(f"Error in document retrieval: {str(e)}")
@@ -236,30 +692,87 @@ class RAGWorkflowNodes:
         state["processing_steps"] = state.get("processing_steps", []) + ["documents_retrieved"]
         
         return state
+
+    async def adocument_retrieval_node(self, state: RagState) -> RagState:
+        """Node 3 (async): search qua AsyncQdrantClient, embedding + rerank trong model executor có giới hạn"""
+
+        if state["current_status"] in ["INPUT_BLOCKED", "ROUTING_ERROR", "GENERAL_QUERY"]:
+            return state
+        logger.info("--- NODE: DOCUMENT RETRIEVAL (async) ---")
+
+        try:
+            collections = self._collections_from_intents(state["intents"])
+            all_documents = await self._aretrieve_documents(
+                state["question"],
+                collections,
+                state.get("query_vector"),
+                state.get("speculative_documents"),
+                state["execution_metadata"],
+                state.get("query_filter"),
+            )
+            self._apply_retrieved_documents(state, all_documents)
+
+        except Exception as e:
+            logger.error(f"Error in document retrieval: {str(e)}")
+            state["current_status"] = "RETRIEVAL_ERROR"
+            state["error_count"] = state.get("error_count", 0) + 1
+
+        state["processing_steps"] = state.get("processing_steps", []) + ["documents_retrieved"]
+
+        return state
+
+    @staticmethod
+    def _answer_task(state: RagState) -> str:
+        """Tier trả lời theo intent: có legal -> model lớn, chỉ procedure -> model nhỏ (escalate nếu không tìm thấy)."""
+        intents = state.get("intents") or {}
+        return "legal" if intents.get("legal") else "procedure"
+
+    def _generate(self, state: RagState, report: Dict[str, Any], usage: Dict[str, Any]):
+        quesion = state["question"]
+        conversation_history = state["conversation_history"]
+        if state["current_status"] == "GENERAL_QUERY":
+            return self.generate_answer.generate_general(
+                question=quesion, conversation_history=conversation_history, report=report, metadata=usage
+            )
+        relevant_context = state["relevant_context"]
+        return self.generate_answer.generate_intent(
+            question=quesion, related_text=relevant_context, conversation_history=conversation_history,
+            documents=state.get("raw_documents"), report=report, task=self._answer_task(state), metadata=usage,
+        )
+
+    def _apply_generated_answer(self, state: RagState, generated_answer: str, total_token: int) -> None:
+        state["generated_answer"] = generated_answer
+        state['total_token'] += total_token
+        state["current_status"] = "ANSWER_GENERATED"
+        logger.info("Answer generation completed")
     
+    def _apply_degraded_answer(self, state: RagState, error: Exception) -> str:
+        """Mạch LLM mở: trả trích đoạn các tài liệu đã truy xuất (câu hỏi general: thông báo bận) thay cho câu trả lời sinh."""
+        _mark_degraded(state["execution_metadata"], "llm", error)
+        documents = [] if state["current_status"] == "GENERAL_QUERY" else (state.get("raw_documents") or [])
+        if documents:
+            answer = "\n".join([DEGRADED_CONTEXT_HEADER] + [_degraded_excerpt(doc) for doc in documents[:DEGRADED_MAX_DOCUMENTS]])
+        else:
+            answer = DEGRADED_MESSAGE
+        self._apply_generated_answer(state, answer, 0)
+        return answer
+
     def answer_generation_node(self, state: RagState) -> RagState:
         if state["current_status"] not in ["DOCUMENTS_RETRIEVED", "GENERAL_QUERY"]:
             return state
         logger.info("--- NODE: ANSWER GENERATION ---")
         
         try:
-            quesion = state["question"]
-            conversation_history = state["conversation_history"]
-            if state["current_status"] == "GENERAL_QUERY":
-                generated_answer, total_token = self.generate_answer.generate_general(
-                    question=quesion, conversation_history=conversation_history
-                )
-            else:
-                relevant_context = state["relevant_context"]
-                generated_answer, total_token = self.generate_answer.generate_intent(
-                    question=quesion, related_text=relevant_context, conversation_history=conversation_history
-                )
-            
-            state["generated_answer"] = generated_answer
-            state['total_token'] += total_token
-            state["current_status"] = "ANSWER_GENERATED"
-            logger.info("Answer generation completed")
+            report: Dict[str, Any] = {}
+            usage: Dict[str, Any] = {}
+            with track_stage(state["execution_metadata"], "llm"):
+                generated_answer, total_token = self._generate(state, report, usage)
+            record_prompt_budget(state["execution_metadata"], report)
+            record_llm_tier(state["execution_metadata"], usage)
+            self._apply_generated_answer(state, generated_answer, total_token)
 
+        except CircuitOpenError as e:
+            self._apply_degraded_answer(state, e)
         except Exception as e:
             logger.error(f"Error in answer generation: {str(e)}")
             state["current_status"] = "GENERATION_ERROR"
@@ -268,25 +781,75 @@ class RAGWorkflowNodes:
         state["processing_steps"] = state.get("processing_steps", []) + ["answer_generated"]
         
         return state
-    
-    def output_validation_node(self, state: RagState) -> RagState:
-        if state["current_status"] not in ["ANSWER_GENERATED", "QDRANT_CACHE_ANSWER"]:
+
+    def _astream_generate(self, state: RagState, usage: Dict[str, Any], report: Dict[str, Any]) -> AsyncIterator[str]:
+        quesion = state["question"]
+        conversation_history = state["conversation_history"]
+        if state["current_status"] == "GENERAL_QUERY":
+            return self.generate_answer.astream_general(
+                question=quesion, conversation_history=conversation_history, metadata=usage, report=report
+            )
+        return self.generate_answer.astream_intent(
+            question=quesion, related_text=state["relevant_context"],
+            conversation_history=conversation_history, metadata=usage,
+            documents=state.get("raw_documents"), report=report, task=self._answer_task(state),
+        )
+
+    async def aanswer_generation_node(self, state: RagState) -> RagState:
+        """
+        Node 4 (async): stream delta từ BedrockLLM.astream_infer ra LangGraph (stream_mode="custom")
+        để /chat/stream đẩy ngay xuống client, đồng thời ghép lại thành generated_answer.
+        """
+        if state["current_status"] not in ["DOCUMENTS_RETRIEVED", "GENERAL_QUERY"]:
             return state
-        logger.info("--- NODE: OUTPUT VALIDATION & GUARDRAIL ---")
-        
+        logger.info("--- NODE: ANSWER GENERATION (async, streaming) ---")
+
         try:
-            answer = state["generated_answer"]
-    
-            # result = self.bedrock_guardrails.apply_guardrail(
-            #     text=answer,
-            #     source_type="OUTPUT"
-            # )
+            writer = _stream_writer()
+            usage: Dict[str, Any] = {}
+            report: Dict[str, Any] = {}
+            chunks: List[str] = []
+            with track_stage(state["execution_metadata"], "llm"):
+                async for delta in self._astream_generate(state, usage, report):
+                    chunks.append(delta)
+                    writer({"type": "delta", "content": delta})
 
-            result = self.bedrock_guardrails.apply_guardrail(
-                text=answer,
-                source_type="OUTPUT"
-            )
+            prompt_tokens = usage.get("prompt_tokens") or 0
+            completion_tokens = usage.get("completion_tokens") or 0
+            state["execution_metadata"]["llm_usage"] = {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "cache_read_tokens": usage.get("cache_read_tokens") or 0,
+                "cache_write_tokens": usage.get("cache_write_tokens") or 0,
+                "cached": usage.get("cached", False),
+            }
+            record_llm_usage(usage)
+            record_llm_tier(state["execution_metadata"], usage)
+            record_prompt_budget(state["execution_metadata"], report)
+            record_cache(state["execution_metadata"], "llm_cache", bool(usage.get("cached")))
+            self._apply_generated_answer(state, "".join(chunks).strip(), prompt_tokens + completion_tokens)
 
+        except CircuitOpenError as e:
+            # mạch mở trước khi stream bắt đầu -> chưa có delta nào được gửi
+            writer({"type": "delta", "content": self._apply_degraded_answer(state, e)})
+        except Exception as e:
+            logger.error(f"Error in answer generation: {str(e)}")
+            state["current_status"] = "GENERATION_ERROR"
+            state["error_count"] = state.get("error_count", 0) + 1
+
+        state["processing_steps"] = state.get("processing_steps", []) + ["answer_generated"]
+
+        return state
+
+    def _apply_output_guardrail(self, state: RagState, result: Dict[str, Any]) -> None:
+        answer = state["generated_answer"]
+        if result.get("degraded"):
+            # mạch guardrail mở: fail-open -> trả câu trả lời chưa kiểm tra, ngược lại trả thông báo bận
+            _mark_degraded(state["execution_metadata"], "guardrail_output", result.get("error"))
+            fail_open = self.global_config.resilience_guardrails_fail_open
+            state["current_status"] = "OUTPUT_VALIDATED" if fail_open else "OUTPUT_BLOCKED"
+            state["final_response"] = answer if fail_open else DEGRADED_MESSAGE
+        else:
             action = result.get("action", "NONE")
             state["total_token"] += result['assessments'][-1]['invocationMetrics']['guardrailCoverage']['textCharacters']['total']
             if action == "GUARDRAIL_INTERVENED":
@@ -298,9 +861,44 @@ class RAGWorkflowNodes:
                 state["current_status"] = "OUTPUT_VALIDATED"
                 state["final_response"] = answer
                 logger.info("Output validation passed")
-            
-            self._append_history(state, role="user", content=state["question"])
-            self._append_history(state, role="assistant", content=state["final_response"])
+        
+        self._append_history(state, role="user", content=state["question"])
+        self._append_history(state, role="assistant", content=state["final_response"])
+    
+    def _semantic_cache_entry(self, state: RagState) -> Optional[tuple]:
+        """(vector, question, answer) để lưu semantic cache sau khi guardrail đầu ra chấp nhận."""
+        if state["current_status"] != "OUTPUT_VALIDATED" or state.get("query_vector") is None:
+            return None
+        # câu trả lời suy giảm / chưa qua guardrail không được cache
+        if state["execution_metadata"].get("degraded"):
+            return None
+        # lịch sử lúc này đã gồm đúng lượt hỏi-đáp hiện tại -> câu hỏi độc lập
+        if len(state.get("conversation_history") or []) > 2 or not self.semantic_cache.enabled:
+            return None
+        return state["query_vector"], state["question"], state["final_response"]
+
+    def output_validation_node(self, state: RagState) -> RagState:
+        if state["current_status"] not in ["ANSWER_GENERATED", "QDRANT_CACHE_ANSWER"]:
+            return state
+        logger.info("--- NODE: OUTPUT VALIDATION & GUARDRAIL ---")
+        
+        try:
+            answer = state["generated_answer"]
+    
+            # result = self.bedrock_guardrails.apply_guardrail(
+            #     text=answer,
+            #     source_type="OUTPUT"
+            # )
+
+            with track_stage(state["execution_metadata"], "guardrail_output"):
+                result = self.bedrock_guardrails.apply_guardrail(
+                    text=answer,
+                    source_type="OUTPUT"
+                )
+            self._apply_output_guardrail(state, result)
+            entry = self._semantic_cache_entry(state)
+            if entry:
+                self.semantic_cache.add(*entry)
         except Exception as e:
             logger.error(f"Error in output validation: {str(e)}")
             state["current_status"] = "OUTPUT_VALIDATION_ERROR"
@@ -309,6 +907,163 @@ class RAGWorkflowNodes:
         state["processing_steps"] = state.get("processing_steps", []) + ["output_validated"]
         
         return state
+
+    async def aoutput_validation_node(self, state: RagState) -> RagState:
+        if state["current_status"] not in ["ANSWER_GENERATED", "QDRANT_CACHE_ANSWER"]:
+            return state
+        logger.info("--- NODE: OUTPUT VALIDATION & GUARDRAIL (async) ---")
+
+        try:
+            with track_stage(state["execution_metadata"], "guardrail_output"):
+                result = await run_blocking(
+                    self.bedrock_guardrails.apply_guardrail,
+                    text=state["generated_answer"],
+                    source_type="OUTPUT"
+                )
+            self._apply_output_guardrail(state, result)
+            entry = self._semantic_cache_entry(state)
+            if entry:
+                await run_blocking(self.semantic_cache.add, *entry)
+        except Exception as e:
+            logger.error(f"Error in output validation: {str(e)}")
+            state["current_status"] = "OUTPUT_VALIDATION_ERROR"
+            state["error_count"] = state.get("error_count", 0) + 1
+
+        state["processing_steps"] = state.get("processing_steps", []) + ["output_validated"]
+
+        return state
     
+    # --- Xử lý hàng loạt ---
+
+    async def _abatch_analyse(self, state: RagState, sem: asyncio.Semaphore) -> RagState:
+        if state["current_status"] == "SMALL_TALK_ANSWER":
+            return state
+        async with sem:
+            state = await self.ainput_validation_node(state)
+            if state["current_status"] == "INPUT_BLOCKED":
+                return state
+            try:
+                state = await self.aquery_analysis_node(state)
+            except Exception as e:
+                logger.error(f"Error in intent routing: {str(e)}")
+                state["current_status"] = "ROUTING_ERROR"
+                state["error_count"] = state.get("error_count", 0) + 1
+            return state
+
+    async def _abatch_encode(self, states: List[RagState]) -> None:
+        """Một batch_encode cho các state chưa có query_vector."""
+        missing = [state for state in states if state.get("query_vector") is None]
+        if not missing:
+            return
+        with track_batch_stage([state["execution_metadata"] for state in missing], "embedding"):
+            vectors = await self.embedding.abatch_encode([state["question"].lower() for state in missing])
+        for state, vector in zip(missing, vectors):
+            state["query_vector"] = vector
+
+    async def _abatch_retrieve(self, states: List[RagState], rerank_batch_size: int) -> None:
+        """Một query_batch_points cho mỗi collection, rerank mọi cặp (query, doc) trong các batch lớn."""
+        metadatas = [state["execution_metadata"] for state in states]
+        routed = [(state, self._collections_from_intents(state["intents"])) for state in states]
+
+        by_collection: Dict[str, List[int]] = {}
+        for i, (_, collections) in enumerate(routed):
+            for name in collections:
+                by_collection.setdefault(name, []).append(i)
+
+        with track_batch_stage(metadatas, "qdrant"):
+            names = list(by_collection)
+            batches = await asyncio.gather(*(
+                run_blocking(
+                    self.database.search_batch,
+                    [states[i]["query_vector"] for i in by_collection[name]],
+                    name,
+                    10,
+                )
+                for name in names
+            ))
+        results: List[Dict[str, List[Dict[str, Any]]]] = [{} for _ in states]
+        for name, batch in zip(names, batches):
+            for i, docs in zip(by_collection[name], batch):
+                results[i][name] = docs
+
+        merged = [self.hybird_search.merge_candidates(collections, results[i]) for i, (_, collections) in enumerate(routed)]
+        pairs = [
+            (state["question"], doc.get("payload", {}).get("content", ""))
+            for (state, _), (candidates, _, _) in zip(routed, merged)
+            for doc in candidates
+        ]
+        with track_batch_stage(metadatas, "rerank"):
+            scores = await run_in_model_executor(self.reranker.score_pairs, pairs, rerank_batch_size)
+
+        offset = 0
+        for (state, _), (candidates, cached, contributing) in zip(routed, merged):
+            state_scores = scores[offset:offset + len(candidates)]
+            offset += len(candidates)
+            documents = self.hybird_search.select_ranked(candidates, state_scores, cached, 5, contributing) if candidates else cached
+            self._apply_retrieved_documents(state, documents)
+            state["processing_steps"] = state.get("processing_steps", []) + ["documents_retrieved"]
+
+    async def _abatch_finish(self, index: int, state: RagState, sem: asyncio.Semaphore) -> Tuple[int, RagState]:
+        async with sem:
+            state = await self.aanswer_generation_node(state)
+            state = await self.aoutput_validation_node(state)
+            return index, state
+
+    async def abatch_answer(self, questions: List[str], concurrency: Optional[int] = None) -> AsyncIterator[Tuple[int, RagState]]:
+        """
+        Xử lý N câu hỏi độc lập (không có lịch sử), trả về (index, state) theo thứ tự hoàn thành:
+        - small talk: trả lời mẫu ngay, không qua các bước dưới
+        - guardrail đầu vào + định tuyến: song song, tối đa `concurrency` lời gọi
+        - embedding: một lần batch_encode cho mọi câu hỏi hợp lệ
+        - Qdrant: một query_batch_points cho mỗi collection; rerank: mọi cặp (query, doc) theo batch lớn
+        - sinh câu trả lời + guardrail đầu ra: song song, tối đa `concurrency` lời gọi
+        """
+        sem = asyncio.Semaphore(max(1, int(concurrency or self.global_config.batch_concurrency)))
+        states = [self.small_talk_node(create_default_rag_state(question=q)) for q in questions]
+
+        if self.intent_classifier.ready:
+            # classifier intent cục bộ cần vector trước định tuyến: encode cả batch một lần
+            try:
+                await self._abatch_encode([state for state in states if state["current_status"] != "SMALL_TALK_ANSWER"])
+            except Exception as e:
+                logger.warning(f"Batch embedding before routing failed: {str(e)}")
+
+        states = list(await asyncio.gather(*(self._abatch_analyse(state, sem) for state in states)))
+        pending = [i for i, state in enumerate(states) if state["current_status"] in ["INTENT_ANALYZED", "GENERAL_QUERY"]]
+        pending_set = set(pending)
+        for i, state in enumerate(states):
+            if i not in pending_set:
+                yield i, state
+        if not pending:
+            return
+
+        try:
+            await self._abatch_encode([states[i] for i in pending])
+            for i in pending:
+                if self.semantic_cache.enabled:
+                    self._apply_semantic_cache(states[i], await run_blocking(self.semantic_cache.lookup, states[i]["query_vector"]))
+        except Exception as e:
+            logger.error(f"Error in batch embedding: {str(e)}")
+
+        for i in pending:
+            if states[i]["current_status"] == "SEMANTIC_CACHE_HIT":
+                yield i, states[i]
+        pending = [i for i in pending if states[i]["current_status"] != "SEMANTIC_CACHE_HIT"]
+
+        to_retrieve = [states[i] for i in pending if states[i]["current_status"] == "INTENT_ANALYZED"]
+        if to_retrieve:
+            try:
+                if any(state.get("query_vector") is None for state in to_retrieve):
+                    raise RuntimeError("missing query vectors")
+                await self._abatch_retrieve(to_retrieve, self.global_config.batch_rerank_batch_size)
+            except Exception as e:
+                logger.error(f"Error in batch document retrieval: {str(e)}")
+                for state in to_retrieve:
+                    state["current_status"] = "RETRIEVAL_ERROR"
+                    state["error_count"] = state.get("error_count", 0) + 1
+
+        for task in asyncio.as_completed([self._abatch_finish(i, states[i], sem) for i in pending]):
+            yield await task
+
     def upload_memory(self, state: RagState) -> RagState:
         pass
\ No newline at end of file
@@ -0,0 +1,258 @@
+"""
+Phân loại intent cục bộ bằng embedding câu hỏi (vector QwenEmbeddingModel đã tính cho retrieval), thay lời gọi LLM định tuyến.
+
+Nearest-centroid trên các tổ hợp intent ("general", "legal", "procedure", "legal+procedure"):
+centroid = trung bình vector đã chuẩn hoá của các câu hỏi cùng nhãn, điểm = cosine với từng centroid.
+Chỉ định tuyến cục bộ khi cosine cao nhất >= `min_similarity` và cách centroid thứ hai >= `min_margin`;
+còn lại rơi về QueryRoute (LLM). Khi `route_filters` bật, nhãn có "procedure" vẫn gọi LLM dù chắc chắn:
+classifier không trích xuất được bộ lọc payload (mã thủ tục, cấp thực hiện, ...).
+
+Huấn luyện (từ thư mục backend/):
+    python -m src.langgraph_rag.prompts.intent_classifier --data questions.jsonl
+    python -m src.langgraph_rag.prompts.intent_classifier --data questions.txt --teacher   # gán nhãn bằng QueryRoute
+
+Mỗi dòng JSONL: {"question": "...", "intents": {"procedure": true, "legal": false, "general": false}}
+hoặc {"question": "...", "label": "procedure"}; dòng thiếu nhãn (hoặc file .txt) cần --teacher.
+"""
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ..utils.config_utils import BaseConfig
+from ..utils.logger_utils import get_logger
+
+logger = get_logger(__name__)
+
+INTENT_KEYS = ("procedure", "legal", "general")
+
+
+def label_of(intents: Dict[str, Any]) -> str:
+    """Tổ hợp intent -> nhãn lớp; không có procedure / legal -> "general"."""
+    active = sorted(k for k in ("legal", "procedure") if intents.get(k))
+    return "+".join(active) if active else "general"
+
+
+def intents_of(label: str) -> Dict[str, bool]:
+    active = set(label.split("+"))
+    intents = {k: k in active for k in ("procedure", "legal")}
+    intents["general"] = not any(intents.values())
+    return intents
+
+
+def _normalize_rows(vectors: Any) -> np.ndarray:
+    matrix = np.asarray(vectors, dtype=np.float32)
+    matrix = matrix.reshape(1, -1) if matrix.ndim == 1 else matrix
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms > 0, norms, 1.0)
+
+
+@dataclass
+class IntentPrediction:
+    intents: Dict[str, bool]
+    label: str
+    similarity: float
+    margin: float
+    confident: bool
+    needs_filters: bool = False
+
+    @property
+    def local(self) -> bool:
+        """Định tuyến cục bộ được: đủ tin cậy và không cần LLM trích xuất bộ lọc."""
+        return self.confident and not self.needs_filters
+
+
+class IntentClassifier:
+    """
+    Centroid theo nhãn, lưu thành .npz (`services.intent_classifier.model_path`, mặc định <save_dir>/intent_classifier.npz).
+    File ghi kèm tên model embedding: đổi model embedding -> classifier tự tắt cho tới khi huấn luyện lại.
+    Giữ EWMA latency của LLM định tuyến để ước lượng thời gian tiết kiệm mỗi lần định tuyến cục bộ.
+    """
+
+    def __init__(self, global_config: BaseConfig):
+        self.enabled = global_config.intent_classifier_enabled
+        self.model_path = global_config.intent_classifier_model_path or os.path.join(global_config.save_dir, "intent_classifier.npz")
+        self.min_similarity = float(global_config.intent_classifier_min_similarity)
+        self.min_margin = float(global_config.intent_classifier_min_margin)
+        self.embedding_model_name = global_config.embedding_model_name
+        self.route_filters = bool(global_config.route_filters_enabled)
+
+        self.labels: List[str] = []
+        self.centroids: Optional[np.ndarray] = None
+        self._llm_latency = max(0.0, float(global_config.intent_classifier_llm_latency_prior_s))
+        self._lock = threading.Lock()
+        if self.enabled:
+            self.load()
+
+    @property
+    def ready(self) -> bool:
+        return self.enabled and self.centroids is not None
+
+    # --- huấn luyện / lưu ---
+
+    def fit(self, vectors: Any, labels: Sequence[str]) -> "IntentClassifier":
+        matrix = _normalize_rows(vectors)
+        self.labels = sorted(set(labels))
+        if len(self.labels) < 2:
+            raise ValueError(f"Need at least two intent labels to train, got {self.labels}")
+        label_array = np.asarray(labels)
+        self.centroids = _normalize_rows(np.stack([matrix[label_array == label].mean(axis=0) for label in self.labels]))
+        return self
+
+    def save(self, path: Optional[str] = None) -> str:
+        path = path or self.model_path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        np.savez(path, centroids=self.centroids, labels=np.asarray(self.labels), embedding_model_name=np.asarray(self.embedding_model_name))
+        return path
+
+    def load(self, path: Optional[str] = None) -> bool:
+        path = path or self.model_path
+        if not os.path.exists(path):
+            logger.info(f"[IntentClassifier] No trained model at {path}, routing every question with the LLM")
+            return False
+        with np.load(path) as data:
+            trained_for = str(data["embedding_model_name"])
+            if trained_for != self.embedding_model_name:
+                logger.warning(f"[IntentClassifier] {path} was trained on {trained_for}, not {self.embedding_model_name}; disabled")
+                return False
+            self.centroids = data["centroids"].astype(np.float32)
+            self.labels = [str(label) for label in data["labels"]]
+        logger.info(f"[IntentClassifier] Loaded {len(self.labels)} intent centroids from {path}")
+        return True
+
+    # --- dự đoán ---
+
+    def scores(self, vectors: Any) -> np.ndarray:
+        return _normalize_rows(vectors) @ self.centroids.T
+
+    def _prediction(self, row: np.ndarray) -> IntentPrediction:
+        order = np.argsort(row)[::-1]
+        best = float(row[order[0]])
+        margin = best - float(row[order[1]])
+        label = self.labels[int(order[0])]
+        return IntentPrediction(
+            intents=intents_of(label),
+            label=label,
+            similarity=round(best, 4),
+            margin=round(margin, 4),
+            confident=best >= self.min_similarity and margin >= self.min_margin,
+            needs_filters=self.route_filters and "procedure" in label.split("+"),
+        )
+
+    def predict(self, vector: Any) -> Optional[IntentPrediction]:
+        if not self.ready:
+            return None
+        return self._prediction(self.scores(vector)[0])
+
+    def predict_many(self, vectors: Any) -> List[IntentPrediction]:
+        return [self._prediction(row) for row in self.scores(vectors)]
+
+    # --- latency tiết kiệm ---
+
+    def observe_llm_latency(self, seconds: float, alpha: float = 0.1) -> None:
+        """Cập nhật EWMA latency của LLM định tuyến (chỉ lời gọi thật, không tính cache hit)."""
+        with self._lock:
+            self._llm_latency = seconds if self._llm_latency <= 0 else (1 - alpha) * self._llm_latency + alpha * seconds
+
+    def saved_seconds(self, local_seconds: float) -> float:
+        return max(0.0, self._llm_latency - local_seconds)
+
+
+# --- CLI huấn luyện ---
+
+def _read_examples(path: str) -> List[Tuple[str, Optional[str]]]:
+    examples: List[Tuple[str, Optional[str]]] = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if not path.endswith(".jsonl"):
+                examples.append((line, None))
+                continue
+            row = json.loads(line)
+            if "intents" in row:
+                label = label_of(row["intents"])
+            elif row.get("label"):
+                label = label_of({k: True for k in str(row["label"]).split("+")})
+            else:
+                label = None
+            examples.append((row["question"], label))
+    return examples
+
+
+def _teacher_labels(config: BaseConfig, questions: List[str]) -> List[str]:
+    from .query_route import QueryRoute
+
+    router = QueryRoute(config)
+    labels = []
+    for question in questions:
+        intents, _ = router.query_route(question)
+        labels.append(label_of(intents if isinstance(intents, dict) else {}))
+    return labels
+
+
+def _evaluate(classifier: IntentClassifier, vectors: np.ndarray, labels: List[str]) -> Dict[str, float]:
+    predictions = classifier.predict_many(vectors)
+    local = [(p, label) for p, label in zip(predictions, labels) if p.local]
+    return {
+        "examples": len(labels),
+        "local_share": len(local) / max(1, len(labels)),
+        # chắc chắn nhưng vẫn gọi LLM để lấy bộ lọc payload
+        "filter_share": sum(p.confident and p.needs_filters for p in predictions) / max(1, len(labels)),
+        "local_accuracy": sum(p.label == label for p, label in local) / max(1, len(local)),
+        "overall_accuracy": sum(p.label == label for p, label in zip(predictions, labels)) / max(1, len(labels)),
+    }
+
+
+def train(config: BaseConfig, data: str, teacher: bool = False, holdout: float = 0.2, seed: int = 0, output: Optional[str] = None) -> Dict[str, float]:
+    from ..embeddings.qwen_embedding_model import QwenEmbeddingModel
+
+    examples = _read_examples(data)
+    missing = [question for question, label in examples if label is None]
+    if missing:
+        if not teacher:
+            raise ValueError(f"{len(missing)} questions in {data} have no label; add labels or pass --teacher")
+        labelled = iter(_teacher_labels(config, missing))
+        examples = [(question, label if label is not None else next(labelled)) for question, label in examples]
+
+    random.Random(seed).shuffle(examples)
+    questions = [question for question, _ in examples]
+    labels = [label for _, label in examples]
+    started = time.perf_counter()
+    vectors = np.asarray(QwenEmbeddingModel(global_config=config).batch_encode([q.lower() for q in questions]))
+    logger.info(f"[IntentClassifier] Encoded {len(questions)} questions in {time.perf_counter() - started:.1f}s")
+
+    split = int(len(examples) * (1 - holdout)) if holdout > 0 else len(examples)
+    classifier = IntentClassifier(config)
+    classifier.enabled = True
+    report = {}
+    if 0 < split < len(examples):
+        classifier.fit(vectors[:split], labels[:split])
+        report = _evaluate(classifier, vectors[split:], labels[split:])
+    # mô hình cuối dùng toàn bộ dữ liệu
+    classifier.fit(vectors, labels)
+    path = classifier.save(output)
+    logger.info(f"[IntentClassifier] Saved {len(classifier.labels)} centroids to {path}")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Huấn luyện classifier intent cục bộ (nearest-centroid trên embedding câu hỏi)")
+    parser.add_argument("--data", required=True, help=".jsonl có nhãn (question + intents | label) hoặc .txt mỗi dòng một câu hỏi")
+    parser.add_argument("--teacher", action="store_true", help="gán nhãn câu hỏi thiếu nhãn bằng QueryRoute (LLM)")
+    parser.add_argument("--holdout", type=float, default=0.2, help="tỉ lệ dữ liệu giữ lại để đánh giá")
+    parser.add_argument("--output", default=None, help="đường dẫn .npz, mặc định services.intent_classifier.model_path")
+    args = parser.parse_args()
+    report = train(BaseConfig(), args.data, teacher=args.teacher, holdout=args.holdout, output=args.output)
+    if report:
+        print(
+            f"holdout={report['examples']} local_share={100 * report['local_share']:.1f}% filter_share={100 * report['filter_share']:.1f}% "
+            f"local_accuracy={100 * report['local_accuracy']:.1f}% overall_accuracy={100 * report['overall_accuracy']:.1f}%"
+        )
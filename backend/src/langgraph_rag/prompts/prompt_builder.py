@@ -0,0 +1,173 @@
+from dataclasses import dataclass, field
+from string import Formatter
+from typing import Any, Dict, List, Optional
+
+from ..utils.config_utils import BaseConfig
+from ..utils.llm_utils import TextChatMessage, DocumentProcessor
+from ..utils.logger_utils import get_logger
+from ..utils.token_utils import MESSAGE_OVERHEAD_TOKENS, get_token_counter, normalize_whitespace, strip_indent
+
+logger = get_logger(__name__)
+
+
+@dataclass(frozen=True)
+class PromptTemplate:
+    """
+    Template biên dịch sẵn lúc import, bố cục "tiền tố ổn định":
+    - `system`: khối chỉ dẫn tĩnh, không có placeholder -> giống hệt nhau ở mọi request (cache được phía provider).
+    - `user`: phần biến đổi ({related_text}, {question}) đặt cuối cùng, sau lịch sử hội thoại.
+    - `raw_system` / `raw_user`: bản gốc còn thụt lề, chỉ để đo số token tiết kiệm nhờ bỏ thụt lề.
+    """
+    name: str
+    system: str
+    user: str
+    raw_system: str = field(default="", repr=False, compare=False)
+    raw_user: str = field(default="", repr=False, compare=False)
+
+    @classmethod
+    def compile(cls, name: str, system: str, user: str) -> "PromptTemplate":
+        raw_system, raw_user = system, user
+        system, user = strip_indent(system), strip_indent(user)
+        fields = [f for _, f, _, _ in Formatter().parse(system) if f is not None]
+        if fields:
+            raise ValueError(f"PromptTemplate {name}: system block must be static, found placeholders {fields}")
+        return cls(name=name, system=system, user=user, raw_system=raw_system, raw_user=raw_user)
+
+    def render_user(self, question: str, related_text: str = "") -> str:
+        return self.user.format(question=normalize_whitespace(question), related_text=normalize_whitespace(related_text))
+
+
+@dataclass
+class BuiltPrompt:
+    messages: List[TextChatMessage]
+    history: List[TextChatMessage] # lịch sử còn giữ lại sau khi cắt
+    documents: List[Dict[str, Any]] # tài liệu còn giữ lại, theo thứ tự rerank ban đầu
+    system: str # khối system tĩnh
+    user: str # user message chưa chèn ngữ cảnh (dùng làm khoá cache cùng id tài liệu)
+    report: Dict[str, Any] = field(default_factory=dict)
+
+
+class PromptBuilder:
+    """
+    Ghép prompt theo thứ tự [system tĩnh] + lịch sử + [user: ngữ cảnh + câu hỏi],
+    trong ngân sách token của model (đếm bằng tokenizer cục bộ):
+    1. Quá ngân sách -> bỏ lịch sử hội thoại từ cũ nhất (theo cặp user/assistant).
+    2. Vẫn quá -> bỏ tài liệu có rerank_score thấp nhất (luôn giữ `min_documents` tài liệu tốt nhất).
+    Số token tiết kiệm được (cắt theo ngân sách + bỏ thụt lề template) ghi vào `BuiltPrompt.report`.
+    """
+
+    def __init__(self, global_config: BaseConfig) -> None:
+        self.enabled = global_config.prompt_budget_enabled
+        self.budgets = dict(global_config.prompt_budget_max_input_tokens or {})
+        self.default_max_input_tokens = int(global_config.prompt_budget_default_max_input_tokens)
+        self.max_input_tokens = int(self.budgets.get(global_config.llm_name, self.default_max_input_tokens))
+        self.min_documents = max(0, int(global_config.prompt_budget_min_documents))
+        self.counter = get_token_counter(global_config.prompt_budget_tokenizer)
+        self._indent_saved: Dict[str, int] = {}
+
+    def budget_for(self, model: Optional[str]) -> int:
+        """Ngân sách token đầu vào của model (model tier khác llm_name có ngân sách riêng)."""
+        if not model:
+            return self.max_input_tokens
+        return int(self.budgets.get(model, self.default_max_input_tokens))
+
+    def indent_tokens_saved(self, template: PromptTemplate) -> int:
+        """Token bớt được nhờ strip_indent: template gốc (còn thụt lề) trừ template đã biên dịch; đếm một lần mỗi template."""
+        if template.name not in self._indent_saved:
+            raw = self.counter.count(template.raw_system) + self.counter.count(template.raw_user) if template.raw_system else 0
+            compiled = self.counter.count(template.system) + self.counter.count(template.user)
+            self._indent_saved[template.name] = max(0, raw - compiled)
+        return self._indent_saved[template.name]
+
+    @staticmethod
+    def render_documents(documents: List[Dict[str, Any]]) -> str:
+        return "".join(
+            DocumentProcessor.format_document_content(payload=doc["payload"], doc_id=idx + 1)
+            for idx, doc in enumerate(documents)
+        )
+
+    def build(
+        self,
+        template: PromptTemplate,
+        question: str,
+        conversation_history: List[TextChatMessage],
+        documents: Optional[List[Dict[str, Any]]] = None,
+        related_text: str = "",
+        model: Optional[str] = None,
+    ) -> BuiltPrompt:
+        """
+        Có `documents` -> ngữ cảnh được dựng lại từ các tài liệu còn giữ; không có -> dùng nguyên `related_text`.
+        `model`: model sẽ nhận prompt (tier của tác vụ), quyết định ngân sách; None -> llm_name.
+        """
+        budget = self.budget_for(model)
+        system = template.system
+        user = template.render_user(question)
+
+        history = list(conversation_history or [])
+        documents = list(documents or [])
+
+        base_tokens = self.counter.count(system) + self.counter.count(user) + 2 * MESSAGE_OVERHEAD_TOKENS
+        history_tokens = [self.counter.count_message(m) for m in history]
+        if documents:
+            doc_tokens = [self.counter.count(DocumentProcessor.format_document_content(d["payload"], i + 1)) for i, d in enumerate(documents)]
+        else:
+            doc_tokens = [self.counter.count(related_text)] if related_text else []
+
+        tokens_before = base_tokens + sum(history_tokens) + sum(doc_tokens)
+        total = tokens_before
+        # bản tóm tắt hội thoại (message "system" đầu lịch sử) không bị cắt
+        pinned = 1 if history and history[0].get("role") == "system" else 0
+        history_dropped = 0
+        kept_docs = list(range(len(documents)))
+
+        if self.enabled and total > budget:
+            # 1) lịch sử: bỏ từ cũ nhất, không để lịch sử bắt đầu bằng câu trả lời của assistant
+            while pinned + history_dropped < len(history) and (
+                total > budget or history[pinned + history_dropped].get("role") == "assistant"
+            ):
+                total -= history_tokens[pinned + history_dropped]
+                history_dropped += 1
+
+            # 2) tài liệu: bỏ tài liệu có rerank_score thấp nhất
+            if total > budget and documents:
+                by_score = sorted(kept_docs, key=lambda i: documents[i].get("rerank_score", documents[i].get("score", 0.0)))
+                dropped = set()
+                for i in by_score:
+                    if total <= budget or len(documents) - len(dropped) <= self.min_documents:
+                        break
+                    dropped.add(i)
+                    total -= doc_tokens[i]
+                kept_docs = [i for i in kept_docs if i not in dropped]
+
+            if total > budget:
+                logger.warning(f"[PromptBuilder] Prompt still {total} tokens after trimming (budget {budget})")
+
+        kept_history = history[:pinned] + history[pinned + history_dropped:]
+        kept_documents = [documents[i] for i in kept_docs]
+        context = self.render_documents(kept_documents) if documents else related_text
+
+        # system tĩnh đứng đầu, lịch sử (tiền tố chung giữa các lượt của session) ở giữa, phần biến đổi ở cuối
+        messages: List[TextChatMessage] = [{"role": "system", "content": system}] + kept_history + [
+            {"role": "user", "content": template.render_user(question, context)},
+        ]
+        trimmed_saved = tokens_before - total
+        return BuiltPrompt(
+            messages=messages,
+            history=kept_history,
+            documents=kept_documents,
+            system=system,
+            user=user,
+            report={
+                "budget": budget,
+                "tokens_before": tokens_before,
+                "tokens_after": total,
+                "tokens_saved": trimmed_saved,
+                "static_prefix_tokens": self.counter.count(system) + MESSAGE_OVERHEAD_TOKENS,
+                "history_tokens_saved": sum(history_tokens[pinned:pinned + history_dropped]),
+                "document_tokens_saved": trimmed_saved - sum(history_tokens[pinned:pinned + history_dropped]),
+                # không nằm trong tokens_before / tokens_saved: thụt lề đã bỏ lúc import
+                "indent_tokens_saved": self.indent_tokens_saved(template),
+                "history_dropped": history_dropped,
+                "documents_dropped": len(documents) - len(kept_documents),
+            },
+        )
@@ -1,30 +1,30 @@
 import json
 import re
-from typing import List
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+from ..filtering.qdrant_filter_procedure import QdrantFilterProcedure
+from ..filtering.test_filter import FORMATTED_INDEXES_PROCEDURE
 from ..llm.bedrock_llm import BedrockLLM
 from ..utils.logger_utils import get_logger
 from ..utils.config_utils import BaseConfig
 from ..utils.llm_utils import TextChatMessage
+from ..utils.singleflight_utils import normalize_question
+from ..utils.token_utils import normalize_whitespace, strip_indent
 
 logger = get_logger(__name__)
 
 
-class QueryRoute:
-    
-    def __init__(self, global_config : BaseConfig):
-        self.bedrock_llm = BedrockLLM(global_config= global_config)
-
-    def query_route(self, question):
-        prompt_route: List[TextChatMessage] = [
-            {
-                "role": "system", 
-                "content": """
+# Prompt định tuyến bỏ thụt lề một lần lúc import; system tĩnh đứng đầu, câu hỏi chỉ nằm ở user message.
+_ROUTE_DOMAINS = """
                     Bạn là một hệ thống định tuyến truy vấn thông minh và chính xác, bạn sẽ được cung cấp một câu hỏi. Nhiệm vụ của bạn là phân tích cẩn thận một yêu cầu của người dùng, sau đó xác định xem yêu cầu đó có liên quan đến bất kỳ lĩnh vực chuyên môn nào được liệt kê dưới đây hay không. Đối với mỗi lĩnh vực, bạn phải trả về giá trị boolean (true hoặc false) để chỉ ra sự liên quan.
                     Các lĩnh vực chuyên môn mà bạn cần xem xét:
                     - **procedure**: Thủ tục hành chính Là quy trình cụ thể để công dân hoặc tổ chức thực hiện quyền, nghĩa vụ được quy định trong luật, với vai trò Là cách thức thực tế để triển khai luật, có hướng dẫn chi tiết về hồ sơ, biểu mẫu, thời gian, cơ quan giải quyết
                     - **legal**: là văn bản pháp luật quy định các nguyên tắc, quyền và nghĩa vụ liên quan đến nơi cư trú của công dân Việt Nam, với vai trò Là đưa ra quy định chung, nguyên tắc, quyền - nghĩa vụ, và cơ sở pháp lý cho việc cư trú của công dân.
                     - **general**: là những câu hỏi không liên quan gì đến các lĩnh vực trên,thường là các câu hỏi giao tiếp đơn giản, chào hỏi, cảm ơn, giới thiệu,... hoặc những nội dung không liên quan đến cư trú.
 
+"""
+
+ROUTE_SYSTEM_PROMPT = strip_indent(_ROUTE_DOMAINS + """
                     # Trả lời dưới dạng **JSON thuần** (pure JSON), không giải thích, không chú thích, không kèm văn bản ngoài. Đặt toàn bộ kết quả trong ba dấu nháy ngược (```).
                     Đối tượng JSON phải tuân thủ cấu trúc sau:
                     ```json
@@ -33,11 +33,9 @@ class QueryRoute:
                     "legal": <boolean>,
                     "general": <boolean>
                     }
-                """
-            },
-            {
-                "role": "user", 
-                "content": f"""
+                """)
+
+ROUTE_USER_TEMPLATE = strip_indent("""
                     Nhiệm vụ của bạn là phân tích...
                     Câu hỏi người dùng:
                     \"\"\"{question}\"\"\"
@@ -48,23 +46,153 @@ class QueryRoute:
                     "legal": "Điền kết quả phân loại vào đây",
                     "general": "Điền kết quả phân loại vào đây"
                     }}
-                """
-            },
-        ]
+                """)
+
+
+# Trường payload có index của collection thủ tục (dòng "- <trường> - <kiểu>")
+PROCEDURE_FILTER_FIELDS = tuple(
+    line.strip().lstrip("- ").split(" - ")[0] for line in FORMATTED_INDEXES_PROCEDURE.splitlines() if line.strip()
+)
+
+# Định tuyến + trích xuất bộ lọc payload trong cùng một lời gọi (services.route_filters)
+ROUTE_FILTER_SYSTEM_PROMPT = strip_indent(_ROUTE_DOMAINS + """
+                    Đồng thời, nếu procedure = true, hãy trích xuất bộ lọc payload để tìm kiếm thủ tục hành chính:
+                    - Chỉ dùng các trường trong danh sách sau (tên trường - kiểu):
+                    <indexes>
+                    - Chỉ sinh điều kiện khi người dùng nêu rõ giá trị (vd: mã thủ tục "1.002755", cấp thực hiện "Cấp Xã", lĩnh vực "Cư trú"). Không suy đoán; không chắc chắn thì để bộ lọc rỗng.
+                    - Điều kiện loại trừ đặt trong "must_not", các điều kiện còn lại trong "must".
+                    - op là "eq" (một giá trị) hoặc "in" (danh sách giá trị).
+                    - source_section chỉ nhận một trong: "cách thức thực hiện", "thành phần hồ sơ", "căn cứ pháp lý".
+
+                    # Trả lời dưới dạng **JSON thuần** (pure JSON), không giải thích, không chú thích, không kèm văn bản ngoài. Đặt toàn bộ kết quả trong ba dấu nháy ngược (```).
+                    Đối tượng JSON phải tuân thủ cấu trúc sau:
+                    ```json
+                    {
+                    "intents": {"procedure": <boolean>, "legal": <boolean>, "general": <boolean>},
+                    "filters": {"must": [{"key": "<trường>", "op": "eq", "value": "<giá trị>"}], "must_not": []}
+                    }
+                """).replace("<indexes>", FORMATTED_INDEXES_PROCEDURE)
+
+ROUTE_FILTER_USER_TEMPLATE = strip_indent("""
+                    Nhiệm vụ của bạn là phân tích...
+                    Câu hỏi người dùng:
+                    \"\"\"{question}\"\"\"
+                    Assistant:
+                """)
 
-        response_text, metadata, cached = self.bedrock_llm.infer(messages=prompt_route)
 
+@dataclass
+class RouteDecision:
+    intents: Dict[str, Any]
+    # spec bộ lọc đã kiểm tra bằng QdrantFilterProcedure.build ({"must": [{"key", "op", "value"}], ...}),
+    # chỉ áp dụng cho các collection trong services.route_filters.collections; None = không lọc
+    filters: Optional[Dict[str, Any]]
+    total_token: int
+    cached: bool = False
+
+
+class QueryRoute:
+    
+    def __init__(self, global_config : BaseConfig):
+        self.bedrock_llm = BedrockLLM(global_config= global_config)
+        self.filters_enabled = global_config.route_filters_enabled
+        self.filters_max_tokens = int(global_config.route_filters_max_tokens)
+        self.filter_builder = QdrantFilterProcedure(global_config) if self.filters_enabled else None
+
+    def _build_messages(self, question: str) -> List[TextChatMessage]:
+        if self.filters_enabled:
+            return [
+                {"role": "system", "content": ROUTE_FILTER_SYSTEM_PROMPT},
+                {"role": "user", "content": ROUTE_FILTER_USER_TEMPLATE.format(question=normalize_whitespace(question))},
+            ]
+        prompt_route: List[TextChatMessage] = [
+            {"role": "system", "content": ROUTE_SYSTEM_PROMPT},
+            {"role": "user", "content": ROUTE_USER_TEMPLATE.format(question=normalize_whitespace(question))},
+        ]
+        return prompt_route
+
+    @staticmethod
+    def _parse_json(response_text: str) -> Any:
         # Trích xuất JSON từ bên trong dấu ``` nếu có
         match = re.search(r"```json(.*?)```", response_text, re.DOTALL)
         if match:
             json_text = match.group(1).strip()
         else:
             json_text = response_text.strip()
+        return json.loads(json_text)
 
-        response = json.loads(json_text)
+    @classmethod
+    def _parse_response(cls, response_text: str, metadata: dict):
+        response = cls._parse_json(response_text)
         total_token = metadata['prompt_tokens'] + metadata['completion_tokens']
         return response, total_token
 
+    def _cache_key(self, question: str) -> Optional[List[TextChatMessage]]:
+        if self.filters_enabled:
+            # giá trị bộ lọc phân biệt hoa/thường (mã thủ tục, tên cơ quan) -> khoá theo messages thật
+            return None
+        # câu hỏi chỉ khác hoa/thường, khoảng trắng, dấu câu cuối -> cùng kết quả định tuyến
+        return self._build_messages(normalize_question(question))
+
+    def _call_params(self, question: str) -> Dict[str, Any]:
+        params: Dict[str, Any] = {
+            "messages": self._build_messages(question), "cache_policy": "routing",
+            "cache_key": self._cache_key(question), "task": "routing",
+            # câu trả lời không phải JSON không được ghi cache (ném JSONDecodeError cho node định tuyến)
+            "validate": self._parse_json,
+        }
+        if self.filters_enabled:
+            # JSON có thêm bộ lọc dài hơn JSON intent một dòng của tier routing
+            params["max_tokens"] = self.filters_max_tokens
+        return params
+
+    def _validate_filters(self, spec: Any) -> Optional[Dict[str, Any]]:
+        """Giữ điều kiện trên trường có index, kiểm tra bằng QdrantFilterProcedure.build; spec lỗi / rỗng -> None."""
+        if not isinstance(spec, dict):
+            return None
+        cleaned: Dict[str, List[Dict[str, Any]]] = {}
+        for group in ("must", "must_not"):
+            items = spec.get(group) or []
+            if isinstance(items, dict):
+                items = [items]
+            kept = [
+                item for item in items
+                if isinstance(item, dict) and item.get("key") in PROCEDURE_FILTER_FIELDS and item.get("value") not in (None, "", [])
+            ]
+            if kept:
+                cleaned[group] = kept
+        if not cleaned:
+            return None
+        try:
+            self.filter_builder.build(cleaned)
+        except (TypeError, ValueError) as e:
+            logger.warning(f"[QueryRoute] Invalid filter spec {cleaned}: {e}")
+            return None
+        return cleaned
+
+    def _decide(self, response_text: str, metadata: dict, cached: bool = False) -> RouteDecision:
+        response, total_token = self._parse_response(response_text, metadata)
+        # model có thể trả JSON intent phẳng như prompt cũ
+        intents = response.get("intents", response) if isinstance(response, dict) else response
+        filters = None
+        if self.filters_enabled and isinstance(intents, dict) and intents.get("procedure"):
+            filters = self._validate_filters(response.get("filters"))
+        return RouteDecision(intents=intents, filters=filters, total_token=total_token, cached=cached)
+
+    def route(self, question: str) -> RouteDecision:
+        """Intent (+ bộ lọc payload nếu services.route_filters.enabled) trong một lời gọi LLM."""
+        response_text, metadata, cached = self.bedrock_llm.infer(**self._call_params(question))
+        return self._decide(response_text, metadata, cached)
+
+    async def aroute(self, question: str) -> RouteDecision:
+        """Bản async của route (BedrockLLM.ainfer), để node của graph await trực tiếp."""
+        response_text, metadata, cached = await self.bedrock_llm.ainfer(**self._call_params(question))
+        return self._decide(response_text, metadata, cached)
+
+    def query_route(self, question):
+        decision = self.route(question)
+        return decision.intents, decision.total_token
+
 # # run: python -m langgraph_rag.prompts.query_route
 # if __name__ == "__main__":
 #     query_route = QueryRoute(global_config=BaseConfig())
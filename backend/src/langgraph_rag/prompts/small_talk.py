@@ -0,0 +1,138 @@
+"""
+Đường tắt cho câu chào hỏi / cảm ơn / tạm biệt: trả lời từ bảng mẫu, không gọi guardrail, LLM định tuyến hay LLM trả lời.
+
+Câu hỏi được chuẩn hoá (NFC, casefold, dấu câu -> khoảng trắng) rồi tách từ, giữ nguyên dấu: bỏ dấu làm các từ khác
+nghĩa trùng nhau ("đá" / "đã" / "dạ", "vàng" / "vâng"). Chỉ khi câu hỏi không có dấu nào (gõ không dấu) mới so với
+dạng đã bỏ dấu (NFD, bỏ dấu, đ -> d) của các cụm.
+Trie theo từ của các cụm small talk (đã chuẩn hoá khi khởi tạo) phải phủ toàn bộ câu, chỉ cho phép xen các từ đệm
+("ạ", "nhé", "bạn", ...): "Chào bạn ạ!" khớp, "chào bạn, thủ tục tạm trú cần gì?" không khớp -> đi workflow bình thường.
+Phiên đã có lịch sử chỉ trả lời mẫu cho chào / cảm ơn / tạm biệt: "vâng", "được rồi", ... có thể là câu trả lời
+cho câu hỏi lại của bot nên phải đi workflow để tiếp tục hội thoại.
+"""
+import unicodedata
+from typing import Dict, List, Optional, Tuple
+
+from ..utils.config_utils import BaseConfig
+
+# cụm từ theo loại; loại đứng trước được ưu tiên khi một câu khớp nhiều loại ("chào bạn, cảm ơn nhé" -> thanks)
+SMALL_TALK_PHRASES: Dict[str, List[str]] = {
+    "identity": ["bạn là ai", "bạn là gì", "bạn tên là gì", "bạn tên gì", "bạn làm được gì", "bạn giúp được gì", "bạn có thể làm gì"],
+    "thanks": ["cảm ơn", "cám ơn", "cảm ơn nhiều", "thank you", "thanks", "thank", "tks", "thanks you"],
+    "goodbye": ["tạm biệt", "bye", "bye bye", "goodbye", "hẹn gặp lại", "chào tạm biệt"],
+    "greeting": ["xin chào", "chào", "chào buổi sáng", "chào buổi chiều", "chào buổi tối", "hello", "hi", "hey", "alo", "helo"],
+    "ack": ["ok", "okay", "oke", "okie", "vâng", "dạ", "được rồi", "tôi hiểu rồi", "mình hiểu rồi", "hiểu rồi", "rõ rồi"],
+}
+
+# từ đệm được phép xen giữa / quanh các cụm từ, tự nó không phải small talk
+SMALL_TALK_FILLERS = [
+    "ạ", "à", "nhé", "nha", "nhá", "ơi", "bạn", "bot", "ad", "admin", "em", "anh", "chị", "mình", "tôi",
+    "rất", "nhiều", "lắm", "nhen", "hihi", "haha", "vậy", "nhé bạn", "ok ạ",
+]
+
+# loại trả lời mẫu được cả khi phiên đã có lịch sử
+SMALL_TALK_STANDALONE = ("greeting", "thanks", "goodbye")
+
+SMALL_TALK_TEMPLATES: Dict[str, str] = {
+    "greeting": "Xin chào! Tôi là trợ lý tư vấn thủ tục hành chính về cư trú. Bạn cần hỗ trợ thủ tục nào?",
+    "thanks": "Rất vui được hỗ trợ bạn! Nếu còn thắc mắc về thủ tục cư trú, bạn cứ hỏi nhé.",
+    "goodbye": "Tạm biệt bạn! Hẹn gặp lại khi bạn cần hỗ trợ về thủ tục cư trú.",
+    "identity": "Tôi là trợ lý tư vấn thủ tục hành chính và quy định pháp luật về cư trú (đăng ký thường trú, tạm trú, lưu trú, ...). Bạn cần hỗ trợ thủ tục nào?",
+    "ack": "Vâng. Bạn cần hỗ trợ thêm thủ tục nào về cư trú không?",
+}
+
+_END = "$"
+_FILLER = "filler"
+
+
+def _split_words(text: str) -> List[str]:
+    return "".join(ch if ch.isalnum() else " " for ch in text).split()
+
+
+def tokenize_vietnamese(text: str) -> List[str]:
+    """'Chào bạn ạ!' -> ['chào', 'bạn', 'ạ']."""
+    return _split_words(unicodedata.normalize("NFC", (text or "").casefold()))
+
+
+def fold_vietnamese(text: str) -> List[str]:
+    """'Chào bạn ạ!' -> ['chao', 'ban', 'a']."""
+    decomposed = unicodedata.normalize("NFD", text or "").casefold().replace("đ", "d")
+    return _split_words("".join(ch for ch in decomposed if unicodedata.category(ch) != "Mn"))
+
+
+class SmallTalkMatcher:
+    """Hai trie theo từ (giữ dấu / bỏ dấu) dựng một lần; match phủ toàn câu bằng quy hoạch động trên vị trí từ."""
+
+    def __init__(self, phrases: Dict[str, List[str]] = None, fillers: List[str] = None, max_words: int = 12):
+        self.max_words = max(1, int(max_words))
+        self.priority = {category: rank for rank, category in enumerate(phrases or SMALL_TALK_PHRASES)}
+        # trie giữ dấu cho câu có dấu, trie bỏ dấu chỉ dùng cho câu gõ không dấu
+        self._trie: Dict[str, dict] = {}
+        self._folded_trie: Dict[str, dict] = {}
+        entries = [(phrase, category) for category, items in (phrases or SMALL_TALK_PHRASES).items() for phrase in items]
+        entries += [(filler, _FILLER) for filler in (fillers if fillers is not None else SMALL_TALK_FILLERS)]
+        for text, category in entries:
+            self._insert(self._trie, tokenize_vietnamese(text), category)
+            self._insert(self._folded_trie, fold_vietnamese(text), category)
+
+    @staticmethod
+    def _insert(trie: Dict[str, dict], words: List[str], category: str) -> None:
+        if not words:
+            return
+        node = trie
+        for word in words:
+            node = node.setdefault(word, {})
+        # cụm trùng giữa small talk và từ đệm -> giữ small talk
+        if node.get(_END) in (None, _FILLER):
+            node[_END] = category
+
+    @staticmethod
+    def _matches_from(trie: Dict[str, dict], words: List[str], start: int) -> List[Tuple[int, str]]:
+        out = []
+        node = trie
+        for end in range(start, len(words)):
+            node = node.get(words[end])
+            if node is None:
+                break
+            if _END in node:
+                out.append((end + 1, node[_END]))
+        return out
+
+    def match(self, text: str) -> Optional[str]:
+        """Loại small talk nếu cả câu chỉ gồm cụm small talk + từ đệm (ít nhất một cụm small talk), ngược lại None."""
+        words = tokenize_vietnamese(text)
+        if not words or len(words) > self.max_words:
+            return None
+        # fold không đổi gì -> câu không có dấu, so với các cụm đã bỏ dấu
+        trie = self._folded_trie if fold_vietnamese(text) == words else self._trie
+        # best[i]: loại ưu tiên nhất trên một cách phủ words[:i] ("" = chỉ từ đệm), None = không phủ được
+        best: List[Optional[str]] = [None] * (len(words) + 1)
+        best[0] = ""
+        for start in range(len(words)):
+            if best[start] is None:
+                continue
+            for end, category in self._matches_from(trie, words, start):
+                merged = best[start] if category == _FILLER else self._prefer(best[start], category)
+                best[end] = merged if best[end] is None else self._prefer(best[end], merged)
+        return best[-1] or None
+
+    def _prefer(self, a: str, b: str) -> str:
+        if not a:
+            return b
+        if not b:
+            return a
+        return a if self.priority[a] <= self.priority[b] else b
+
+
+class SmallTalk:
+    def __init__(self, global_config: BaseConfig):
+        self.enabled = global_config.small_talk_enabled
+        self.matcher = SmallTalkMatcher(max_words=global_config.small_talk_max_words)
+
+    def answer(self, question: str, has_history: bool = False) -> Optional[Tuple[str, str]]:
+        """(loại, câu trả lời mẫu) hoặc None nếu không phải small talk (hoặc là ack / identity giữa hội thoại)."""
+        if not self.enabled:
+            return None
+        category = self.matcher.match(question)
+        if category is None or (has_history and category not in SMALL_TALK_STANDALONE):
+            return None
+        return category, SMALL_TALK_TEMPLATES[category]
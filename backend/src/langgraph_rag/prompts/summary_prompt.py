@@ -0,0 +1,50 @@
+from typing import List, Optional
+from ..llm.bedrock_llm import BedrockLLM
+from ..utils.logger_utils import get_logger
+from ..utils.config_utils import BaseConfig
+from ..utils.llm_utils import TextChatMessage
+from ..utils.token_utils import strip_indent
+
+logger = get_logger(__name__)
+
+
+SUMMARY_SYSTEM_TEMPLATE = strip_indent("""
+    Bạn là trợ lý ghi nhớ hội thoại giữa người dân và chatbot tư vấn thủ tục hành chính về cư trú.
+    Nhiệm vụ: cập nhật bản tóm tắt hội thoại bằng cách gộp bản tóm tắt cũ (nếu có) với các lượt hội thoại mới.
+    Yêu cầu:
+    - Giữ lại thông tin người dùng đã cung cấp (tên, năm sinh, nơi ở, hoàn cảnh...), các thủ tục / điều luật đã được hỏi và kết luận chính của câu trả lời.
+    - Bỏ lời chào hỏi, câu xã giao và phần diễn giải dài dòng.
+    - Viết bằng tiếng Việt, dạng gạch đầu dòng ngắn gọn, không quá {max_words} từ.
+    - Chỉ trả về bản tóm tắt, không giải thích thêm.
+""")
+
+
+class SummarizeConversation:
+
+    def __init__(self, global_config : BaseConfig):
+        self.bedrock_llm = BedrockLLM(global_config= global_config)
+        self.max_tokens = int(global_config.session_summary_max_tokens)
+
+    def _build_messages(self, previous_summary: Optional[str], messages: List[TextChatMessage]) -> List[TextChatMessage]:
+        turns = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+        return [
+            {"role": "system", "content": SUMMARY_SYSTEM_TEMPLATE.format(max_words=self.max_tokens // 2)},
+            {
+                "role": "user",
+                "content": f"Bản tóm tắt cũ:\n{previous_summary or '(chưa có)'}\n\nCác lượt hội thoại mới:\n{turns}\n\nBản tóm tắt cập nhật:",
+            },
+        ]
+
+    def summarize(self, previous_summary: Optional[str], messages: List[TextChatMessage]):
+        response_text, metadata, cached = self.bedrock_llm.infer(
+            messages=self._build_messages(previous_summary, messages), max_tokens=self.max_tokens, task="general"
+        )
+        total_token = metadata['prompt_tokens'] + metadata['completion_tokens']
+        return response_text.strip(), total_token
+
+    async def asummarize(self, previous_summary: Optional[str], messages: List[TextChatMessage]):
+        response_text, metadata, cached = await self.bedrock_llm.ainfer(
+            messages=self._build_messages(previous_summary, messages), max_tokens=self.max_tokens, task="general"
+        )
+        total_token = metadata['prompt_tokens'] + metadata['completion_tokens']
+        return response_text.strip(), total_token
@@ -1,25 +1,21 @@
-from typing import List
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
 from ..llm.bedrock_llm import BedrockLLM
 from ..utils.logger_utils import get_logger
 from ..utils.config_utils import BaseConfig
 from ..utils.llm_utils import TextChatMessage
 from .one_shot import TTHC_ONESHOT
+from .prompt_builder import BuiltPrompt, PromptBuilder, PromptTemplate
 
 
 logger = get_logger(__name__)
 
+# Template giữ thụt lề cho dễ đọc; PromptTemplate.compile bỏ thụt lề một lần lúc import.
+# Bố cục tiền tố ổn định: system chỉ chứa chỉ dẫn tĩnh (giống hệt nhau ở mọi request -> provider cache được),
+# tài liệu trích xuất và câu hỏi nằm ở user message cuối, sau lịch sử hội thoại.
 
-class GenerateAnswer:
-        def __init__(self, global_config : BaseConfig):
-                self.bedrock_llm = BedrockLLM(global_config= global_config)
-
-        def generate_intent(self, question: str, related_text: str, conversation_history: List[TextChatMessage]):
-
-
-                prompt: List[TextChatMessage] = [
-                        {
-                        "role": "system", 
-                        "content": f"""\
+INTENT_TEMPLATE = PromptTemplate.compile(
+        name="intent",
+        system="""\
                         Bạn là một chuyên gia pháp lý, có nhiệm vụ hỗ trợ người dân và cán bộ trong việc tìm hiểu và hướng dẫn các **thủ tục hành chính tại Việt Nam**.
                         Bạn sẽ được cung cấp:
 
@@ -29,44 +25,27 @@ class GenerateAnswer:
 
                         Hãy đọc kỹ đoạn trích xuất và **chỉ trả lời dựa trên nội dung tài liệu** được cung cấp. Nếu không có đủ thông tin, hãy trả lời trung thực là **không tìm thấy** hoặc **không rõ**.
                         Hãy trả lời **rõ ràng, chi tiết, chính xác, đúng nội dung văn bản** và đầy đủ căn cứ nếu cần thiết.
-
-                        Tài liệu trích xuất:
-                        {related_text}
-
-                        Dựa trên nội dung tài liệu được cung cấp, hãy trả lời câu hỏi trên.  
                         Nếu thông tin trong tài liệu không đủ để trả lời, hãy nói rõ là "Không tìm thấy thông tin trong tài liệu".
-                        
-                     
-                        """
-                        },
-                        {
-                        "role": "user", 
-                        "content": f"""
-                                Nhiệm vụ của bạn là phân tích
+                        """,
+        user="""
+                                Tài liệu trích xuất:
+                                {related_text}
+
+                                Nhiệm vụ của bạn là phân tích và trả lời câu hỏi dựa trên nội dung tài liệu được cung cấp ở trên.
                                 Câu hỏi người dùng:
                                 \"\"\"{question}\"\"\"
                                 Trả lời:
-                        """
-                        },
-                ]
-
-                        #Ví dụ: 
+                        """,
+)
 
-                        #{TTHC_ONESHOT}
-                        #LƯU Ý: khi trả lời phải có nguồn trích dẫn và giấy tờ đính kèm nếu có
+#Ví dụ: 
 
-                messages: List[TextChatMessage] = conversation_history + prompt
+#{TTHC_ONESHOT}
+#LƯU Ý: khi trả lời phải có nguồn trích dẫn và giấy tờ đính kèm nếu có
 
-                response_text, metadata, cached = self.bedrock_llm.infer(messages=messages)
-                total_token = metadata['prompt_tokens'] + metadata['completion_tokens']
-                return response_text, total_token
-
-
-        def generate_general(self, question: str,  conversation_history: List[TextChatMessage]):
-                prompt: List[TextChatMessage] = [
-                        {
-                        "role": "system", 
-                        "content": f"""\
+GENERAL_TEMPLATE = PromptTemplate.compile(
+        name="general",
+        system="""\
                         Bạn là một trợ lý AI thông minh, giàu kiến thức và luôn trả lời rõ ràng, chính xác.
 
                         Nguyên tắc khi trả lời:
@@ -78,21 +57,207 @@ class GenerateAnswer:
                         Yêu cầu định dạng đầu ra:
                         - Chỉ trả lời, không lặp lại câu hỏi của người dùng.
                         - Giữ câu trả lời gọn gàng nhưng đầy đủ thông tin cần thiết.
-                        """
-                        },
-                        {
-                        "role": "user", 
-                        "content": f"""
+                        """,
+        user="""
                                 Nhiệm vụ của bạn là trả lời Câu hỏi người dùng:
                                 \"\"\"{question}\"\"\"
                                 Trả lời:
-                        """
-                        },
+                        """,
+)
+
+
+ESCALATION_TASK = "escalation"
+
+
+class _HeldAnswer:
+        """
+        Giữ phần đầu câu trả lời stream cho tới khi chắc chắn không có marker escalation
+        trong `window` ký tự đầu; sau đó nhả toàn bộ và cho các delta tiếp theo đi thẳng.
+        """
+
+        def __init__(self, window: int, markers: List[str]):
+                self.window = window
+                self.markers = markers
+                self.parts: List[str] = []
+                self.released = False
+
+        def matches(self, text: str) -> bool:
+                head = text[:self.window]
+                return any(marker in head for marker in self.markers)
+
+        @property
+        def text(self) -> str:
+                return "".join(self.parts)
+
+        def feed(self, delta: str) -> str:
+                """Phần văn bản được phép gửi đi ngay ("" nếu còn đang giữ)."""
+                if self.released:
+                        return delta
+                self.parts.append(delta)
+                text = self.text
+                if len(text) >= self.window and not self.matches(text):
+                        self.released = True
+                        return text
+                return ""
+
+
+class GenerateAnswer:
+        """
+        Sinh câu trả lời theo tier của tác vụ (services.llm_tiers): general / procedure / legal.
+        Tier có `escalate: true` mà câu trả lời báo "không tìm thấy" -> hỏi lại bằng model của tier escalation.
+        """
+
+        def __init__(self, global_config : BaseConfig):
+                self.bedrock_llm = BedrockLLM(global_config= global_config)
+                self.prompt_builder = PromptBuilder(global_config= global_config)
+                self.escalation_markers = list(global_config.llm_tier_escalation_markers or [])
+                self.escalation_window_chars = max(1, int(global_config.llm_tier_escalation_window_chars))
+
+        def _can_escalate(self, task: str) -> bool:
+                tier = self.bedrock_llm.tier(task)
+                return bool(tier and tier.escalate and self.escalation_markers and self.bedrock_llm.tier(ESCALATION_TASK))
+
+        def _held_answer(self) -> _HeldAnswer:
+                return _HeldAnswer(self.escalation_window_chars, self.escalation_markers)
+
+        @staticmethod
+        def _merge_usage(first: dict, second: dict) -> dict:
+                """Usage của lời gọi escalation cộng dồn cả lời gọi đầu (cả hai đều bị tính tiền)."""
+                merged = dict(second)
+                for key in ("prompt_tokens", "completion_tokens", "cache_read_tokens", "cache_write_tokens"):
+                        merged[key] = (first.get(key) or 0) + (second.get(key) or 0)
+                merged["escalated_from"] = first.get("model")
+                return merged
+
+        @staticmethod
+        def _finish_usage(metadata: Optional[dict], usage: dict, task: str, escalated: bool) -> None:
+                if metadata is not None:
+                        metadata.update(usage)
+                        metadata["task"] = task
+                        metadata["escalated"] = escalated
+
+        @staticmethod
+        def _total_tokens(usage: dict) -> int:
+                return (usage.get('prompt_tokens') or 0) + (usage.get('completion_tokens') or 0)
+
+        def _build_intent_prompt(self, question: str, related_text: str, conversation_history: List[TextChatMessage], documents: Optional[List[Dict[str, Any]]] = None, task: str = "procedure") -> BuiltPrompt:
+                """Có `documents` -> ngữ cảnh dựng lại từ các tài liệu còn nằm trong ngân sách token (của model tier); không có -> dùng nguyên related_text."""
+                return self.prompt_builder.build(
+                        INTENT_TEMPLATE, question, conversation_history,
+                        documents=documents, related_text=related_text, model=self.bedrock_llm.model_for(task),
+                )
+
+        @staticmethod
+        def _intent_cache_key(prompt: BuiltPrompt):
+                """Khoá cache theo id tài liệu (đúng thứ tự rerank) thay cho toàn văn ngữ cảnh; không có tài liệu -> khoá theo messages."""
+                if not prompt.documents:
+                        return None
+                return [{"role": "system", "content": prompt.system}] + prompt.history + [
+                        {"role": "user", "content": prompt.user},
+                        {"doc_ids": [str(doc.get("id")) for doc in prompt.documents]},
                 ]
-                messages: List[TextChatMessage] = conversation_history + prompt
-                response_text, metadata, cached = self.bedrock_llm.infer(messages=messages)
-                total_token = metadata['prompt_tokens'] + metadata['completion_tokens']
-                return response_text, total_token
+
+        def _intent_call(self, question: str, related_text: str, conversation_history: List[TextChatMessage], documents, task: str) -> Tuple[dict, dict]:
+                """(tham số cho BedrockLLM, báo cáo ngân sách token) của prompt theo tier `task`."""
+                prompt = self._build_intent_prompt(question, related_text, conversation_history, documents, task)
+                call = {"messages": prompt.messages, "cache_policy": "context", "cache_key": self._intent_cache_key(prompt), "task": task}
+                return call, prompt.report
+
+        def generate_intent(self, question: str, related_text: str, conversation_history: List[TextChatMessage], documents: Optional[List[Dict[str, Any]]] = None, report: Optional[dict] = None, task: str = "procedure", metadata: Optional[dict] = None):
+                """
+                `task`: "procedure" | "legal" (tier trong services.llm_tiers).
+                `report` (nếu truyền) được cập nhật số token trước / sau khi cắt theo ngân sách;
+                `metadata` (nếu truyền) được cập nhật usage, model, task và cờ escalated.
+                """
+                call, prompt_report = self._intent_call(question, related_text, conversation_history, documents, task)
+                if report is not None:
+                        report.update(prompt_report)
+                response_text, usage, cached = self.bedrock_llm.infer(**call)
+                escalated = self._can_escalate(task) and self._held_answer().matches(response_text or "")
+                if escalated:
+                        call, _ = self._intent_call(question, related_text, conversation_history, documents, ESCALATION_TASK)
+                        response_text, escalated_usage, cached = self.bedrock_llm.infer(**call)
+                        usage = self._merge_usage(usage, escalated_usage)
+                self._finish_usage(metadata, usage, task, escalated)
+                return response_text, self._total_tokens(usage)
+
+        def stream_intent(self, question: str, related_text: str, conversation_history: List[TextChatMessage], metadata: Optional[dict] = None, documents: Optional[List[Dict[str, Any]]] = None, report: Optional[dict] = None, task: str = "procedure") -> Iterator[str]:
+                """
+                Như generate_intent nhưng yield từng delta; token usage được ghi vào `metadata` khi kết thúc.
+                Tier có escalate: `escalation_window_chars` ký tự đầu được giữ lại tới khi chắc không phải câu "không tìm thấy".
+                """
+                call, prompt_report = self._intent_call(question, related_text, conversation_history, documents, task)
+                if report is not None:
+                        report.update(prompt_report)
+                usage: dict = {}
+                if not self._can_escalate(task):
+                        yield from self.bedrock_llm.stream_infer(metadata=usage, **call)
+                        self._finish_usage(metadata, usage, task, False)
+                        return
+
+                held = self._held_answer()
+                for delta in self.bedrock_llm.stream_infer(metadata=usage, **call):
+                        released = held.feed(delta)
+                        if released:
+                                yield released
+                escalated = not held.released and held.matches(held.text)
+                if escalated:
+                        call, _ = self._intent_call(question, related_text, conversation_history, documents, ESCALATION_TASK)
+                        escalated_usage: dict = {}
+                        yield from self.bedrock_llm.stream_infer(metadata=escalated_usage, **call)
+                        usage = self._merge_usage(usage, escalated_usage)
+                elif not held.released and held.text:
+                        yield held.text
+                self._finish_usage(metadata, usage, task, escalated)
+
+        async def astream_intent(self, question: str, related_text: str, conversation_history: List[TextChatMessage], metadata: Optional[dict] = None, documents: Optional[List[Dict[str, Any]]] = None, report: Optional[dict] = None, task: str = "procedure") -> AsyncIterator[str]:
+                """Bản async của stream_intent (BedrockLLM.astream_infer)."""
+                call, prompt_report = self._intent_call(question, related_text, conversation_history, documents, task)
+                if report is not None:
+                        report.update(prompt_report)
+                usage: dict = {}
+                if not self._can_escalate(task):
+                        async for delta in self.bedrock_llm.astream_infer(metadata=usage, **call):
+                                yield delta
+                        self._finish_usage(metadata, usage, task, False)
+                        return
+
+                held = self._held_answer()
+                async for delta in self.bedrock_llm.astream_infer(metadata=usage, **call):
+                        released = held.feed(delta)
+                        if released:
+                                yield released
+                escalated = not held.released and held.matches(held.text)
+                if escalated:
+                        call, _ = self._intent_call(question, related_text, conversation_history, documents, ESCALATION_TASK)
+                        escalated_usage: dict = {}
+                        async for delta in self.bedrock_llm.astream_infer(metadata=escalated_usage, **call):
+                                yield delta
+                        usage = self._merge_usage(usage, escalated_usage)
+                elif not held.released and held.text:
+                        yield held.text
+                self._finish_usage(metadata, usage, task, escalated)
+
+
+        def _build_general_prompt(self, question: str,  conversation_history: List[TextChatMessage]) -> BuiltPrompt:
+                return self.prompt_builder.build(GENERAL_TEMPLATE, question, conversation_history, model=self.bedrock_llm.model_for("general"))
+
+        def generate_general(self, question: str,  conversation_history: List[TextChatMessage], report: Optional[dict] = None, metadata: Optional[dict] = None):
+                prompt = self._build_general_prompt(question, conversation_history)
+                if report is not None:
+                        report.update(prompt.report)
+                response_text, usage, cached = self.bedrock_llm.infer(messages=prompt.messages, cache_policy="general", task="general")
+                self._finish_usage(metadata, usage, "general", False)
+                return response_text, self._total_tokens(usage)
+
+        async def astream_general(self, question: str,  conversation_history: List[TextChatMessage], metadata: Optional[dict] = None, report: Optional[dict] = None) -> AsyncIterator[str]:
+                prompt = self._build_general_prompt(question, conversation_history)
+                if report is not None:
+                        report.update(prompt.report)
+                usage: dict = {}
+                async for delta in self.bedrock_llm.astream_infer(messages=prompt.messages, metadata=usage, cache_policy="general", task="general"):
+                        yield delta
+                self._finish_usage(metadata, usage, "general", False)
 
 
 # # run: python -m langgraph_rag.prompts.system_prompt
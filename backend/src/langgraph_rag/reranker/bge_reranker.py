@@ -226,32 +226,38 @@ class BGEReranker(BaseRerankerModelConfig):
         self.reranker_config = RerankerModelConfig.from_dict(config_dict=config_dict)
         logger.debug(f"Init {self.__class__.__name__}'s reranker_config: {self.reranker_config}")
 
+    def score(self, query: str, documents: List[str]) -> List[float]:
+        """Chấm điểm (query, doc) theo batch, giữ nguyên thứ tự documents."""
+        return self.score_pairs([(query, doc) for doc in documents])
+
     @torch.inference_mode()
-    def rerank(self, query: str, documents: List[str], top_k: Optional[int] = None) -> List[Tuple[str, float]]:
-        """Rerank documents trả về [(doc, score)] đã sắp xếp giảm dần."""
+    def score_pairs(self, pairs: List[Tuple[str, str]], batch_size: Optional[int] = None) -> List[float]:
+        """
+        Chấm điểm danh sách cặp (query, doc) bất kỳ (có thể thuộc nhiều query khác nhau),
+        giữ nguyên thứ tự. batch_size lớn hơn config dùng cho xử lý hàng loạt.
+        """
         if not hasattr(self, "reranker_model") or self.reranker_model is None or self.tokenizer is None:
             raise RuntimeError("Reranker model chưa được khởi tạo.")
-        if not documents:
+        if not pairs:
             return []
 
         enc = self.reranker_config.encode_params
         runtime = self.reranker_config.runtime_params
         device = runtime["device"]
 
-        bs = enc["batch_size"]
+        bs = int(batch_size or enc["batch_size"])
         mx = enc["max_length"]
         use_sigmoid = enc["apply_sigmoid"]
-        k = int(top_k) if top_k is not None else int(enc["top_k"])
 
         scores: List[float] = []
 
-        for start in range(0, len(documents), bs):
-            batch_docs = documents[start:start + bs]
+        for start in range(0, len(pairs), bs):
+            batch_pairs = pairs[start:start + bs]
 
             # Tokenizer đúng chuẩn text/text_pair
             inputs = self.tokenizer(
-                text=[query] * len(batch_docs),
-                text_pair=batch_docs,
+                text=[q for q, _ in batch_pairs],
+                text_pair=[d for _, d in batch_pairs],
                 truncation=True,
                 padding=True,
                 max_length=mx,
@@ -278,7 +284,16 @@ class BGEReranker(BaseRerankerModelConfig):
                 batch_scores = logits.float().tolist()
             scores.extend(batch_scores)
 
-        np_scores = np.asarray(scores, dtype=float)
+        return scores
+
+    def rerank(self, query: str, documents: List[str], top_k: Optional[int] = None) -> List[Tuple[str, float]]:
+        """Rerank documents trả về [(doc, score)] đã sắp xếp giảm dần."""
+        if not documents:
+            return []
+
+        k = int(top_k) if top_k is not None else int(self.reranker_config.encode_params["top_k"])
+
+        np_scores = np.asarray(self.score(query, documents), dtype=float)
         order = np.argsort(-np_scores)[:min(k, len(documents))]
         return [(documents[i], float(np_scores[i])) for i in order]
 
@@ -1,4 +1,4 @@
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 from .vector_search import VectorRetriever
 from qdrant_client.models import Filter
 from ..reranker.bge_reranker import BGEReranker
@@ -14,11 +14,11 @@ class HybridRetriever:
         self.reranker = reranker
     
     
-    def retrieve(self, query: str, collection_name: str,  limit: int = 10, top_k = 5, filters: Optional[Filter] = None) -> List[Dict[str, Any]]:
+    def retrieve(self, query: str, collection_name: str,  limit: int = 10, top_k = 5, filters: Optional[Filter] = None, query_vector: Optional[List[float]] = None) -> List[Dict[str, Any]]:
         """Retrieve với vector search + reranking"""
         try:
             # Lấy nhiều kết quả hơn để rerank
-            vector_results = self.vector_retriever.retrieve(query=query, collection_name=collection_name, limit=limit, filters=filters)
+            vector_results = self.vector_retriever.retrieve(query=query, collection_name=collection_name, limit=limit, filters=filters, query_vector=query_vector)
             
             if not vector_results:
                 return []
@@ -51,6 +51,59 @@ class HybridRetriever:
             logger.error(f"Lỗi hybrid retrieve: {e}")
             return []
         
+    @staticmethod
+    def _is_qa_cache(results: List[Dict[str, Any]]) -> bool:
+        return bool(results) and "question" in results[0]['payload'].keys() and "answer" in results[0]['payload'].keys()
+
+    def merge_candidates(self, collection_names: List[str], results: Dict[str, List[Dict[str, Any]]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], int]:
+        """
+        Gộp kết quả vector search của nhiều collection -> (candidates, cached, số collection có kết quả).
+        Gặp collection QA cache (payload có question/answer) -> dừng, giữ nguyên kết quả cache
+        (giống vòng lặp từng collection trước đây).
+        """
+        candidates = []
+        cached = []
+        contributing = 0
+        for collection_name in collection_names:
+            docs = results.get(collection_name) or []
+            if self._is_qa_cache(docs):
+                cached = docs
+                break
+            if docs:
+                contributing += 1
+                candidates.extend(docs)
+        return candidates, cached, contributing
+
+    @staticmethod
+    def select_ranked(candidates: List[Dict[str, Any]], scores: List[float], cached: List[Dict[str, Any]], top_k: int, contributing: int) -> List[Dict[str, Any]]:
+        """Giữ top_k x số collection có kết quả theo rerank_score giảm dần, nối kết quả QA cache phía sau."""
+        ranked = sorted(zip(candidates, scores), key=lambda x: x[1], reverse=True)[:top_k * contributing]
+        final_results = []
+        for doc, score in ranked:
+            doc["rerank_score"] = float(score)
+            final_results.append(doc)
+        return final_results + cached
+
+    def rerank_merged(self, query: str, collection_names: List[str], results: Dict[str, List[Dict[str, Any]]], top_k = 5) -> List[Dict[str, Any]]:
+        """Gộp kết quả vector search của nhiều collection rồi rerank trong MỘT batch."""
+        candidates, cached, contributing = self.merge_candidates(collection_names, results)
+        if not candidates:
+            return cached
+
+        documents = [doc.get("payload", {}).get("content", "") for doc in candidates]
+        scores = self.reranker.score(query, documents)
+        return self.select_ranked(candidates, scores, cached, top_k, contributing)
+
+    def retrieve_many(self, query: str, collection_names: List[str], limit: int = 10, top_k = 5, filters: Optional[Filter] = None, query_vector: Optional[List[float]] = None) -> List[Dict[str, Any]]:
+        """Embedding một lần, search đồng thời mọi collection, rerank một batch trên tập ứng viên đã gộp"""
+        try:
+            results = self.vector_retriever.retrieve_many(query=query, collection_names=collection_names, limit=limit, filters=filters, query_vector=query_vector)
+            return self.rerank_merged(query, collection_names, results, top_k=top_k)
+        except Exception as e:
+            logger.error(f"Lỗi hybrid retrieve_many: {e}")
+            return []
+
+
 
 # run: python -m backend.src.langgraph_rag.search.hybird_search
 if __name__ == "__main__":
@@ -14,11 +14,12 @@ class VectorRetriever:
         self.database = database
         self.embedding = embedding
     
-    def retrieve(self, query: str, collection_name: str,  limit: int = 10, threshold: float = 0.9, filters: Optional[Filter] = None) -> List[Dict[str, Any]]:
-        """Retrieve documents bằng vector search"""
+    def retrieve(self, query: str, collection_name: str,  limit: int = 10, threshold: float = 0.9, filters: Optional[Filter] = None, query_vector: Optional[List[float]] = None) -> List[Dict[str, Any]]:
+        """Retrieve documents bằng vector search (truyền sẵn query_vector để khỏi encode lại)"""
         try:
             # Encode query
-            query_vector = self.embedding.batch_encode(query.lower()) # text to list[float] or list[list[float]]
+            if query_vector is None:
+                query_vector = self.embedding.batch_encode(query.lower()) # text to list[float] or list[list[float]]
 
             # # qdrant cache
             # result_cache = self.database.search(
@@ -56,6 +57,68 @@ class VectorRetriever:
             logger.error(f"Lỗi retrieve: {e}")
             return []
 
+    def _fallback_without_filters(self, results: Dict[str, List[Dict[str, Any]]], filters: Optional[Filter]) -> List[str]:
+        """Các collection có filter nhưng không ra kết quả -> cần tìm lại không dùng filter."""
+        if filters is None:
+            return []
+        return [name for name, docs in results.items() if not docs]
+
+    def retrieve_many(self, query: str, collection_names: List[str], limit: int = 10, filters: Optional[Filter] = None, query_vector: Optional[List[float]] = None) -> Dict[str, List[Dict[str, Any]]]:
+        """Encode query một lần rồi search đồng thời trên mọi collection -> {collection_name: [kết quả]}"""
+        try:
+            if query_vector is None:
+                query_vector = self.embedding.batch_encode(query.lower())
+
+            results = self.database.search_collections(
+                query_vector=query_vector,
+                collection_names=collection_names,
+                limit=limit,
+                filters=filters
+            )
+            retry = self._fallback_without_filters(results, filters)
+            if retry:
+                results.update(self.database.search_collections(
+                    query_vector=query_vector,
+                    collection_names=retry,
+                    limit=limit,
+                    filters=None
+                ))
+
+            logger.info(f"Tìm được {sum(len(v) for v in results.values())} kết quả trên {len(collection_names)} collection cho query: {query}")
+            return results
+
+        except Exception as e:
+            logger.error(f"Lỗi retrieve_many: {e}")
+            return {name: [] for name in collection_names}
+
+    async def aretrieve_many(self, query: str, collection_names: List[str], limit: int = 10, filters: Optional[Filter] = None, query_vector: Optional[List[float]] = None) -> Dict[str, List[Dict[str, Any]]]:
+        """Bản async của retrieve_many: embedding qua abatch_encode (batcher), search qua AsyncQdrantClient"""
+        try:
+            if query_vector is None:
+                query_vector = await self.embedding.abatch_encode(query.lower())
+
+            results = await self.database.asearch_collections(
+                query_vector=query_vector,
+                collection_names=collection_names,
+                limit=limit,
+                filters=filters
+            )
+            retry = self._fallback_without_filters(results, filters)
+            if retry:
+                results.update(await self.database.asearch_collections(
+                    query_vector=query_vector,
+                    collection_names=retry,
+                    limit=limit,
+                    filters=None
+                ))
+
+            logger.info(f"Tìm được {sum(len(v) for v in results.values())} kết quả trên {len(collection_names)} collection cho query: {query}")
+            return results
+
+        except Exception as e:
+            logger.error(f"Lỗi aretrieve_many: {e}")
+            return {name: [] for name in collection_names}
+
     # def retrieve(self, query: str, collection_name: str,  limit: int = 10, filters: Optional[Filter] = None) -> List[Dict[str, Any]]:
     #     """Retrieve documents bằng vector search"""
     #     from traceback import print_exc
@@ -7,6 +7,7 @@ from .utils.llm_utils import TextChatMessage
 class RagState(TypedDict):
     # === Core Input/Output ===
     question: str                                 
+    session_id: str
     conversation_history: List[TextChatMessage]   
     final_response: str
 
@@ -16,9 +17,14 @@ class RagState(TypedDict):
     raw_documents: List[Dict[str, Any]]
     retrieval_keywork: List[str]
     relevant_context: str
+    query_vector: List[float]
+    # spec bộ lọc payload do QueryRoute trích xuất cùng lượt định tuyến (services.route_filters)
+    query_filter: Dict[str, Any]
+    speculative_documents: Dict[str, List[Dict[str, Any]]]
 
     # === Workflow Control ===
     current_status: str
+    input_guardrail_status: str
     error_count: int
 
     # === Processing Metadata ===
@@ -0,0 +1,48 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional, TypeVar
+
+from .logger_utils import get_logger
+
+logger = get_logger(__name__)
+
+T = TypeVar("T")
+
+_MODEL_EXECUTOR: Optional[ThreadPoolExecutor] = None
+_MODEL_EXECUTOR_LOCK = threading.Lock()
+
+
+def init_model_executor(max_workers: int) -> ThreadPoolExecutor:
+    """
+    Khởi tạo (một lần) executor có giới hạn cho các tác vụ CPU-bound (embedding, rerank).
+    Giới hạn số luồng để nhiều request đồng thời không tranh nhau CPU/GPU quá mức.
+    """
+    global _MODEL_EXECUTOR
+    with _MODEL_EXECUTOR_LOCK:
+        if _MODEL_EXECUTOR is None:
+            _MODEL_EXECUTOR = ThreadPoolExecutor(
+                max_workers=max(1, int(max_workers)),
+                thread_name_prefix="rag-model",
+            )
+            logger.info(f"[async_utils] Model executor ready with {max_workers} workers")
+        return _MODEL_EXECUTOR
+
+
+def get_model_executor() -> ThreadPoolExecutor:
+    if _MODEL_EXECUTOR is None:
+        return init_model_executor(max_workers=2)
+    return _MODEL_EXECUTOR
+
+
+async def run_in_model_executor(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Chạy hàm model CPU-bound trong executor có giới hạn, không chặn event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_model_executor(), functools.partial(func, *args, **kwargs))
+
+
+async def run_blocking(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Chạy lời gọi I/O đồng bộ (boto3, HTTP client sync) trong thread pool mặc định."""
+    return await asyncio.to_thread(func, *args, **kwargs)
+
@@ -1,6 +1,6 @@
 import os
 from dataclasses import dataclass, field
-from typing import Any, Dict, Literal, Optional, Union
+from typing import Any, Dict, List, Literal, Optional, Union
 from .logger_utils import get_logger
 from dotenv import load_dotenv, find_dotenv
 import yaml
@@ -27,6 +27,19 @@ backend_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os
 config_path = os.path.join(backend_dir, 'configs.yaml')
 CONFIG = read_yaml_file(config_path)
 
+def _llm_tiers() -> Dict[str, Dict[str, Any]]:
+    """services.llm_tiers.tiers, với `model` là khoá của llm_model_configs được đổi thành model id."""
+    models = CONFIG['models']['aws_bedrock']['llm_model_configs']
+    tiers = {}
+    for task, tier in (CONFIG['services']['llm_tiers'].get('tiers') or {}).items():
+        tier = dict(tier or {})
+        alias = tier.get('model')
+        if alias in models:
+            tier['model'] = models[alias]['model_id']
+        tiers[task] = tier
+    return tiers
+
+
 @dataclass
 class BaseConfig:
     """One and only configuration."""
@@ -83,6 +96,18 @@ class BaseConfig:
         default="auto",
         metadata={"help": "Data type for local embedding model."}
     )
+    embedding_backend: Literal["torch", "onnx", "onnx-int8"] = field(
+        default=CONFIG['models']['hugging_face']['embedding_model_configs']['qwen']['backend'],
+        metadata={"help": "Backend suy luận của model embedding: PyTorch, ONNX Runtime fp32 hoặc ONNX Runtime int8."}
+    )
+    embedding_onnx_dir: str = field(
+        default=CONFIG['models']['hugging_face']['embedding_model_configs']['qwen']['onnx_dir'],
+        metadata={"help": "Thư mục model ONNX đã export; rỗng = <save_dir>/onnx/<model>."}
+    )
+    embedding_onnx_quantization: Literal["arm64", "avx2", "avx512", "avx512_vnni"] = field(
+        default=CONFIG['models']['hugging_face']['embedding_model_configs']['qwen']['onnx_quantization'],
+        metadata={"help": "Cấu hình quantize int8 theo tập lệnh CPU cho backend onnx-int8."}
+    )
     
     
     # 4. Cấu hình reranker
@@ -238,6 +263,377 @@ class BaseConfig:
         metadata={"help": "Số kết nối tối đa trong connection pool."}
     )
 
+    # workflow config (async execution)
+
+    model_executor_workers: int = field(
+        default=CONFIG['services']['workflow']['model_executor_workers'],
+        metadata={"help": "Số luồng tối đa của executor chạy model CPU-bound (embedding, rerank) khi workflow chạy bất đồng bộ."}
+    )
+    parallel_analysis: bool = field(
+        default=CONFIG['services']['workflow']['parallel_analysis'],
+        metadata={"help": "Chạy guardrail đầu vào, định tuyến intent và embedding câu hỏi đồng thời trong một node."}
+    )
+    speculative_retrieval: bool = field(
+        default=CONFIG['services']['workflow']['speculative_retrieval'],
+        metadata={"help": "Bắt đầu truy xuất mọi collection ngay khi có embedding, trước khi có kết quả định tuyến."}
+    )
+    singleflight_enabled: bool = field(
+        default=CONFIG['services']['workflow']['singleflight_enabled'],
+        metadata={"help": "Gộp các request cùng câu hỏi (đã chuẩn hoá) + cùng lịch sử đang chạy đồng thời thành một lần chạy."}
+    )
+    singleflight_wait_seconds: float = field(
+        default=CONFIG['services']['workflow']['singleflight_wait_seconds'],
+        metadata={"help": "Thời gian tối đa follower chờ kết quả của leader trước khi tự chạy workflow."}
+    )
+    batch_concurrency: int = field(
+        default=CONFIG['services']['workflow']['batch_concurrency'],
+        metadata={"help": "Số lời gọi remote (guardrail, định tuyến, LLM) chạy đồng thời khi xử lý hàng loạt."}
+    )
+    batch_max_questions: int = field(
+        default=CONFIG['services']['workflow']['batch_max_questions'],
+        metadata={"help": "Số câu hỏi tối đa trong một request /chat/batch."}
+    )
+    batch_rerank_batch_size: int = field(
+        default=CONFIG['services']['workflow']['batch_rerank_batch_size'],
+        metadata={"help": "Batch size của cross-encoder reranker khi chấm điểm cặp (query, doc) hàng loạt."}
+    )
+
+    # llm call config
+
+    llm_max_concurrency: int = field(
+        default=CONFIG['services']['llm']['max_concurrency'],
+        metadata={"help": "Số lời gọi Bedrock async đồng thời tối đa cho mỗi model."}
+    )
+    llm_retry_base_seconds: float = field(
+        default=CONFIG['services']['llm']['retry_base_seconds'],
+        metadata={"help": "Thời gian chờ cơ sở của exponential backoff khi gọi LLM lỗi (giây)."}
+    )
+    llm_retry_max_seconds: float = field(
+        default=CONFIG['services']['llm']['retry_max_seconds'],
+        metadata={"help": "Thời gian chờ tối đa của một lần backoff (giây)."}
+    )
+
+    # llm tiers config (model / max_tokens / timeout theo tác vụ)
+
+    llm_tiers_enabled: bool = field(
+        default=CONFIG['services']['llm_tiers']['enabled'],
+        metadata={"help": "Chọn model theo tác vụ (routing / general / procedure / legal) thay cho một llm_name chung."}
+    )
+    llm_tiers: Dict[str, Dict[str, Any]] = field(
+        default_factory=_llm_tiers,
+        metadata={"help": "Tier theo tác vụ: model (id), max_tokens, timeout_seconds, escalate."}
+    )
+    llm_tier_escalation_markers: List[str] = field(
+        default_factory=lambda: list(CONFIG['services']['llm_tiers'].get('escalation_markers') or []),
+        metadata={"help": "Câu trả lời chứa một trong các chuỗi này -> hỏi lại model của tier escalation."}
+    )
+    llm_tier_escalation_window_chars: int = field(
+        default=CONFIG['services']['llm_tiers']['escalation_window_chars'],
+        metadata={"help": "Chỉ tìm marker escalation trong bấy nhiêu ký tự đầu câu trả lời."}
+    )
+
+    # resilience config (hedged request + circuit breaker quanh lời gọi Bedrock)
+
+    resilience_enabled: bool = field(
+        default=CONFIG['services']['resilience']['enabled'],
+        metadata={"help": "Bật hedged request và circuit breaker cho BedrockLLM / BedrockGuardrails / BedrockFilter."}
+    )
+    resilience_latency_window_seconds: float = field(
+        default=CONFIG['services']['resilience']['latency_window_seconds'],
+        metadata={"help": "Độ dài cửa sổ trượt của histogram latency (giây)."}
+    )
+    resilience_hedge_enabled: bool = field(
+        default=CONFIG['services']['resilience']['hedge_enabled'],
+        metadata={"help": "Gửi bản sao của lời gọi chậm, lấy kết quả về trước."}
+    )
+    resilience_hedge_percentile: float = field(
+        default=CONFIG['services']['resilience']['hedge_percentile'],
+        metadata={"help": "Percentile latency gần đây dùng làm ngưỡng gửi bản sao."}
+    )
+    resilience_hedge_min_samples: int = field(
+        default=CONFIG['services']['resilience']['hedge_min_samples'],
+        metadata={"help": "Số mẫu tối thiểu trong cửa sổ trước khi bắt đầu hedge."}
+    )
+    resilience_hedge_min_delay_seconds: float = field(
+        default=CONFIG['services']['resilience']['hedge_min_delay_seconds'],
+        metadata={"help": "Ngưỡng hedge tối thiểu (giây)."}
+    )
+    resilience_hedge_max_ratio: float = field(
+        default=CONFIG['services']['resilience']['hedge_max_ratio'],
+        metadata={"help": "Tỉ lệ bản sao tối đa trên số lời gọi."}
+    )
+    resilience_hedge_workers: int = field(
+        default=CONFIG['services']['resilience']['hedge_workers'],
+        metadata={"help": "Số luồng chạy lời gọi sync khi hedge."}
+    )
+    resilience_breaker_failure_threshold: int = field(
+        default=CONFIG['services']['resilience']['breaker_failure_threshold'],
+        metadata={"help": "Số lỗi liên tiếp để mở mạch."}
+    )
+    resilience_breaker_recovery_seconds: float = field(
+        default=CONFIG['services']['resilience']['breaker_recovery_seconds'],
+        metadata={"help": "Thời gian mạch mở trước khi cho lời gọi thử (giây)."}
+    )
+    resilience_guardrails_fail_open: bool = field(
+        default=CONFIG['services']['resilience']['guardrails_fail_open'],
+        metadata={"help": "Mạch guardrail mở: True -> bỏ qua guardrail, False -> từ chối request."}
+    )
+
+    # offline config (stand-in cục bộ cho Bedrock LLM + guardrail)
+
+    offline_enabled: bool = field(
+        default=CONFIG['services']['offline']['enabled'],
+        metadata={"help": "Thay Bedrock LLM / guardrail bằng stand-in cục bộ (benchmark, chạy không cần AWS)."}
+    )
+    offline_mode: Literal["inprocess", "server"] = field(
+        default=CONFIG['services']['offline']['mode'],
+        metadata={"help": "inprocess: fake trong process | server: gọi offline_server qua HTTP (OpenAI chat API + ApplyGuardrail)."}
+    )
+    offline_base_url: str = field(
+        default=CONFIG['services']['offline']['base_url'],
+        metadata={"help": "Địa chỉ offline_server khi offline_mode = server."}
+    )
+    offline_seed: Optional[int] = field(
+        default=CONFIG['services']['offline']['seed'],
+        metadata={"help": "Seed của latency / lỗi giả lập."}
+    )
+    offline_llm_latency: Dict[str, Any] = field(
+        default_factory=lambda: dict(CONFIG['services']['offline'].get('llm_latency') or {}),
+        metadata={"help": "Phân phối thời gian tới chunk đầu của LLM giả: distribution, median_seconds, sigma."}
+    )
+    offline_token_seconds: float = field(
+        default=CONFIG['services']['offline']['token_seconds'],
+        metadata={"help": "Thời gian sinh mỗi token của LLM giả (giây)."}
+    )
+    offline_answer_tokens: int = field(
+        default=CONFIG['services']['offline']['answer_tokens'],
+        metadata={"help": "Độ dài tối đa câu trả lời của LLM giả (token)."}
+    )
+    offline_guardrail_latency: Dict[str, Any] = field(
+        default_factory=lambda: dict(CONFIG['services']['offline'].get('guardrail_latency') or {}),
+        metadata={"help": "Phân phối latency của guardrail giả: distribution, median_seconds, sigma."}
+    )
+    offline_error_rate: float = field(
+        default=CONFIG['services']['offline']['error_rate'],
+        metadata={"help": "Tỉ lệ lời gọi LLM / guardrail giả trả lỗi 503."}
+    )
+    offline_blocked_terms: List[str] = field(
+        default_factory=lambda: list(CONFIG['services']['offline'].get('blocked_terms') or []),
+        metadata={"help": "Guardrail giả chặn văn bản chứa các từ này."}
+    )
+
+    # prompt budget config
+
+    prompt_budget_enabled: bool = field(
+        default=CONFIG['services']['prompt_budget']['enabled'],
+        metadata={"help": "Cắt lịch sử / tài liệu để prompt nằm trong ngân sách token của model."}
+    )
+    prompt_budget_tokenizer: str = field(
+        default=CONFIG['services']['prompt_budget']['tokenizer'],
+        metadata={"help": "Tokenizer HuggingFace cục bộ dùng để đếm token của prompt."}
+    )
+    prompt_budget_default_max_input_tokens: int = field(
+        default=CONFIG['services']['prompt_budget']['default_max_input_tokens'],
+        metadata={"help": "Ngân sách token đầu vào cho model không được khai báo riêng."}
+    )
+    prompt_budget_max_input_tokens: Dict[str, int] = field(
+        default_factory=lambda: dict(CONFIG['services']['prompt_budget'].get('max_input_tokens') or {}),
+        metadata={"help": "Ngân sách token đầu vào theo model id."}
+    )
+    prompt_budget_min_documents: int = field(
+        default=CONFIG['services']['prompt_budget']['min_documents'],
+        metadata={"help": "Số tài liệu tốt nhất luôn được giữ trong ngữ cảnh, kể cả khi vượt ngân sách."}
+    )
+
+    # prompt cache config
+    prompt_cache_enabled: bool = field(
+        default=CONFIG['services']['prompt_cache']['enabled'],
+        metadata={"help": "Gắn cache_control lên tiền tố ổn định của prompt (system tĩnh, lịch sử) cho model hỗ trợ."}
+    )
+    prompt_cache_models: List[str] = field(
+        default_factory=lambda: list(CONFIG['services']['prompt_cache'].get('models') or []),
+        metadata={"help": "Model id chứa một trong các chuỗi này mới được gắn marker prompt cache."}
+    )
+    prompt_cache_min_tokens: int = field(
+        default=CONFIG['services']['prompt_cache']['min_tokens'],
+        metadata={"help": "Độ dài tối thiểu (token) của tiền tố để gắn marker prompt cache."}
+    )
+
+    # embedding cache config
+    embedding_cache_enabled: bool = field(
+        default=CONFIG['services']['embedding_cache']['enabled'],
+        metadata={"help": "Cache embedding câu hỏi (LRU + file memmap trên đĩa) trong QwenEmbeddingModel."}
+    )
+    embedding_cache_dir: str = field(
+        default=CONFIG['services']['embedding_cache']['dir'],
+        metadata={"help": "Thư mục tầng đĩa của embedding cache; rỗng = <save_dir>/embedding_cache."}
+    )
+    embedding_cache_memory_entries: int = field(
+        default=CONFIG['services']['embedding_cache']['memory_entries'],
+        metadata={"help": "Số vector tối đa trong tầng LRU."}
+    )
+    embedding_cache_disk_enabled: bool = field(
+        default=CONFIG['services']['embedding_cache']['disk_enabled'],
+        metadata={"help": "Bật tầng đĩa (vectors.f32 + keys.bin) của embedding cache."}
+    )
+    embedding_cache_disk_max_entries: int = field(
+        default=CONFIG['services']['embedding_cache']['disk_max_entries'],
+        metadata={"help": "Số vector tối đa trên đĩa; đầy thì chỉ ghi vào tầng nhớ."}
+    )
+    embedding_cache_warm_start: bool = field(
+        default=CONFIG['services']['embedding_cache']['warm_start'],
+        metadata={"help": "Nạp các vector mới nhất từ đĩa vào LRU khi khởi động."}
+    )
+
+    # embedding batcher config
+    embedding_batcher_enabled: bool = field(
+        default=CONFIG['services']['embedding_batcher']['enabled'],
+        metadata={"help": "Gom các lời gọi encode đồng thời thành một batch trong QwenEmbeddingModel."}
+    )
+    embedding_batcher_max_batch_size: Optional[int] = field(
+        default=CONFIG['services']['embedding_batcher']['max_batch_size'],
+        metadata={"help": "Số câu tối đa mỗi batch; None = embedding_batch_size."}
+    )
+    embedding_batcher_max_wait_ms: float = field(
+        default=CONFIG['services']['embedding_batcher']['max_wait_ms'],
+        metadata={"help": "Thời gian tối đa (ms) chờ thêm câu sau câu đầu tiên của batch."}
+    )
+
+    # small talk config
+    small_talk_enabled: bool = field(
+        default=CONFIG['services']['small_talk']['enabled'],
+        metadata={"help": "Trả lời câu chào hỏi / cảm ơn / tạm biệt từ bảng mẫu, không gọi guardrail hay LLM."}
+    )
+    small_talk_max_words: int = field(
+        default=CONFIG['services']['small_talk']['max_words'],
+        metadata={"help": "Số từ tối đa của câu được xét small talk."}
+    )
+
+    # intent classifier config
+    intent_classifier_enabled: bool = field(
+        default=CONFIG['services']['intent_classifier']['enabled'],
+        metadata={"help": "Định tuyến intent cục bộ bằng embedding câu hỏi khi classifier đủ tin cậy, còn lại gọi LLM."}
+    )
+    intent_classifier_model_path: str = field(
+        default=CONFIG['services']['intent_classifier']['model_path'],
+        metadata={"help": "File .npz chứa centroid intent; rỗng = <save_dir>/intent_classifier.npz."}
+    )
+    intent_classifier_min_similarity: float = field(
+        default=CONFIG['services']['intent_classifier']['min_similarity'],
+        metadata={"help": "Cosine tối thiểu với centroid gần nhất để định tuyến cục bộ."}
+    )
+    intent_classifier_min_margin: float = field(
+        default=CONFIG['services']['intent_classifier']['min_margin'],
+        metadata={"help": "Chênh lệch cosine tối thiểu giữa centroid gần nhất và thứ hai để định tuyến cục bộ."}
+    )
+    intent_classifier_llm_latency_prior_s: float = field(
+        default=CONFIG['services']['intent_classifier']['llm_latency_prior_s'],
+        metadata={"help": "Latency LLM định tuyến ban đầu (giây) để ước lượng thời gian tiết kiệm."}
+    )
+
+    # route filters config
+    route_filters_enabled: bool = field(
+        default=CONFIG['services']['route_filters']['enabled'],
+        metadata={"help": "Trích xuất bộ lọc payload cùng lời gọi định tuyến intent và áp vào search Qdrant."}
+    )
+    route_filters_max_tokens: int = field(
+        default=CONFIG['services']['route_filters']['max_tokens'],
+        metadata={"help": "max_tokens của lời gọi định tuyến khi có trích xuất bộ lọc."}
+    )
+    route_filters_collections: List[str] = field(
+        default_factory=lambda: list(CONFIG['services']['route_filters'].get('collections') or []),
+        metadata={"help": "Các collection được áp bộ lọc trích xuất từ câu hỏi."}
+    )
+
+    # llm cache config
+
+    llm_cache_ttl_seconds: int = field(
+        default=CONFIG['services']['llm_cache']['ttl_seconds'],
+        metadata={"help": "Thời gian sống của entry trong LLM cache (giây), 0 = không hết hạn."}
+    )
+    llm_cache_max_entries: int = field(
+        default=CONFIG['services']['llm_cache']['max_entries'],
+        metadata={"help": "Số entry tối đa trong SQLite của LLM cache."}
+    )
+    llm_cache_memory_entries: int = field(
+        default=CONFIG['services']['llm_cache']['memory_entries'],
+        metadata={"help": "Số entry của tầng LRU trong process đặt trước SQLite."}
+    )
+    llm_cache_flush_interval_seconds: float = field(
+        default=CONFIG['services']['llm_cache']['flush_interval_seconds'],
+        metadata={"help": "Khoảng thời gian gom các lần ghi cache thành một transaction (giây)."}
+    )
+    llm_cache_policies: Dict[str, Dict[str, Any]] = field(
+        default_factory=lambda: dict(CONFIG['services']['llm_cache'].get('policies') or {}),
+        metadata={"help": "Chính sách LLM cache theo nơi gọi (routing / general / context): enabled, ttl_seconds."}
+    )
+
+    # session config (lịch sử hội thoại phía server)
+
+    session_enabled: bool = field(
+        default=CONFIG['services']['session']['enabled'],
+        metadata={"help": "Lưu lịch sử hội thoại phía server theo session_id."}
+    )
+    session_backend: str = field(
+        default=CONFIG['services']['session']['backend'],
+        metadata={"help": "Backend lưu session: memory | redis."}
+    )
+    session_idle_ttl_seconds: int = field(
+        default=CONFIG['services']['session']['idle_ttl_seconds'],
+        metadata={"help": "Session không được dùng quá thời gian này (giây) sẽ bị xoá."}
+    )
+    session_max_sessions: int = field(
+        default=CONFIG['services']['session']['max_sessions'],
+        metadata={"help": "Số session tối đa giữ trong process (LRU)."}
+    )
+    session_memory_mode: Literal["window", "summary"] = field(
+        default=CONFIG['services']['session']['memory_mode'],
+        metadata={"help": "window: giữ tối đa MAX_HISTORY message nguyên văn; summary: tóm tắt nền các lượt cũ."}
+    )
+    session_summary_keep_turns: int = field(
+        default=CONFIG['services']['session']['summary_keep_turns'],
+        metadata={"help": "Số lượt hội thoại cuối giữ nguyên văn ở chế độ summary."}
+    )
+    session_summary_every_turns: int = field(
+        default=CONFIG['services']['session']['summary_every_turns'],
+        metadata={"help": "Số lượt tích luỹ thêm trước khi gộp vào bản tóm tắt."}
+    )
+    session_summary_max_tokens: int = field(
+        default=CONFIG['services']['session']['summary_max_tokens'],
+        metadata={"help": "Số token tối đa của bản tóm tắt hội thoại."}
+    )
+
+    # semantic cache config
+
+    semantic_cache_enabled: bool = field(
+        default=CONFIG['services']['semantic_cache']['enabled'],
+        metadata={"help": "Bật/tắt semantic cache câu trả lời (bỏ qua định tuyến, truy xuất và sinh câu trả lời khi hit)."}
+    )
+    semantic_cache_threshold: float = field(
+        default=CONFIG['services']['semantic_cache']['threshold'],
+        metadata={"help": "Độ tương đồng cosine tối thiểu giữa hai câu hỏi để dùng lại câu trả lời."}
+    )
+    semantic_cache_ttl_seconds: int = field(
+        default=CONFIG['services']['semantic_cache']['ttl_seconds'],
+        metadata={"help": "Thời gian sống của mỗi entry trong semantic cache (giây)."}
+    )
+    semantic_cache_max_entries: int = field(
+        default=CONFIG['services']['semantic_cache']['max_entries'],
+        metadata={"help": "Số entry tối đa giữ trong chỉ mục in-process (LRU)."}
+    )
+    semantic_cache_backend: str = field(
+        default=CONFIG['services']['semantic_cache']['backend'],
+        metadata={"help": "Backend lưu trữ semantic cache: none | redis | qdrant."}
+    )
+    semantic_cache_collection: str = field(
+        default=CONFIG['services']['semantic_cache']['collection'],
+        metadata={"help": "Tên collection Qdrant khi semantic_cache_backend = qdrant."}
+    )
+    semantic_cache_qdrant_purge_interval_seconds: int = field(
+        default=CONFIG['services']['semantic_cache']['qdrant_purge_interval_seconds'],
+        metadata={"help": "Chu kỳ (giây) xoá điểm hết hạn trên collection Qdrant; 0 = chỉ xoá lúc khởi động."}
+    )
+
     # Helper: trả về DSN cuối cùng để client dùng
     def get_redis_dsn(self) -> Optional[str]:
         if not self.redis_enabled:
@@ -0,0 +1,50 @@
+import threading
+from collections import defaultdict, deque
+from typing import Deque, Dict, Optional
+
+
+class LatencyRecorder:
+    """
+    Lưu cửa sổ latency gần nhất theo nhãn (vd: nhánh workflow) và tính count / mean / p50 / p95.
+    Thread-safe, bộ nhớ giới hạn bởi `window` mẫu cho mỗi nhãn.
+    """
+
+    def __init__(self, window: int = 1000):
+        self.window = window
+        self._samples: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=self.window))
+        self._counts: Dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def observe(self, label: str, seconds: float) -> None:
+        with self._lock:
+            self._samples[label].append(float(seconds))
+            self._counts[label] += 1
+
+    @staticmethod
+    def _percentile(ordered, q: float) -> float:
+        idx = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+        return ordered[idx]
+
+    def quantile(self, label: str, q: float) -> Optional[float]:
+        """Phân vị q của cửa sổ hiện tại cho một nhãn, None nếu chưa có mẫu."""
+        with self._lock:
+            ordered = sorted(self._samples.get(label, ()))
+        return self._percentile(ordered, q) if ordered else None
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            snapshot = {label: sorted(samples) for label, samples in self._samples.items()}
+            counts = dict(self._counts)
+
+        out: Dict[str, Dict[str, float]] = {}
+        for label, ordered in snapshot.items():
+            if not ordered:
+                continue
+            out[label] = {
+                "count": counts.get(label, 0),
+                "mean_s": round(sum(ordered) / len(ordered), 4),
+                "p50_s": round(self._percentile(ordered, 0.50), 4),
+                "p95_s": round(self._percentile(ordered, 0.95), 4),
+                "max_s": round(ordered[-1], 4),
+            }
+        return out
@@ -1,6 +1,6 @@
 
 from string import Template
-from typing import Any, Dict, Union
+from typing import Any, Dict, List, Union
 from typing_extensions import TypedDict
 
 class TextChatMessage(TypedDict):
@@ -8,6 +8,13 @@ class TextChatMessage(TypedDict):
     role: str  # Either "system", "user", or "assistant"
     content: Union[str, Template]  # The text content of the message (could also be a string.Template instance)
 
+def message_text(content: Any) -> str:
+    """Nội dung dạng chuỗi của một message; content dạng danh sách block ({"type": "text", "text": ...}) được nối lại."""
+    if isinstance(content, list):
+        return "".join(block.get("text", "") for block in content if isinstance(block, dict))
+    return str(content or "")
+
+
 class DocumentProcessor:
     """Xử lý và định dạng tài liệu được truy xuất"""
     
@@ -65,3 +72,24 @@ class DocumentProcessor:
         
         content += "</document>\n\n"
         return content
+
+    @staticmethod
+    def extract_sources(documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Rút gọn danh sách tài liệu đã dùng thành nguồn trích dẫn trả về cho client"""
+        sources = []
+        for document in documents or []:
+            payload = document.get("payload", {}) or {}
+            title = (
+                payload.get("procedure_name")
+                or payload.get("law_name")
+                or payload.get("form_name")
+                or payload.get("term")
+            )
+            sources.append({
+                "id": str(document.get("id")),
+                "title": title,
+                "code": payload.get("procedure_code") or payload.get("law_code") or payload.get("form_code"),
+                "source": payload.get("source"),
+                "score": document.get("rerank_score", document.get("score")),
+            })
+        return sources
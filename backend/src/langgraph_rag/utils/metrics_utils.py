@@ -0,0 +1,215 @@
+import asyncio
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Sequence, Tuple
+
+# Bucket (giây) cho latency: từ vài ms (cache, Qdrant) tới hàng chục giây (LLM)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(labelnames: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{value}"' for name, value in zip(labelnames, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Histogram:
+    """Histogram kiểu Prometheus (bucket cộng dồn + _sum + _count), thread-safe."""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            # [count từng bucket..., +Inf, sum]
+            series = self._series.setdefault(key, [0.0] * (len(self.buckets) + 2))
+            series[idx] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {k: list(v) for k, v in self._series.items()}
+        for key, series in sorted(snapshot.items()):
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {int(cumulative)}")
+            cumulative += series[len(self.buckets)]
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {int(cumulative)}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {series[-1]:.6f}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {int(cumulative)}")
+        return lines
+
+
+class Counter:
+    """Counter kiểu Prometheus theo nhãn, thread-safe."""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            snapshot = dict(self._values)
+        for key, value in sorted(snapshot.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value:g}")
+        return lines
+
+
+NODE_SECONDS = Histogram("rag_node_seconds", "Wall time of each workflow node.", ["node"])
+STAGE_SECONDS = Histogram("rag_stage_seconds", "Time spent in remote / model calls (guardrail, routing, embedding, qdrant, rerank, llm).", ["stage"])
+WORKFLOW_SECONDS = Histogram("rag_workflow_seconds", "End-to-end workflow latency by path.", ["path"])
+TOKENS_TOTAL = Counter("rag_tokens_total", "Tokens / guardrail characters accounted per node.", ["node"])
+LLM_TOKENS_TOTAL = Counter("rag_llm_tokens_total", "LLM tokens by kind (prompt / completion / cache_read / cache_write).", ["kind"])
+CACHE_EVENTS_TOTAL = Counter("rag_cache_events_total", "Cache lookups by cache and result.", ["cache", "result"])
+PROMPT_TOKENS_SAVED_TOTAL = Counter("rag_prompt_tokens_saved_total", "Prompt tokens removed by the token budget or template indent stripping, by reason.", ["reason"])
+LLM_TIER_CALLS_TOTAL = Counter("rag_llm_tier_calls_total", "Answer generations by task tier, model and whether they escalated.", ["task", "model", "escalated"])
+RESILIENCE_EVENTS_TOTAL = Counter("rag_resilience_events_total", "Hedged requests and circuit breaker events by target (model / guardrail).", ["target", "event"])
+INTENT_ROUTING_TOTAL = Counter("rag_intent_routing_total", "Routed questions by source (local classifier / llm / llm for payload filters).", ["source"])
+EMBEDDING_BATCH_SIZE = Histogram("rag_embedding_batch_size", "Texts per forward pass of the embedding micro-batcher.", buckets=(1, 2, 4, 8, 16, 32, 64))
+SMALL_TALK_SECONDS_SAVED_TOTAL = Counter("rag_small_talk_seconds_saved_total", "Estimated latency saved by template small-talk answers (general path p50 - actual).")
+ROUTING_SECONDS_SAVED_TOTAL = Counter("rag_routing_seconds_saved_total", "Estimated routing latency saved by the local intent classifier (LLM EWMA - local time).")
+
+REGISTRY = [
+    NODE_SECONDS, STAGE_SECONDS, WORKFLOW_SECONDS, TOKENS_TOTAL, LLM_TOKENS_TOTAL, CACHE_EVENTS_TOTAL,
+    PROMPT_TOKENS_SAVED_TOTAL, LLM_TIER_CALLS_TOTAL, RESILIENCE_EVENTS_TOTAL, INTENT_ROUTING_TOTAL, ROUTING_SECONDS_SAVED_TOTAL,
+    SMALL_TALK_SECONDS_SAVED_TOTAL, EMBEDDING_BATCH_SIZE,
+]
+
+
+def render_metrics() -> str:
+    """Text exposition format cho endpoint /metrics."""
+    lines: List[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# --- ghi vào state["execution_metadata"] + histogram ---
+
+@contextmanager
+def track_stage(metadata: Dict[str, Any], stage: str) -> Iterator[None]:
+    """
+    Đo thời gian một lời gọi remote / model, cộng dồn vào metadata["stages"][stage].
+    Tác vụ bị huỷ (vd: truy xuất đón đầu) không được tính.
+    """
+    t0 = time.perf_counter()
+    try:
+        yield
+    except asyncio.CancelledError:
+        raise
+    except BaseException:
+        _add_stage(metadata, stage, time.perf_counter() - t0)
+        raise
+    else:
+        _add_stage(metadata, stage, time.perf_counter() - t0)
+
+
+@contextmanager
+def track_batch_stage(metadatas: List[Dict[str, Any]], stage: str) -> Iterator[None]:
+    """
+    Như track_stage cho một lời gọi phục vụ nhiều state (/chat/batch): histogram ghi một lần,
+    metadata["stages"][stage] của mỗi state nhận phần chia đều của thời gian.
+    """
+    t0 = time.perf_counter()
+    try:
+        yield
+    except asyncio.CancelledError:
+        raise
+    except BaseException:
+        _split_stage(metadatas, stage, time.perf_counter() - t0)
+        raise
+    else:
+        _split_stage(metadatas, stage, time.perf_counter() - t0)
+
+
+def _split_stage(metadatas: List[Dict[str, Any]], stage: str, elapsed: float) -> None:
+    STAGE_SECONDS.observe(elapsed, stage=stage)
+    share = elapsed / max(1, len(metadatas))
+    for metadata in metadatas:
+        stages = metadata.setdefault("stages", {})
+        stages[stage] = round(stages.get(stage, 0.0) + share, 4)
+
+
+def _add_stage(metadata: Dict[str, Any], stage: str, elapsed: float) -> None:
+    STAGE_SECONDS.observe(elapsed, stage=stage)
+    stages = metadata.setdefault("stages", {})
+    stages[stage] = round(stages.get(stage, 0.0) + elapsed, 4)
+
+
+def record_node(metadata: Dict[str, Any], node: str, elapsed: float, tokens: int = 0) -> None:
+    NODE_SECONDS.observe(elapsed, node=node)
+    if tokens:
+        TOKENS_TOTAL.inc(tokens, node=node)
+    metadata.setdefault("nodes", {})[node] = {"wall_s": round(elapsed, 4), "tokens": tokens}
+
+
+def record_cache(metadata: Dict[str, Any], cache: str, hit: bool) -> None:
+    result = "hit" if hit else "miss"
+    CACHE_EVENTS_TOTAL.inc(cache=cache, result=result)
+    metadata.setdefault("cache", {})[cache] = result
+
+
+def record_llm_usage(usage: Dict[str, Any]) -> None:
+    for kind in ("prompt_tokens", "completion_tokens", "cache_read_tokens", "cache_write_tokens"):
+        if usage.get(kind):
+            LLM_TOKENS_TOTAL.inc(usage[kind], kind=kind.replace("_tokens", ""))
+
+
+def record_llm_tier(metadata: Dict[str, Any], usage: Dict[str, Any]) -> None:
+    """Tier đã trả lời (task / model / escalated), ghi vào metadata["llm_tier"]."""
+    if not usage.get("task"):
+        return
+    escalated = bool(usage.get("escalated"))
+    LLM_TIER_CALLS_TOTAL.inc(task=usage["task"], model=str(usage.get("model")), escalated=str(escalated).lower())
+    metadata["llm_tier"] = {
+        "task": usage["task"],
+        "model": usage.get("model"),
+        "escalated": escalated,
+        "escalated_from": usage.get("escalated_from"),
+    }
+
+
+def record_intent_routing(metadata: Dict[str, Any], source: str, prediction: Any = None, saved_s: float = 0.0) -> None:
+    """Nguồn định tuyến ("local" | "llm" | "llm_filters") + độ tin cậy của classifier, ghi vào metadata["intent_routing"]."""
+    INTENT_ROUTING_TOTAL.inc(source=source)
+    if saved_s > 0:
+        ROUTING_SECONDS_SAVED_TOTAL.inc(saved_s)
+    routing: Dict[str, Any] = {"source": source}
+    if prediction is not None:
+        routing.update(label=prediction.label, similarity=prediction.similarity, margin=prediction.margin)
+    if source == "local":
+        routing["saved_s"] = round(saved_s, 4)
+    metadata["intent_routing"] = routing
+
+
+def record_prompt_budget(metadata: Dict[str, Any], report: Dict[str, Any]) -> None:
+    if not report:
+        return
+    for reason in ("history", "document", "indent"):
+        saved = report.get(f"{reason}_tokens_saved") or 0
+        if saved > 0:
+            PROMPT_TOKENS_SAVED_TOTAL.inc(saved, reason=reason)
+    metadata["prompt_budget"] = dict(report)
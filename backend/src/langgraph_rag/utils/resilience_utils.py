@@ -0,0 +1,442 @@
+import asyncio
+import bisect
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, TimeoutError as FuturesTimeout, wait
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple, TypeVar
+
+from .logger_utils import get_logger
+from .metrics_utils import RESILIENCE_EVENTS_TOTAL
+
+logger = get_logger(__name__)
+
+T = TypeVar("T")
+
+# Bucket (giây) của histogram latency: đủ mịn quanh 0.1–5s để chọn ngưỡng hedge
+LATENCY_BUCKETS = (
+    0.05, 0.1, 0.15, 0.2, 0.3, 0.4, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 4.0, 5.0, 7.5, 10.0, 15.0, 20.0, 30.0, 60.0,
+)
+
+
+class CircuitOpenError(RuntimeError):
+    """Mạch của một model / guardrail đang mở: từ chối ngay, không gọi dịch vụ."""
+
+    def __init__(self, target: str, retry_after_s: float = 0.0):
+        super().__init__(f"Circuit open for {target}, retry after {retry_after_s:.1f}s")
+        self.target = target
+        self.retry_after_s = retry_after_s
+
+
+def is_service_failure(error: BaseException) -> bool:
+    """Lỗi phía client (HTTP 4xx trừ 408 / 429, vd: prompt quá dài) không phản ánh sức khoẻ dịch vụ -> không tính vào breaker."""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        # botocore ClientError
+        response = getattr(error, "response", None)
+        if isinstance(response, dict):
+            status = (response.get("ResponseMetadata") or {}).get("HTTPStatusCode")
+    try:
+        status = int(status)
+    except (TypeError, ValueError):
+        return True
+    return not (400 <= status < 500 and status not in (408, 429))
+
+
+def _close_quietly(result: Any) -> None:
+    """Đóng kết quả của bản sao thua cuộc (vd: stream đã mở) để trả kết nối."""
+    close = getattr(result, "close", None)
+    if callable(close):
+        try:
+            close()
+        except Exception:
+            pass
+
+
+class SlidingWindowHistogram:
+    """
+    Histogram latency trong cửa sổ trượt `window_s` giây, chia thành `slices` lát thời gian;
+    lát ra khỏi cửa sổ bị bỏ nên percentile phản ánh tình trạng gần đây của dịch vụ. Thread-safe.
+    """
+
+    def __init__(self, window_s: float = 300.0, slices: int = 10, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.slices = max(1, int(slices))
+        self.slice_s = max(1e-3, float(window_s) / self.slices)
+        # (chỉ số lát, số mẫu theo bucket + bucket +Inf)
+        self._window: Deque[Tuple[int, List[int]]] = deque()
+        self._lock = threading.Lock()
+
+    def _current(self, now: float) -> List[int]:
+        idx = int(now // self.slice_s)
+        while self._window and self._window[0][0] <= idx - self.slices:
+            self._window.popleft()
+        if not self._window or self._window[-1][0] != idx:
+            self._window.append((idx, [0] * (len(self.buckets) + 1)))
+        return self._window[-1][1]
+
+    def observe(self, seconds: float) -> None:
+        pos = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            self._current(time.monotonic())[pos] += 1
+
+    def _merged(self) -> List[int]:
+        with self._lock:
+            self._current(time.monotonic())
+            merged = [0] * (len(self.buckets) + 1)
+            for _, counts in self._window:
+                for i, c in enumerate(counts):
+                    merged[i] += c
+        return merged
+
+    def count(self) -> int:
+        return sum(self._merged())
+
+    @staticmethod
+    def _quantile(buckets: Tuple[float, ...], merged: List[int], q: float) -> Optional[float]:
+        total = sum(merged)
+        if total == 0:
+            return None
+        target = q * total
+        cumulative = 0
+        for i, c in enumerate(merged):
+            if c and cumulative + c >= target:
+                if i >= len(buckets):
+                    return buckets[-1]
+                lower = buckets[i - 1] if i > 0 else 0.0
+                # nội suy tuyến tính trong bucket (như histogram_quantile của Prometheus)
+                return lower + (buckets[i] - lower) * (target - cumulative) / c
+            cumulative += c
+        return buckets[-1]
+
+    def percentile(self, q: float) -> Optional[float]:
+        return self._quantile(self.buckets, self._merged(), q)
+
+    def summary(self) -> Dict[str, Any]:
+        merged = self._merged()
+        out: Dict[str, Any] = {"count": sum(merged)}
+        for label, q in (("p50_s", 0.50), ("p95_s", 0.95), ("p99_s", 0.99)):
+            value = self._quantile(self.buckets, merged, q)
+            out[label] = round(value, 4) if value is not None else None
+        return out
+
+
+class CircuitBreaker:
+    """
+    closed -> (failure_threshold lỗi liên tiếp) -> open -> (recovery_s) -> half_open: cho `half_open_max_calls`
+    lời gọi thử; thành công -> closed, lỗi -> open lại.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_s: float = 30.0, half_open_max_calls: int = 1):
+        self.name = name
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.recovery_s = float(recovery_s)
+        self.half_open_max_calls = max(1, int(half_open_max_calls))
+
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        self._opens = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+
+    def retry_after(self) -> float:
+        with self._lock:
+            if self._state != self.OPEN:
+                return 0.0
+            return max(0.0, self._opened_at + self.recovery_s - time.monotonic())
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._state == self.OPEN:
+                if time.monotonic() < self._opened_at + self.recovery_s:
+                    return False
+                self._state = self.HALF_OPEN
+                self._probes = 0
+            if self._state == self.HALF_OPEN:
+                if self._probes >= self.half_open_max_calls:
+                    return False
+                self._probes += 1
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._state != self.CLOSED:
+                logger.info(f"[CircuitBreaker] {self.name} closed")
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probes = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    self._opens += 1
+                    RESILIENCE_EVENTS_TOTAL.inc(target=self.name, event="circuit_opened")
+                    logger.warning(f"[CircuitBreaker] {self.name} opened after {self._failures} failures")
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probes = 0
+
+    def record_ignored(self) -> None:
+        """Lời gọi kết thúc mà không cho biết gì về sức khoẻ dịch vụ (lỗi 4xx, bị huỷ): trả lượt thử half-open."""
+        with self._lock:
+            if self._state == self.HALF_OPEN and self._probes > 0:
+                self._probes -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"state": self._state, "consecutive_failures": self._failures, "opens": self._opens}
+
+
+_HEDGE_EXECUTOR: Optional[ThreadPoolExecutor] = None
+_HEDGE_EXECUTOR_LOCK = threading.Lock()
+
+
+def _hedge_executor(max_workers: int) -> ThreadPoolExecutor:
+    global _HEDGE_EXECUTOR
+    with _HEDGE_EXECUTOR_LOCK:
+        if _HEDGE_EXECUTOR is None:
+            _HEDGE_EXECUTOR = ThreadPoolExecutor(max_workers=max(2, int(max_workers)), thread_name_prefix="rag-hedge")
+        return _HEDGE_EXECUTOR
+
+
+class ResilientCaller:
+    """
+    Bọc lời gọi tới một dịch vụ (một model Bedrock, một guardrail...):
+    - Circuit breaker: mạch mở -> CircuitOpenError ngay, nơi gọi chuyển sang đường suy giảm.
+    - Hedged request: lời gọi chưa xong sau percentile `hedge_percentile` của latency gần đây -> gửi thêm một bản sao,
+      lấy kết quả về trước, bỏ bản còn lại. Số bản sao bị giới hạn bởi `hedge_max_ratio` (token bucket).
+    - Latency thành công được ghi vào SlidingWindowHistogram riêng cho từng `op` (completion / stream / ...).
+    """
+
+    HEDGE_BURST = 10.0 # số bản sao tối đa được tích luỹ khi ít request
+
+    def __init__(
+        self,
+        name: str,
+        enabled: bool = True,
+        window_s: float = 300.0,
+        hedge_enabled: bool = True,
+        hedge_percentile: float = 0.95,
+        hedge_min_samples: int = 20,
+        hedge_min_delay_s: float = 0.2,
+        hedge_max_ratio: float = 0.1,
+        hedge_workers: int = 16,
+        failure_threshold: int = 5,
+        recovery_s: float = 30.0,
+    ):
+        self.name = name
+        self.enabled = bool(enabled)
+        self.window_s = float(window_s)
+        self.hedge_enabled = bool(hedge_enabled)
+        self.hedge_percentile = float(hedge_percentile)
+        self.hedge_min_samples = int(hedge_min_samples)
+        self.hedge_min_delay_s = float(hedge_min_delay_s)
+        self.hedge_max_ratio = float(hedge_max_ratio)
+        self.hedge_workers = int(hedge_workers)
+        self.breaker = CircuitBreaker(name, failure_threshold=failure_threshold, recovery_s=recovery_s)
+
+        self._histograms: Dict[str, SlidingWindowHistogram] = {}
+        self._hedge_tokens = 0.0
+        self._lock = threading.Lock()
+        self._counters = {"calls": 0, "failures": 0, "short_circuited": 0, "hedges_sent": 0, "hedges_won": 0}
+
+    # --- nội bộ ---
+
+    def _histogram(self, op: str) -> SlidingWindowHistogram:
+        with self._lock:
+            hist = self._histograms.get(op)
+            if hist is None:
+                hist = self._histograms[op] = SlidingWindowHistogram(window_s=self.window_s)
+            return hist
+
+    def _event(self, event: str) -> None:
+        with self._lock:
+            self._counters[event] += 1
+        RESILIENCE_EVENTS_TOTAL.inc(target=self.name, event=event)
+
+    def hedge_delay(self, op: str) -> Optional[float]:
+        """Ngưỡng gửi bản sao cho `op`; None khi tắt hedge hoặc chưa đủ mẫu trong cửa sổ."""
+        if not self.hedge_enabled or self.hedge_max_ratio <= 0:
+            return None
+        hist = self._histogram(op)
+        if hist.count() < self.hedge_min_samples:
+            return None
+        return max(self.hedge_min_delay_s, hist.percentile(self.hedge_percentile) or 0.0)
+
+    def _take_hedge_token(self) -> bool:
+        with self._lock:
+            if self._hedge_tokens < 1.0:
+                return False
+            self._hedge_tokens -= 1.0
+            return True
+
+    def _before(self) -> None:
+        if not self.breaker.allow():
+            self._event("short_circuited")
+            raise CircuitOpenError(self.name, self.breaker.retry_after())
+        with self._lock:
+            self._counters["calls"] += 1
+            self._hedge_tokens = min(self.HEDGE_BURST, self._hedge_tokens + self.hedge_max_ratio)
+
+    def _after_error(self, error: BaseException) -> None:
+        if isinstance(error, Exception) and is_service_failure(error):
+            self._event("failures")
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_ignored()
+
+    def _after_success(self, op: str, started: float) -> None:
+        self._histogram(op).observe(time.perf_counter() - started)
+        self.breaker.record_success()
+
+    # --- sync ---
+
+    def call(self, op: str, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        if not self.enabled:
+            return fn(*args, **kwargs)
+        self._before()
+        started = time.perf_counter()
+        try:
+            delay = self.hedge_delay(op)
+            result = fn(*args, **kwargs) if delay is None else self._hedged_call(fn, args, kwargs, delay)
+        except BaseException as e:
+            self._after_error(e)
+            raise
+        self._after_success(op, started)
+        return result
+
+    def _hedged_call(self, fn: Callable[..., T], args, kwargs, delay: float) -> T:
+        # lời gọi sync không huỷ được giữa chừng: cả hai bản chạy trong pool, bản thua chạy nốt rồi bị bỏ
+        executor = _hedge_executor(self.hedge_workers)
+        primary = executor.submit(fn, *args, **kwargs)
+        try:
+            return primary.result(timeout=delay)
+        except FuturesTimeout:
+            pass
+        if not self._take_hedge_token():
+            return primary.result()
+
+        self._event("hedges_sent")
+        futures = [primary, executor.submit(fn, *args, **kwargs)]
+        pending = set(futures)
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is futures[1]:
+                        self._event("hedges_won")
+                    for loser in pending:
+                        loser.add_done_callback(lambda f: f.exception() is None and _close_quietly(f.result()))
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    # --- async ---
+
+    async def acall(self, op: str, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Như call nhưng `fn` là coroutine function; bản sao thua cuộc bị huỷ."""
+        if not self.enabled:
+            return await fn(*args, **kwargs)
+        self._before()
+        started = time.perf_counter()
+        try:
+            delay = self.hedge_delay(op)
+            result = await (fn(*args, **kwargs) if delay is None else self._ahedged_call(fn, args, kwargs, delay))
+        except BaseException as e:
+            self._after_error(e)
+            raise
+        self._after_success(op, started)
+        return result
+
+    async def _ahedged_call(self, fn: Callable[..., Any], args, kwargs, delay: float) -> Any:
+        def start() -> asyncio.Task:
+            task = asyncio.ensure_future(fn(*args, **kwargs))
+            # tránh cảnh báo "exception was never retrieved" cho bản thua
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            return task
+
+        tasks = [start()]
+        winner: Optional[asyncio.Task] = None
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done and self._take_hedge_token():
+                self._event("hedges_sent")
+                tasks.append(start())
+
+            pending = set(tasks)
+            error: Optional[BaseException] = None
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        winner = task
+                        break
+                    error = task.exception()
+            if winner is None:
+                raise error
+            if winner is not tasks[0]:
+                self._event("hedges_won")
+            return winner.result()
+        finally:
+            for task in tasks:
+                if task is winner:
+                    continue
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled() and task.exception() is None:
+                    _close_quietly(task.result())
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+            ops = list(self._histograms.items())
+        return {
+            **counters,
+            "circuit": self.breaker.stats(),
+            "latency": {op: hist.summary() for op, hist in ops},
+            "hedge_delay_s": {op: self.hedge_delay(op) for op, _ in ops},
+        }
+
+
+_CALLERS: Dict[str, ResilientCaller] = {}
+_CALLERS_LOCK = threading.Lock()
+
+
+def get_resilient_caller(name: str, global_config: Any) -> ResilientCaller:
+    """Một ResilientCaller cho mỗi `name` (vd: "llm:<model id>"), dùng chung cho mọi instance trong process."""
+    with _CALLERS_LOCK:
+        caller = _CALLERS.get(name)
+        if caller is None:
+            caller = _CALLERS[name] = ResilientCaller(
+                name,
+                enabled=global_config.resilience_enabled,
+                window_s=global_config.resilience_latency_window_seconds,
+                hedge_enabled=global_config.resilience_hedge_enabled,
+                hedge_percentile=global_config.resilience_hedge_percentile,
+                hedge_min_samples=global_config.resilience_hedge_min_samples,
+                hedge_min_delay_s=global_config.resilience_hedge_min_delay_seconds,
+                hedge_max_ratio=global_config.resilience_hedge_max_ratio,
+                hedge_workers=global_config.resilience_hedge_workers,
+                failure_threshold=global_config.resilience_breaker_failure_threshold,
+                recovery_s=global_config.resilience_breaker_recovery_seconds,
+            )
+        return caller
+
+
+def resilience_stats() -> Dict[str, Any]:
+    with _CALLERS_LOCK:
+        callers = dict(_CALLERS)
+    return {name: caller.stats() for name, caller in callers.items()}
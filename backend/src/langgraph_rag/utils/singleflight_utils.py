@@ -0,0 +1,139 @@
+import asyncio
+import copy
+import hashlib
+import json
+import re
+import unicodedata
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .logger_utils import get_logger
+
+logger = get_logger(__name__)
+
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_question(question: str) -> str:
+    """NFC + casefold + gộp khoảng trắng + bỏ dấu câu cuối: 'Thủ tục  tạm trú?' == 'thủ tục tạm trú'."""
+    text = unicodedata.normalize("NFC", question or "").casefold()
+    return _SPACES.sub(" ", text).strip().rstrip("?!.… ").strip()
+
+
+def flight_key(question: str, history: Optional[List[Dict[str, Any]]] = None) -> str:
+    """Khoá single-flight: câu hỏi đã chuẩn hoá + hash lịch sử hội thoại."""
+    history_hash = hashlib.sha256(
+        json.dumps(history or [], ensure_ascii=False, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()[:16]
+    question_hash = hashlib.sha256(normalize_question(question).encode("utf-8")).hexdigest()[:32]
+    return f"{question_hash}:{history_hash}"
+
+
+class _StreamFlight:
+    """Log sự kiện của một luồng stream dùng chung: leader bơm vào, mọi subscriber đọc lại từ đầu."""
+
+    def __init__(self) -> None:
+        self.events: List[Any] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.changed = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+    def _notify(self) -> None:
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+
+class SingleFlight:
+    """
+    Gộp các request giống hệt nhau đang chạy cùng lúc (single-flight):
+    request đầu tiên (leader) chạy workflow, các request sau cùng khoá (follower) chờ và nhận bản sao kết quả.
+    - Tác vụ của leader chạy trong task riêng: client của leader ngắt kết nối không làm hỏng follower.
+    - Follower chỉ chờ tối đa `wait_timeout_s`; quá hạn thì tự chạy (hoặc báo lỗi nếu đã nhận một phần stream).
+    """
+
+    def __init__(self, wait_timeout_s: float = 30.0, enabled: bool = True):
+        self.wait_timeout_s = wait_timeout_s
+        self.enabled = enabled
+        self._calls: Dict[str, asyncio.Task] = {}
+        self._streams: Dict[str, _StreamFlight] = {}
+        self.stats = {"leaders": 0, "followers": 0, "timeouts": 0}
+
+    async def run(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Trả về (kết quả, shared). shared=True nghĩa là kết quả lấy từ leader."""
+        if not self.enabled:
+            return await factory(), False
+
+        task = self._calls.get(key)
+        if task is None:
+            self.stats["leaders"] += 1
+            task = asyncio.create_task(factory())
+            self._calls[key] = task
+            task.add_done_callback(lambda _t: self._calls.pop(key, None) if self._calls.get(key) is _t else None)
+            return await asyncio.shield(task), False
+
+        self.stats["followers"] += 1
+        try:
+            result = await asyncio.wait_for(asyncio.shield(task), timeout=self.wait_timeout_s)
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1
+            logger.warning(f"[SingleFlight] Leader for {key} exceeded {self.wait_timeout_s}s, running independently")
+            return await factory(), False
+        return copy.deepcopy(result), True
+
+    async def _pump(self, key: str, flight: _StreamFlight, factory: Callable[[], AsyncIterator[Any]]) -> None:
+        try:
+            async for event in factory():
+                flight.events.append(event)
+                flight._notify()
+        except BaseException as e:
+            flight.error = e
+        finally:
+            flight.done = True
+            flight._notify()
+            if self._streams.get(key) is flight:
+                self._streams.pop(key, None)
+
+    async def stream(self, key: str, factory: Callable[[], AsyncIterator[Any]]) -> AsyncIterator[Tuple[Any, bool]]:
+        """
+        Async iterator (event, shared). Follower phát lại các event đã có rồi theo dõi tiếp.
+        Event được deepcopy cho follower để không chia sẻ state có thể bị sửa.
+        """
+        if not self.enabled:
+            async for event in factory():
+                yield event, False
+            return
+
+        flight = self._streams.get(key)
+        leader = flight is None
+        if leader:
+            self.stats["leaders"] += 1
+            flight = _StreamFlight()
+            self._streams[key] = flight
+            flight.task = asyncio.create_task(self._pump(key, flight, factory))
+        else:
+            self.stats["followers"] += 1
+
+        idx = 0
+        while True:
+            while idx < len(flight.events):
+                event = flight.events[idx]
+                idx += 1
+                yield (event, False) if leader else (copy.deepcopy(event), True)
+            if flight.done:
+                if flight.error is not None:
+                    raise flight.error
+                return
+            changed = flight.changed
+            if leader:
+                await changed.wait()
+                continue
+            try:
+                await asyncio.wait_for(changed.wait(), timeout=self.wait_timeout_s)
+            except asyncio.TimeoutError:
+                self.stats["timeouts"] += 1
+                if idx > 0:
+                    raise
+                logger.warning(f"[SingleFlight] Leader stream for {key} stalled, running independently")
+                async for event in factory():
+                    yield event, False
+                return
@@ -0,0 +1,45 @@
+import json
+import re
+from typing import Any, Dict, List
+
+_SENTENCE_END = re.compile(r"[.!?…:;\n]\s")
+
+
+class DeltaCoalescer:
+    """
+    Gom các delta token nhỏ từ LLM thành frame theo từ / câu trước khi đẩy xuống SSE.
+    - Có dấu kết thúc câu trong buffer -> xả tới hết câu đó.
+    - Buffer đủ `min_chars` -> xả tới khoảng trắng cuối cùng (không cắt giữa từ).
+    """
+
+    def __init__(self, min_chars: int = 24, max_chars: int = 400):
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self._buffer = ""
+
+    def push(self, delta: str) -> List[str]:
+        if not delta:
+            return []
+        self._buffer += delta
+
+        cut = -1
+        for m in _SENTENCE_END.finditer(self._buffer):
+            cut = m.end()
+        if cut <= 0 and len(self._buffer) >= self.min_chars:
+            ws = max(self._buffer.rfind(" "), self._buffer.rfind("\n"))
+            cut = ws + 1 if ws > 0 else -1
+        if cut <= 0 and len(self._buffer) >= self.max_chars:
+            cut = len(self._buffer)
+        if cut <= 0:
+            return []
+
+        frame, self._buffer = self._buffer[:cut], self._buffer[cut:]
+        return [frame]
+
+    def flush(self) -> List[str]:
+        frame, self._buffer = self._buffer, ""
+        return [frame] if frame else []
+
+
+def sse_event(payload: Dict[str, Any]) -> str:
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
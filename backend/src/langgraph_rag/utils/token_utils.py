@@ -0,0 +1,85 @@
+import re
+import threading
+from functools import lru_cache
+from typing import Any, Dict, Iterable, Optional
+
+from .llm_utils import message_text
+from .logger_utils import get_logger
+
+logger = get_logger(__name__)
+
+# phần đệm mỗi message (role + ký hiệu phân tách của chat template)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_BLANK_LINES = re.compile(r"\n{3,}")
+
+
+def strip_indent(text: str) -> str:
+    """Bỏ thụt lề / khoảng trắng cuối dòng của template prompt và gộp các dòng trống liên tiếp."""
+    lines = [line.strip() for line in (text or "").strip().splitlines()]
+    return _BLANK_LINES.sub("\n\n", "\n".join(lines))
+
+
+_TRAILING_SPACES = re.compile(r"[ \t]+\n")
+
+
+def normalize_whitespace(text: str) -> str:
+    """Chuẩn hoá phần biến đổi của prompt: bỏ khoảng trắng cuối dòng, gộp dòng trống liên tiếp (giữ thụt lề đầu dòng)."""
+    text = _TRAILING_SPACES.sub("\n", str(text or ""))
+    return _BLANK_LINES.sub("\n\n", text).strip()
+
+
+class TokenCounter:
+    """
+    Đếm token bằng tokenizer HuggingFace cục bộ (không gọi mạng / API).
+    Tokenizer được tải lười ở lần đếm đầu tiên; tải lỗi -> ước lượng theo số ký tự.
+    """
+
+    def __init__(self, tokenizer_name: str, cache_size: int = 4096) -> None:
+        self.tokenizer_name = tokenizer_name
+        self._tokenizer = None
+        self._loaded = False
+        self._lock = threading.Lock()
+        # lịch sử hội thoại / template lặp lại giữa các lượt -> nhớ kết quả đếm
+        self.count = lru_cache(maxsize=cache_size)(self._count)
+
+    def _load(self) -> None:
+        with self._lock:
+            if self._loaded:
+                return
+            try:
+                from transformers import AutoTokenizer
+                self._tokenizer = AutoTokenizer.from_pretrained(self.tokenizer_name)
+                logger.info(f"[TokenCounter] Loaded tokenizer {self.tokenizer_name}")
+            except Exception as e:
+                logger.warning(f"[TokenCounter] Cannot load tokenizer {self.tokenizer_name}, estimating by characters: {e}")
+            self._loaded = True
+
+    def _count(self, text: str) -> int:
+        if not text:
+            return 0
+        if not self._loaded:
+            self._load()
+        if self._tokenizer is None:
+            return max(1, len(text) // 3)
+        return len(self._tokenizer.encode(text, add_special_tokens=False))
+
+    def count_message(self, message: Dict[str, Any]) -> int:
+        return self.count(message_text(message.get("content"))) + MESSAGE_OVERHEAD_TOKENS
+
+    def count_messages(self, messages: Iterable[Dict[str, Any]]) -> int:
+        return sum(self.count_message(m) for m in messages)
+
+
+_COUNTERS: Dict[str, TokenCounter] = {}
+_COUNTERS_LOCK = threading.Lock()
+
+
+def get_token_counter(tokenizer_name: Optional[str]) -> TokenCounter:
+    """TokenCounter dùng chung theo tên tokenizer (tokenizer chỉ nạp một lần mỗi process)."""
+    name = tokenizer_name or ""
+    with _COUNTERS_LOCK:
+        counter = _COUNTERS.get(name)
+        if counter is None:
+            counter = _COUNTERS[name] = TokenCounter(name)
+        return counter
@@ -1,30 +1,201 @@
+import time
+from typing import Any, Dict, Optional
 from .nodes import RAGWorkflowNodes
 from .state import RagState
+from .utils.latency_utils import LatencyRecorder
+from .utils.logger_utils import get_logger
+from .utils.metrics_utils import SMALL_TALK_SECONDS_SAVED_TOTAL, WORKFLOW_SECONDS, record_node
 from langgraph.graph import StateGraph, END
+from langchain_core.runnables import RunnableLambda
 
-def create_rag_workflow(rag_nodes: RAGWorkflowNodes):
+logger = get_logger(__name__)
+
+# latency theo từng nhánh của workflow (blocked / general / qdrant_cache / rag / ...)
+PATH_LATENCY = LatencyRecorder()
+
+
+def _node(name: str, func, afunc) -> RunnableLambda:
+    """
+    Gói node sync + async vào một runnable:
+    - app.invoke(...)  -> dùng bản sync
+    - app.ainvoke(...) -> dùng bản async (không chặn event loop)
+    Mỗi lần chạy ghi wall time + token của node vào execution_metadata["nodes"] và histogram /metrics.
+    """
+    def run(state: RagState) -> RagState:
+        t0, tokens = time.perf_counter(), state.get("total_token", 0)
+        result = func(state)
+        record_node(result["execution_metadata"], name, time.perf_counter() - t0, result.get("total_token", 0) - tokens)
+        return result
+
+    async def arun(state: RagState) -> RagState:
+        t0, tokens = time.perf_counter(), state.get("total_token", 0)
+        result = await afunc(state)
+        record_node(result["execution_metadata"], name, time.perf_counter() - t0, result.get("total_token", 0) - tokens)
+        return result
+
+    return RunnableLambda(run, afunc=arun, name=name)
+
+
+# --- Conditional edges: rẽ nhánh theo state["current_status"] ---
+
+def _route_after_small_talk(first_node: str):
+    def route(state: RagState) -> str:
+        if state["current_status"] == "SMALL_TALK_ANSWER":
+            return END
+        return first_node
+    return route
+
+
+def _route_after_input_validation(state: RagState) -> str:
+    if state["current_status"] == "INPUT_BLOCKED":
+        return END
+    return "semantic_cache"
+
+
+def _route_after_semantic_cache(state: RagState) -> str:
+    if state["current_status"] == "SEMANTIC_CACHE_HIT":
+        return END
+    return "query_analysis"
+
+
+def _route_after_query_analysis(state: RagState) -> str:
+    status = state["current_status"]
+    if status in ["INPUT_BLOCKED", "ROUTING_ERROR", "SEMANTIC_CACHE_HIT"]:
+        return END
+    if status == "GENERAL_QUERY":
+        return "answer_generation"
+    return "document_retrieval"
+
+
+def _route_after_document_retrieval(state: RagState) -> str:
+    status = state["current_status"]
+    if status == "QDRANT_CACHE_ANSWER":
+        return "output_validation"
+    if status in ["DOCUMENTS_RETRIEVED", "GENERAL_QUERY"]:
+        return "answer_generation"
+    return END
+
+
+def _route_after_answer_generation(state: RagState) -> str:
+    if state["current_status"] == "ANSWER_GENERATED":
+        return "output_validation"
+    return END
+
+
+def classify_path(state: Dict[str, Any]) -> str:
+    """Gán nhãn nhánh mà request đã đi qua, dựa vào status cuối và processing_steps."""
+    status = state.get("current_status")
+    steps = state.get("processing_steps") or []
+    if status == "INPUT_BLOCKED":
+        return "blocked"
+    if status == "SMALL_TALK_ANSWER":
+        return "small_talk"
+    if status == "SEMANTIC_CACHE_HIT":
+        return "semantic_cache"
+    if status and status.endswith("_ERROR"):
+        return "error"
+    if "documents_retrieved" not in steps:
+        return "general"
+    if "answer_generated" not in steps:
+        return "qdrant_cache"
+    if not state.get("raw_documents"):
+        return "retrieval_empty"
+    return "rag"
+
+
+def _record_small_talk_saving(metadata: Dict[str, Any], elapsed_s: float) -> None:
     """
-    Tạo đồ thị workflow theo thứ tự:
-    input_validation -> query_analysis -> document_retrieval -> answer_generation -> output_validation -> END
-    Các node tự kiểm tra state["current_status"] để bỏ qua nếu cần.
+    Thời gian tiết kiệm ước lượng = p50 nhánh general (guardrail + định tuyến + LLM) - thời gian thực tế;
+    chưa có mẫu nhánh general -> saved_s = None.
     """
+    general_p50 = PATH_LATENCY.quantile("general", 0.5)
+    if general_p50 is None:
+        metadata.setdefault("small_talk", {})["saved_s"] = None
+        return
+    saved = max(0.0, general_p50 - elapsed_s)
+    SMALL_TALK_SECONDS_SAVED_TOTAL.inc(saved)
+    metadata.setdefault("small_talk", {})["saved_s"] = round(saved, 4)
+
+
+def record_path_latency(state: Dict[str, Any], elapsed_s: float) -> str:
+    path = classify_path(state)
+    metadata = state.setdefault("execution_metadata", {})
+    metadata["path"] = path
+    metadata["latency_s"] = round(elapsed_s, 4)
+    if path == "small_talk":
+        _record_small_talk_saving(metadata, elapsed_s)
+    PATH_LATENCY.observe(path, elapsed_s)
+    WORKFLOW_SECONDS.observe(elapsed_s, path=path)
+    logger.info(f"Workflow path={path} latency={elapsed_s:.3f}s status={state.get('current_status')}")
+    return path
+
+
+def run_workflow(app, state: RagState) -> Dict[str, Any]:
+    """app.invoke + đo latency theo nhánh."""
+    t0 = time.perf_counter()
+    result = app.invoke(state)
+    record_path_latency(result, time.perf_counter() - t0)
+    return result
+
+
+async def arun_workflow(app, state: RagState) -> Dict[str, Any]:
+    """app.ainvoke + đo latency theo nhánh."""
+    t0 = time.perf_counter()
+    result = await app.ainvoke(state)
+    record_path_latency(result, time.perf_counter() - t0)
+    return result
+
+
+def create_rag_workflow(rag_nodes: RAGWorkflowNodes, parallel_analysis: Optional[bool] = None):
+    """
+    Tạo đồ thị workflow với conditional edges theo state["current_status"]:
+    small_talk -> input_validation -> semantic_cache -> query_analysis -> document_retrieval -> answer_generation -> output_validation -> END
+      - SMALL_TALK_ANSWER    : câu trả lời mẫu, kết thúc (không gọi guardrail / LLM)
+      - INPUT_BLOCKED        : đi thẳng tới END
+      - SEMANTIC_CACHE_HIT   : trả câu trả lời đã cache, kết thúc
+      - GENERAL_QUERY        : bỏ qua document_retrieval
+      - QDRANT_CACHE_ANSWER  : bỏ qua answer_generation
+      - *_ERROR              : kết thúc sớm
+    Với parallel_analysis (mặc định theo config), hai node đầu được gộp thành input_analysis:
+    guardrail || định tuyến || embedding (+ semantic cache, truy xuất đón đầu) chạy đồng thời khi ainvoke.
+    Mỗi node có cả bản sync (invoke) và async (ainvoke).
+    """
+    if parallel_analysis is None:
+        parallel_analysis = rag_nodes.global_config.parallel_analysis
+
     graph = StateGraph(RagState)
 
-    graph.add_node("input_validation", rag_nodes.input_validation_node)
-    # thêm semactic_cache ở đây
-    
-    graph.add_node("query_analysis", rag_nodes.query_analysis_node)
-    graph.add_node("document_retrieval", rag_nodes.document_retrieval_node)
-    graph.add_node("answer_generation", rag_nodes.answer_generation_node)
-    graph.add_node("output_validation", rag_nodes.output_validation_node)
-
-    graph.set_entry_point("input_validation")
-    graph.add_edge("input_validation", "query_analysis")
-    graph.add_edge("query_analysis", "document_retrieval")
-    graph.add_edge("document_retrieval", "answer_generation")
-    graph.add_edge("answer_generation", "output_validation")
+    graph.add_node("small_talk", _node("small_talk", rag_nodes.small_talk_node, rag_nodes.asmall_talk_node))
+    if parallel_analysis:
+        graph.add_node("input_analysis", _node("input_analysis", rag_nodes.input_analysis_node, rag_nodes.ainput_analysis_node))
+    else:
+        graph.add_node("input_validation", _node("input_validation", rag_nodes.input_validation_node, rag_nodes.ainput_validation_node))
+        graph.add_node("semantic_cache", _node("semantic_cache", rag_nodes.semantic_cache_node, rag_nodes.asemantic_cache_node))
+        graph.add_node("query_analysis", _node("query_analysis", rag_nodes.query_analysis_node, rag_nodes.aquery_analysis_node))
+    graph.add_node("document_retrieval", _node("document_retrieval", rag_nodes.document_retrieval_node, rag_nodes.adocument_retrieval_node))
+    graph.add_node("answer_generation", _node("answer_generation", rag_nodes.answer_generation_node, rag_nodes.aanswer_generation_node))
+    graph.add_node("output_validation", _node("output_validation", rag_nodes.output_validation_node, rag_nodes.aoutput_validation_node))
+
+    graph.set_entry_point("small_talk")
+    first_node = "input_analysis" if parallel_analysis else "input_validation"
+    graph.add_conditional_edges("small_talk", _route_after_small_talk(first_node), [first_node, END])
+    if parallel_analysis:
+        graph.add_conditional_edges(
+            "input_analysis", _route_after_query_analysis,
+            ["document_retrieval", "answer_generation", END],
+        )
+    else:
+        graph.add_conditional_edges("input_validation", _route_after_input_validation, ["semantic_cache", END])
+        graph.add_conditional_edges("semantic_cache", _route_after_semantic_cache, ["query_analysis", END])
+        graph.add_conditional_edges(
+            "query_analysis", _route_after_query_analysis,
+            ["document_retrieval", "answer_generation", END],
+        )
+    graph.add_conditional_edges(
+        "document_retrieval", _route_after_document_retrieval,
+        ["answer_generation", "output_validation", END],
+    )
+    graph.add_conditional_edges("answer_generation", _route_after_answer_generation, ["output_validation", END])
     graph.add_edge("output_validation", END)
 
     return graph.compile()
-
-
@@ -1,14 +1,19 @@
 from typing import List, Optional
 from datetime import datetime
+import time
 import uuid
 import os
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 
 # from src.langgraph_rag.utils.llm_utils import TextChatMessage
 from src.langgraph_rag.utils.config_utils import BaseConfig
 from src.langgraph_rag.nodes import RAGWorkflowNodes, create_default_rag_state
-from src.langgraph_rag.workflows import create_rag_workflow
+from src.langgraph_rag.workflows import create_rag_workflow, arun_workflow, record_path_latency, PATH_LATENCY
+from src.langgraph_rag.utils.llm_utils import DocumentProcessor
+from src.langgraph_rag.utils.stream_utils import DeltaCoalescer, sse_event
+from src.langgraph_rag.utils.singleflight_utils import SingleFlight, flight_key
+from src.langgraph_rag.utils.resilience_utils import resilience_stats
 # Langfuse tracking removed
 
 from fastapi.responses import StreamingResponse
@@ -21,6 +26,11 @@ router = APIRouter(prefix="/chat", tags=["LangGraph Chat"])  # noqa: E305
 _GLOBAL_CONFIG = BaseConfig()
 _NODES = RAGWorkflowNodes(global_config=_GLOBAL_CONFIG)
 _WORKFLOW = create_rag_workflow(rag_nodes=_NODES)
+# gộp các câu hỏi giống hệt nhau đang chạy đồng thời (vd: thủ tục đang "hot")
+_FLIGHTS = SingleFlight(
+    wait_timeout_s=_GLOBAL_CONFIG.singleflight_wait_seconds,
+    enabled=_GLOBAL_CONFIG.singleflight_enabled,
+)
 
 
 # --- Schemas ---
@@ -28,32 +38,57 @@ class ChatRequest(BaseModel):
     question: str
     session_id: Optional[str] = None
     # Giữ đúng kiểu lịch sử hội thoại: List[TextChatMessage]
+    # Không bắt buộc: nếu bỏ trống, lịch sử được lấy từ session store theo session_id
     messages: Optional[List[dict]] = None
 
 
+class BatchChatRequest(BaseModel):
+    questions: List[str]
+    # số lời gọi guardrail / định tuyến / LLM đồng thời (mặc định theo config)
+    concurrency: Optional[int] = None
+
+
 class ChatResponse(BaseModel):
     answer: str
     session_id: str
     timestamp: str
 
 
+def _resolve_history(session_id: str, messages: Optional[List[dict]]) -> List[dict]:
+    """Client gửi messages -> dùng luôn (tương thích cũ); ngược lại lấy lịch sử phía server."""
+    if messages:
+        return list(messages)
+    return _NODES.session_store.get(session_id)
+
+
 # --- Endpoint ---
 @router.post("/", response_model=ChatResponse)
 async def langgraph_chat(request: ChatRequest) -> ChatResponse:
     """Nhận câu hỏi + lịch sử hội thoại, chạy workflow và trả lời gọn nhẹ."""
     session_id = request.session_id or str(uuid.uuid4())
     
+    history = _resolve_history(session_id, request.messages)
     initial_state = create_default_rag_state(
         question=request.question,
-        conversation_history=request.messages or [],
+        conversation_history=history,
+        session_id=session_id,
     )
+    key = flight_key(request.question, history)
 
 
 
     # result = _WORKFLOW.invoke(initial_state)
     # answer = result.get("final_response") or "Không có câu trả lời phù hợp."
 
-    result = _WORKFLOW.invoke(initial_state)
+    # ainvoke: các node async chạy guardrail / LLM / embedding / rerank ngoài event loop
+    result, shared = await _FLIGHTS.run(
+        key,
+        lambda: arun_workflow(_WORKFLOW, initial_state),
+    )
+    result.setdefault("execution_metadata", {})["coalesced"] = shared
+    if shared:
+        # kết quả lấy từ leader (session khác) -> ghi lượt hội thoại cho session của request này
+        _NODES.session_store.save(session_id, result.get("conversation_history") or [])
     answer = result.get("final_response") or "Không có câu trả lời phù hợp."
 
     return ChatResponse(
@@ -64,68 +99,137 @@ async def langgraph_chat(request: ChatRequest) -> ChatResponse:
     )
 
 
-@router.post("/stream")
-async def langgraph_chat_stream(request: ChatRequest):
+@router.get("/latency")
+async def langgraph_chat_latency():
+    """Latency theo từng nhánh workflow (blocked / general / qdrant_cache / rag / ...)."""
+    return {
+        **PATH_LATENCY.summary(),
+        "singleflight": dict(_FLIGHTS.stats),
+        "conversation_memory": _NODES.conversation_memory.stats(),
+        "resilience": resilience_stats(),
+        "llm_cache": {
+            "query_route": _NODES.query_route.bedrock_llm.cache.stats(),
+            "generate_answer": _NODES.generate_answer.bedrock_llm.cache.stats(),
+        },
+        "embedding_cache": _NODES.embedding.cache.stats() if _NODES.embedding.cache is not None else None,
+        "embedding_batcher": _NODES.embedding.batcher.stats() if _NODES.embedding.batcher is not None else None,
+    }
+
+
+@router.delete("/history/{session_id}")
+async def langgraph_chat_clear_session(session_id: str):
+    """Xoá lịch sử hội thoại phía server của một session."""
+    _NODES.session_store.clear(session_id)
+    return {"session_id": session_id, "cleared": True}
+
+
+@router.post("/batch")
+async def langgraph_chat_batch(request: BatchChatRequest):
     """
-    Streaming chat endpoint sử dụng LangGraph workflow
-    (KHÔNG còn Langfuse).
+    Xử lý hàng loạt câu hỏi độc lập (job chạy đêm).
+    Embedding / Qdrant / rerank được gộp batch, LLM chạy đồng thời có giới hạn.
+    Kết quả trả về dạng NDJSON, mỗi dòng một câu hỏi, theo thứ tự hoàn thành.
     """
-    try:
-        session_id = request.session_id or str(uuid.uuid4())
-        messages = request.messages or []
-        question = request.question
-
-        initial_state = create_default_rag_state(
-            question=question,
-            conversation_history=messages,
+    if len(request.questions) > _GLOBAL_CONFIG.batch_max_questions:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Tối đa {_GLOBAL_CONFIG.batch_max_questions} câu hỏi mỗi request",
         )
 
-        # Chỉ invoke workflow
-        result = await _WORKFLOW.ainvoke(initial_state)
-        answer = result.get("final_response", "Xin lỗi, không thể tạo prompt.")
-
-        # Stream SSE chunk-by-chunk
-        async def fallback_stream() -> AsyncGenerator[str, None]:
-            sent_chars = 0
-            try:
-                for char in answer:
-                    payload = {"type": "chunk", "content": char}
-                    yield f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
-                    sent_chars += 1
-                # kết thúc stream
-                yield f"data: {json.dumps({'type': 'done'}, ensure_ascii=False)}\n\n"
-                yield "event: end\ndata: {}\n\n"
-            except Exception as stream_err:
-                payload = {"type": "error", "content": f"Stream lỗi: {stream_err}"}
-                yield f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
-                yield "event: end\ndata: {}\n\n"
-
-        return StreamingResponse(
-            fallback_stream(),
-            media_type="text/event-stream",
-            headers={
-                "Cache-Control": "no-cache",
-                "Connection": "keep-alive",
-                "X-Accel-Buffering": "no",
-            },
-        )
+    async def ndjson_stream() -> AsyncGenerator[str, None]:
+        async for index, state in _NODES.abatch_answer(request.questions, concurrency=request.concurrency):
+            yield json.dumps({
+                "index": index,
+                "question": state["question"],
+                "answer": state.get("final_response") or "Không có câu trả lời phù hợp.",
+                "status": state.get("current_status"),
+                "total_token": state.get("total_token", 0),
+                "sources": DocumentProcessor.extract_sources(state.get("raw_documents") or []),
+            }, ensure_ascii=False) + "\n"
 
-    except Exception as e:
+    return StreamingResponse(ndjson_stream(), media_type="application/x-ndjson")
 
-        # chuẩn bị message trước để tránh lỗi scope
-        err_msg = f"Đã xảy ra lỗi: {e}"
 
-        async def error_stream():
-            payload = {"type": "error", "content": err_msg}
-            yield f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+@router.post("/stream")
+async def langgraph_chat_stream(request: ChatRequest):
+    """
+    Streaming chat endpoint sử dụng LangGraph workflow.
+    - Delta token từ answer_generation được stream thật (stream_mode="custom"),
+      gom theo từ/câu trước khi gửi để giảm overhead mỗi frame.
+    - Frame cuối {"type": "done"} mang status, số token và nguồn trích dẫn.
+    """
+    session_id = request.session_id or str(uuid.uuid4())
+    question = request.question
+    history = _resolve_history(session_id, request.messages)
+
+    initial_state = create_default_rag_state(
+        question=question,
+        conversation_history=history,
+        session_id=session_id,
+    )
+    key = flight_key(question, history)
+
+    async def event_stream() -> AsyncGenerator[str, None]:
+        coalescer = DeltaCoalescer()
+        streamed = False
+        shared = False
+        final_state = initial_state
+        t0 = time.perf_counter()
+        try:
+            events = _FLIGHTS.stream(
+                key,
+                lambda: _WORKFLOW.astream(initial_state, stream_mode=["custom", "values"]),
+            )
+            async for (mode, chunk), shared in events:
+                if mode == "values":
+                    final_state = chunk
+                elif isinstance(chunk, dict) and chunk.get("type") == "delta":
+                    for frame in coalescer.push(chunk.get("content", "")):
+                        streamed = True
+                        yield sse_event({"type": "chunk", "content": frame})
+
+            for frame in coalescer.flush():
+                streamed = True
+                yield sse_event({"type": "chunk", "content": frame})
+            if shared:
+                final_state.setdefault("execution_metadata", {})["coalesced"] = True
+                _NODES.session_store.save(session_id, final_state.get("conversation_history") or [])
+            else:
+                record_path_latency(final_state, time.perf_counter() - t0)
+
+            answer = final_state.get("final_response") or "Xin lỗi, không thể tạo câu trả lời."
+            status = final_state.get("current_status")
+            if not streamed:
+                # Nhánh không sinh bằng LLM (bị chặn, cache Qdrant, lỗi): gửi nguyên câu trả lời theo câu
+                replay = DeltaCoalescer()
+                for frame in replay.push(answer) + replay.flush():
+                    yield sse_event({"type": "chunk", "content": frame})
+            elif status == "OUTPUT_BLOCKED" or answer != final_state.get("generated_answer"):
+                # Đã stream bản nháp nhưng guardrail đầu ra thay thế -> client thay toàn bộ nội dung
+                yield sse_event({"type": "replace", "content": answer})
+
+            usage = final_state.get("execution_metadata", {}).get("llm_usage", {})
+            yield sse_event({
+                "type": "done",
+                "session_id": session_id,
+                "status": status,
+                "total_token": final_state.get("total_token", 0),
+                "prompt_tokens": usage.get("prompt_tokens"),
+                "completion_tokens": usage.get("completion_tokens"),
+                "sources": DocumentProcessor.extract_sources(final_state.get("raw_documents") or []),
+                "timestamp": datetime.now().isoformat(),
+            })
+            yield "event: end\ndata: {}\n\n"
+        except Exception as stream_err:
+            yield sse_event({"type": "error", "content": f"Đã xảy ra lỗi: {stream_err}"})
             yield "event: end\ndata: {}\n\n"
 
-        return StreamingResponse(
-            error_stream(),
-            media_type="text/event-stream",
-            headers={
-                "Cache-Control": "no-cache",
-                "Connection": "keep-alive",
-                "X-Accel-Buffering": "no",
-            },
-        )
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no",
+        },
+    )
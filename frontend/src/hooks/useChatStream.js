@@ -1,10 +1,19 @@
-import { useState, useEffect, useCallback } from 'react';
+import { useState, useEffect, useCallback, useRef } from 'react';
 
 export default function useChatStream(sessionId, confirmDialog = window.confirm) {
   const [messages, setMessages] = useState([]);
   const [inputMessage, setInputMessage] = useState('');
   const [isLoading, setIsLoading] = useState(false);
   const [showSources, setShowSources] = useState({});
+  // audio TTS đang phát: dừng khi guardrail đầu ra thay câu trả lời hoặc khi gửi câu mới
+  const audioRef = useRef(null);
+
+  const stopSpeaking = useCallback(() => {
+    if (audioRef.current) {
+      audioRef.current.pause();
+      audioRef.current = null;
+    }
+  }, []);
 
   const loadChatHistory = useCallback(async () => {
     if (!sessionId) return;
@@ -75,6 +84,7 @@ export default function useChatStream(sessionId, confirmDialog = window.confirm)
     };
     setMessages(prev => [...prev, userMessage]);
     setInputMessage('');
+    stopSpeaking();
     setIsLoading(true);
     const botMessageId = Date.now() + 1;
     // Xóa hết message bot cũ trước khi tạo mới
@@ -95,25 +105,27 @@ export default function useChatStream(sessionId, confirmDialog = window.confirm)
           const blob = await res.blob();
           const url = URL.createObjectURL(blob);
           const audio = new Audio(url);
+          stopSpeaking();
+          audioRef.current = audio;
           await audio.play();
         } catch (e) {
           console.warn('TTS playback error:', e);
         }
       };
 
+      const updateBotMessage = (changes) => {
+        setMessages(prev => prev.map(msg =>
+          msg.id === botMessageId ? { ...msg, ...changes } : msg
+        ));
+      };
+
       const response = await fetch(`/chat/stream`, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json; charset=utf-8', 'Accept-Charset': 'utf-8' },
+        // lịch sử hội thoại được lưu phía server theo session_id
         body: JSON.stringify({
           question: inputMessage,
-          session_id: sessionId,
-          messages: [
-            ...messages.map(m => ({
-              role: m.type === 'user' ? 'user' : 'assistant',
-              content: m.content
-            })),
-            { role: 'user', content: inputMessage }
-          ]
+          session_id: sessionId
         })
       });
       
@@ -124,6 +136,7 @@ export default function useChatStream(sessionId, confirmDialog = window.confirm)
       const reader = response.body.getReader();
       const decoder = new TextDecoder();
       let result = '';
+      let failed = false;
       let done = false;
       let buffer = '';
       while (!done) {
@@ -140,32 +153,19 @@ export default function useChatStream(sessionId, confirmDialog = window.confirm)
               try {
                 const obj = JSON.parse(jsonStr); // PHẢI parse JSON!
                 if (obj.type === 'chunk' && obj.content) {
-                  const newResult = result + obj.content;
-                  result = newResult;
-                  setMessages(prev => {
-                    const idx = prev.findIndex(msg => msg.id === botMessageId);
-                    if (idx !== -1) {
-                      const updated = [...prev];
-                      updated[idx] = { ...updated[idx], content: newResult };
-                      return updated;
-                    } else {
-                      return prev;
-                    }
-                  });
-                }
-                if (obj.type === 'sources') {
-                  setMessages(prev => {
-                    const newMessages = [...prev];
-                    // Tìm message bot cuối cùng và gán sources
-                    for (let i = newMessages.length - 1; i >= 0; i--) {
-                      if (newMessages[i].type === 'bot') {
-                        newMessages[i].sources = obj.sources;
-                        break;
-                      }
-                    }
-                    return newMessages;
-                  });
-                  return;
+                  result += obj.content;
+                  updateBotMessage({ content: result });
+                } else if (obj.type === 'replace') {
+                  // guardrail đầu ra từ chối bản nháp đã stream -> thay toàn bộ nội dung, không đọc bản nháp
+                  stopSpeaking();
+                  result = obj.content || '';
+                  updateBotMessage({ content: result });
+                } else if (obj.type === 'done' || obj.type === 'sources') {
+                  updateBotMessage({ sources: obj.sources || [] });
+                } else if (obj.type === 'error') {
+                  failed = true;
+                  stopSpeaking();
+                  updateBotMessage({ content: obj.content || 'Xin lỗi, có lỗi xảy ra. Vui lòng thử lại.', type: 'error' });
                 }
               } catch (e) {
                 // Bỏ qua lỗi parse
@@ -174,31 +174,9 @@ export default function useChatStream(sessionId, confirmDialog = window.confirm)
           }
         }
       }
-      // After stream completes, speak the final accumulated result
-      try {
-        const finalText = (result || '').trim();
-        console.log('Final text for TTS:', finalText);
-        if (finalText) {
-          console.log('Attempting TTS...');
-          const res = await fetch('/voice/tts', {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ text: finalText })
-          });
-          console.log('TTS response status:', res.status);
-          if (res.ok) {
-            const blob = await res.blob();
-            const url = URL.createObjectURL(blob);
-            const audio = new Audio(url);
-            console.log('Playing TTS audio...');
-            await audio.play();
-            console.log('TTS audio played successfully');
-          } else {
-            console.error('TTS failed with status:', res.status);
-          }
-        }
-      } catch (e) {
-        console.error('TTS error:', e);
+      // Đọc câu trả lời cuối cùng (sau replace nếu có) khi stream đã kết thúc
+      if (!failed) {
+        await speak(result);
       }
     } catch (error) {
       console.error('Error in chat stream:', error);
@@ -211,27 +189,6 @@ export default function useChatStream(sessionId, confirmDialog = window.confirm)
       ));
     } finally {
       setIsLoading(false);
-      // Attempt TTS of the last bot message
-      try {
-        const lastBot = [...messages].reverse().find(m => m.type === 'bot');
-        const content = lastBot?.content || '';
-        if (content && content.trim()) {
-          await (async () => {
-            try {
-              const res = await fetch('/voice/tts', {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ text: content })
-              });
-              if (!res.ok) return;
-              const blob = await res.blob();
-              const url = URL.createObjectURL(blob);
-              const audio = new Audio(url);
-              await audio.play();
-            } catch (_) {}
-          })();
-        }
-      } catch (_) {}
     }
   };
 